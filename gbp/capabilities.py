@@ -0,0 +1,152 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Cache the results of probing external tools for features"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import gbp.log
+from gbp.paths import user_cache_dir
+
+
+class CapabilityCache(object):
+    """
+    Results of probing external tools (like parsing their help output)
+
+    Results are keyed by the tool's resolved path and the mtime and size
+    of its binary so they're dropped once the tool gets upgraded. They're
+    kept in memory for the process and persisted in the user's cache
+    directory so later invocations don't need to probe again.
+    """
+    filename = 'capabilities.json'
+
+    def __init__(self, path=None):
+        """
+        @param path: file to persist the probe results in, defaults to
+            I{capabilities.json} in L{gbp.paths.user_cache_dir}
+        @type path: C{str}
+        """
+        self._path = path
+        self._entries = None
+        self._stamps = {}
+
+    @property
+    def path(self):
+        return self._path or os.path.join(user_cache_dir(), self.filename)
+
+    def _stamp(self, tool):
+        """
+        Resolve tool to its binary
+
+        @return: the binary's path and its mtime and size or C{None} if the
+            tool can't be found
+        """
+        key = (tool, os.getenv('PATH'))
+        if key not in self._stamps:
+            stamp = None
+            binary = shutil.which(tool)
+            if binary:
+                binary = os.path.realpath(binary)
+                try:
+                    st = os.stat(binary)
+                    stamp = (binary, [st.st_mtime_ns, st.st_size])
+                except OSError:
+                    pass
+            self._stamps[key] = stamp
+        return self._stamps[key]
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path) as f:
+                    entries = json.load(f)
+                if isinstance(entries, dict):
+                    self._entries = entries
+            except (OSError, ValueError) as err:
+                gbp.log.debug("Can't read capability cache '%s': %s" % (self.path, err))
+        return self._entries
+
+    def _save(self):
+        path = self.path
+        cache_dir = os.path.dirname(path)
+        try:
+            # Only create our own directory, not e.g. a missing $HOME
+            if not os.path.isdir(cache_dir):
+                os.mkdir(cache_dir)
+            fd, tmp = tempfile.mkstemp(prefix=self.filename, dir=cache_dir)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._entries, f, indent=1, sort_keys=True)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as err:
+            gbp.log.debug("Can't write capability cache '%s': %s" % (path, err))
+
+    def lookup(self, tool, probe, compute):
+        """
+        Look up the result of a probe, running it if not cached yet
+
+        @param tool: name of the probed tool as looked up in I{$PATH}
+        @type tool: C{str}
+        @param probe: name of the probe
+        @type probe: C{str}
+        @param compute: function running the probe, its result must be
+            JSON serializable. Exceptions are passed on and nothing
+            is cached.
+        @type compute: C{callable}
+        @return: the probe's result
+        """
+        stamp = self._stamp(tool)
+        if stamp is None:
+            return compute()
+
+        binary, version = stamp
+        entries = self._load()
+        entry = entries.get(binary)
+        if not entry or entry.get('stamp') != version:
+            entry = entries[binary] = {'stamp': version, 'probes': {}}
+        probes = entry['probes']
+        if probe not in probes:
+            probes[probe] = compute()
+            self._save()
+        return probes[probe]
+
+    def clear(self):
+        """
+        Forget all probe results in memory and on disk
+        """
+        self._entries = {}
+        self._stamps = {}
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+_cache = CapabilityCache()
+
+
+def lookup(tool, probe, compute):
+    """
+    Look up a probe result in the default L{CapabilityCache}
+    """
+    return _cache.lookup(tool, probe, compute)
@@ -27,6 +27,7 @@ from contextlib import contextmanager
 from tempfile import TemporaryFile
 
 import gbp.log as log
+import gbp.profile
 
 
 class CommandExecFailed(Exception):
@@ -138,6 +139,7 @@ class Command(object):
             stdout_arg = subprocess.PIPE if self.capture_stdout else stdout
             stderr_arg = subprocess.PIPE if self.capture_stderr else stderr
 
+            started = gbp.profile.start()
             try:
                 popen = subprocess.Popen(cmd,
                                          cwd=self.cwd,
@@ -147,6 +149,8 @@ class Command(object):
                                          stdout=stdout_arg,
                                          stderr=stderr_arg)
                 (self.stdout, self.stderr) = popen.communicate()
+                gbp.profile.stop(started, cmd, popen.returncode,
+                                 bytes_out=len(self.stdout) if self.stdout else 0)
                 if self.stdout is not None:
                     self.stdout = self.stdout.decode()
                 if self.stderr is not None:
@@ -123,6 +123,7 @@ class GbpOptionParser(OptionParser):
                 'component': [],
                 'compression': 'auto',
                 'compression-level': '',
+                'compression-threads': '1',
                 'create-missing-branches': 'False',
                 'customizations': '',
                 'dch-opt': [],
@@ -134,6 +135,7 @@ class GbpOptionParser(OptionParser):
                 'drop': 'False',
                 'export': 'HEAD',
                 'export-dir': '',
+                'export-incremental': 'False',
                 'filter': [],
                 'filter-pristine-tar': 'False',
                 'force-create': 'False',
@@ -146,8 +148,11 @@ class GbpOptionParser(OptionParser):
                 'ignore-branch': 'False',
                 'ignore-new': 'False',
                 'ignore-regex': '',
+                'import-in-index': 'False',
                 'import-msg': 'New upstream version %(version)s',
+                'incremental': 'False',
                 'interactive': 'True',
+                'jobs': '1',
                 'keyid': '',
                 'merge': 'True',
                 'merge-mode': 'auto',
@@ -158,7 +163,11 @@ class GbpOptionParser(OptionParser):
                 'multimaint-merge': 'True',
                 'no-create-orig': 'False',
                 'notify': 'auto',
+                'orig-cache': 'False',
+                'orig-cache-size': '1024',
                 'overlay': 'False',
+                'overlay-cache': 'False',
+                'overlay-cache-size': '4096',
                 'patch-num-format': '%04d-',
                 'patch-numbers': 'True',
                 'pbuilder': 'False',
@@ -193,6 +202,7 @@ class GbpOptionParser(OptionParser):
                 'upstream-signatures': 'auto',
                 'template-dir': '',
                 'time-machine': 1,
+                'time-machine-search': 'linear',
                 'track': 'True',
                 'track-missing': 'False',
                 'upstream-branch': 'upstream',
@@ -241,6 +251,15 @@ class GbpOptionParser(OptionParser):
         'pristine-tar':
             "Use pristine-tar to create orig tarball, "
             "default is '%(pristine-tar)s'",
+        'jobs':
+            "Number of orig tarballs to create or verify in parallel, "
+            "0 uses all CPUs, default is '%(jobs)s'",
+        'orig-cache':
+            "Reuse orig tarballs generated from the same tree before, "
+            "default is '%(orig-cache)s'",
+        'orig-cache-size':
+            "Maximum size of the orig tarball cache in MiB, "
+            "default is '%(orig-cache-size)s'",
         'pristine-tar-commit':
             "When generating a tarball, commit it to the pristine-tar branch '%(pristine-tar-commit)s' "
             "default is '%(pristine-tar-commit)s'",
@@ -266,6 +285,15 @@ class GbpOptionParser(OptionParser):
         'overlay':
             "extract orig tarball when using export-dir option, "
             "default is '%(overlay)s'",
+        'overlay-cache':
+            "reuse the trees orig tarballs got unpacked to in overlay mode, "
+            "default is '%(overlay-cache)s'",
+        'overlay-cache-size':
+            "maximum size of the unpacked orig tarball cache in MiB, "
+            "default is '%(overlay-cache-size)s'",
+        'export-incremental':
+            "only write what changed since the last export to export-dir, "
+            "default is '%(export-incremental)s'",
         'remote-url-pattern':
             "Remote url pattern to create the repo at, "
             "default is '%(remote-url-pattern)s'",
@@ -349,6 +377,9 @@ class GbpOptionParser(OptionParser):
             "don't try to apply patch queue to head commit only. "
             "Try at most TIME_MACHINE commits back, "
             "default is '%(time-machine)d'",
+        'time-machine-search':
+            "how to search for the commit the patch queue applies to, "
+            "'linear' or 'bisect', default is '%(time-machine-search)s'",
         'pbuilder-autoconf':
             "Whether to configure pbuilder automatically, "
             "default is '%(pbuilder-autoconf)s'",
@@ -377,6 +408,13 @@ class GbpOptionParser(OptionParser):
             "abbreviate commits to this length. default is '%(abbrev)s'",
         'commit':
             "commit changes after export, Default is '%(commit)s'",
+        'incremental':
+            "In case of 'export' only write patches that changed since the "
+            "last export. Default is '%(incremental)s'",
+        'import-in-index':
+            "In case of 'import' apply the patches to a temporary index and "
+            "check out the patch-queue branch only at the end. "
+            "Default is '%(import-in-index)s'",
         'rollback':
             "Rollback repository changes when encountering an error",
         'component':
@@ -46,14 +46,22 @@ class DebianGitRepository(PkgGitRepository):
         Drop the given top level dirs from the given git tree
         returning a new tree object.
         """
-        objs = self.list_tree(tree)
-        new_tree_objs = []
         dirs = [to_bin(d) for d in dirs]
+        sha1 = self._resolve_tree(tree)
+        key = ('drop', sha1, tuple(sorted(dirs)))
+        if sha1:
+            new_tree = self._tree_cache_get(key)
+            if new_tree:
+                return new_tree
 
+        objs = self.list_tree(tree)
+        new_tree_objs = []
         for m, t, s, n in objs:
             if not (n in dirs and t == 'tree'):
                 new_tree_objs.append((m, t, s, n))
         new_tree = self.make_tree(new_tree_objs)
+        if sha1:
+            self._tree_cache_put(key, new_tree)
         return new_tree
 
     def tree_get_dir(self, tree: str, dir: str):
@@ -91,16 +99,19 @@ class DebianGitRepository(PkgGitRepository):
             # dereference to a commit object
             return self.rev_parse("%s^0" % tag)
         elif self.has_tag(legacy_tag):
-            out, ret = self._git_getoutput('cat-file', args=['-p', legacy_tag])
-            if ret:
+            out = self._git_iter_lines('cat-file', args=['-p', legacy_tag])
+            try:
+                for line in out:
+                    line = line.decode()
+                    if line.endswith(" %s" % version):
+                        # dereference to a commit object
+                        return self.rev_parse("%s^0" % legacy_tag)
+                    elif line.startswith('---'):  # GPG signature start
+                        return None
+            except GitRepositoryError:
                 return None
-            for line in out:
-                line = line.decode()
-                if line.endswith(" %s\n" % version):
-                    # dereference to a commit object
-                    return self.rev_parse("%s^0" % legacy_tag)
-                elif line.startswith('---'):  # GPG signature start
-                    return None
+            finally:
+                out.close()
         return None
 
     def debian_version_from_upstream(self,
@@ -393,8 +404,9 @@ class DebianGitRepository(PkgGitRepository):
             raise GitRepositoryError("Cannot find requested upstream signature for archive '%s' in pristine tar commit." % output)
         try:
             signature = False if upstream_signatures.is_off() else found_signature
-            self.pristine_tar.checkout(source.name, source.upstream_version, comp.type, output_dir,
-                                       component=component, quiet=True, signature=signature)
+            # Tarballs might be created in parallel
+            self.pristine_tar.fork().checkout(source.name, source.upstream_version, comp.type, output_dir,
+                                              component=component, quiet=True, signature=signature)
         except Exception as e:
             raise GitRepositoryError("Error creating %s%s: %s" % (output,
                                                                   " with attached signature file" if signature else "",
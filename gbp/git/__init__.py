@@ -25,6 +25,8 @@ from gbp.git.errors import GitError        # noqa: F401
 from gbp.git.repository import (           # noqa: F401
     GitRepository, GitRepositoryError)
 from gbp.git.fastimport import FastImport  # noqa: F401
+from gbp.git.catfile import CatFile        # noqa: F401
+from gbp.git.asyncrepository import AsyncGitRepository  # noqa: F401
 from gbp.git.args import GitArgs           # noqa: F401
 from gbp.git.vfs import GitVfs             # noqa: F401
 
@@ -0,0 +1,250 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Query git repositories from asyncio code"""
+
+import asyncio
+import os
+import sys
+import weakref
+
+import gbp.log as log
+import gbp.profile
+from gbp.git.args import GitArgs
+from gbp.git.repository import GitRepository, GitRepositoryError
+
+
+class AsyncGitRepository(object):
+    """
+    Read only queries on a git repository as coroutines so many
+    repositories can be queried concurrently from a single thread::
+
+        repos = await asyncio.gather(*[AsyncGitRepository.open(path) for path in paths])
+        states = await asyncio.gather(*[repo.is_clean() for repo in repos])
+
+    The methods mirror the ones of L{GitRepository}.
+
+    @cvar max_processes: Maximum number of git processes run concurrently
+        by all instances in the same event loop
+    """
+    max_processes = 32
+    _semaphores = weakref.WeakKeyDictionary()
+
+    def __init__(self, path, bare=False):
+        """
+        Use L{open} to create instances for arbitrary paths.
+
+        @param path: path to the toplevel of the git repository
+        @param bare: whether this is a bare repository
+        """
+        self._path = os.path.abspath(path)
+        self._bare = bare
+
+    @classmethod
+    async def open(cls, path, toplevel=True):
+        """
+        @param path: path to git repo (or subdir)
+        @param toplevel: whether path points to the toplevel dir of
+            git repository
+        @return: the repository
+        @rtype: L{AsyncGitRepository}
+        """
+        try:
+            out, err, ret = await cls._run(['git', 'rev-parse', '--is-bare-repository', '--show-cdup'],
+                                           cwd=path)
+        except OSError:
+            raise GitRepositoryError("No Git repository at '%s'" % path)
+        if ret:
+            raise GitRepositoryError("No Git repository at '%s': '%s'" % (path, err.decode().strip()))
+        lines = out.decode(sys.getfilesystemencoding()).splitlines()
+        bare = lines[0].strip() == 'true'
+        cdup = lines[1].strip() if len(lines) > 1 else ''
+        if toplevel and cdup:
+            raise GitRepositoryError("Not the toplevel of a Git repository at '%s': '%s'" % (path, cdup))
+        return cls(os.path.join(path, cdup or '.'), bare=bare)
+
+    @property
+    def path(self):
+        """The absolute path to the repository"""
+        return self._path
+
+    @property
+    def bare(self):
+        """Whether this is a bare repository"""
+        return self._bare
+
+    @classmethod
+    def _limiter(cls):
+        loop = asyncio.get_running_loop()
+        semaphore = cls._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = cls._semaphores[loop] = asyncio.Semaphore(cls.max_processes)
+        return semaphore
+
+    @classmethod
+    async def _run(cls, cmd, cwd, input=None, extra_env=None):
+        env = None
+        if extra_env is not None:
+            env = os.environ.copy()
+            env.update(extra_env)
+
+        log.debug(cmd)
+        async with cls._limiter():
+            GitRepository._count_spawn()
+            started = gbp.profile.start()
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                cwd=cwd)
+            stdout, stderr = await proc.communicate(input)
+            gbp.profile.stop(started, cmd, proc.returncode,
+                             bytes_in=len(input) if input else 0,
+                             bytes_out=len(stdout))
+        return stdout, stderr, proc.returncode
+
+    async def _git_inout(self, command, args, input=None, extra_env=None):
+        """
+        Run a git command
+
+        @return: stdout, stderr, return code
+        @rtype: C{tuple} of C{bytestr}, C{bytestr}, C{int}
+        """
+        return await self._run(['git', command] + args, self.path, input, extra_env)
+
+    async def rev_parse(self, name, short=0):
+        """
+        Find the SHA1 of a given name, see L{GitRepository.rev_parse}
+        """
+        args = GitArgs("--quiet", "--verify")
+        args.add_cond(short, '--short=%d' % short)
+        args.add(name)
+        sha, dummy, ret = await self._git_inout('rev-parse', args.args)
+        if ret:
+            raise GitRepositoryError("revision '%s' not found" % name)
+        return GitRepository.strip_sha1(sha.decode(), short)
+
+    async def get_commits(self, since=None, until=None, paths=None, num=0,
+                          first_parent=False, options=None):
+        """
+        Get commits from since to until touching paths, see
+        L{GitRepository.get_commits}
+        """
+        args = GitArgs('--pretty=format:%H', '--no-show-signature')
+        args.add(GitRepository._commit_range_args(since, until, paths, num,
+                                                  first_parent, options))
+        commits, dummy, ret = await self._git_inout('log', args.args)
+        if ret:
+            where = " on %s" % paths if paths else ""
+            raise GitRepositoryError("Error getting commits %s..%s%s" %
+                                     (since, until, where))
+        return [commit.strip() for commit in commits.decode().splitlines()]
+
+    async def list_tree(self, treeish, recurse=False, paths=None, sizes=False):
+        """
+        Get a trees content, see L{GitRepository.list_tree}
+
+        @rtype: C{list} of C{tuple}s
+        """
+        args = GitArgs('-z')
+        args.add_true(recurse, '-r')
+        args.add_true(sizes, '-l')
+        args.add(treeish)
+        args.add("--")
+        args.add_cond(paths, paths)
+
+        out, err, ret = await self._git_inout('ls-tree', args.args)
+        if ret:
+            raise GitRepositoryError("Failed to ls-tree '%s': '%s'" % (treeish, err.decode().strip()))
+        return list(GitRepository._parse_ls_tree(out, sizes))
+
+    async def show(self, id):
+        """
+        Show a git object, see L{GitRepository.show}
+
+        @rtype: C{bytestr}
+        """
+        obj, stderr, ret = await self._git_inout('show', ["--pretty=medium", id])
+        if ret:
+            raise GitRepositoryError("can't get %s: %s" % (id, stderr.decode().rstrip()))
+        return obj
+
+    async def get_tags(self, pattern=None):
+        """
+        List tags, see L{GitRepository.get_tags}
+        """
+        args = GitArgs('-l')
+        args.add_cond(pattern, pattern)
+        out, err, ret = await self._git_inout('tag', args.args)
+        if ret:
+            raise GitRepositoryError("Failed to list tags: %s" % err.decode().strip())
+        return out.decode().splitlines()
+
+    async def describe(self, commitish, pattern=None, longfmt=False, always=False,
+                       abbrev=None, tags=False, exact_match=False):
+        """
+        Describe commit, relative to the latest tag reachable from it,
+        see L{GitRepository.describe}
+        """
+        args = GitRepository._describe_args(commitish, pattern, longfmt, always,
+                                            abbrev, tags, exact_match)
+        tag, err, ret = await self._git_inout('describe', args,
+                                              extra_env={'LC_ALL': 'C'})
+        if ret:
+            raise GitRepositoryError("Can't describe %s. Git error: %s" %
+                                     (commitish, err.decode().strip()))
+        return tag.decode().strip()
+
+    async def _status(self, porcelain, ignore_untracked, paths):
+        args = GitArgs()
+        args.add_true(ignore_untracked, '-uno')
+        args.add_true(porcelain, '--porcelain')
+
+        if paths is None:
+            paths = []
+        elif isinstance(paths, str):
+            paths = [paths]
+
+        out, dummy, ret = await self._git_inout('status', args.args + paths,
+                                                extra_env={'LC_ALL': 'C'})
+        if ret:
+            raise GitRepositoryError("Can't get repository status")
+        return out.decode()
+
+    async def is_clean(self, ignore_untracked=False, paths=None):
+        """
+        Does the repository contain any uncommitted modifications?
+        See L{GitRepository.is_clean}
+
+        @return: C{True} if the repository is clean, C{False} otherwise
+            and Git's status message
+        """
+        if self.bare:
+            return (True, '')
+
+        out = await self._status(porcelain=True,
+                                 ignore_untracked=ignore_untracked,
+                                 paths=paths)
+        if out:
+            # Get a more helpful error message.
+            out = await self._status(porcelain=False,
+                                     ignore_untracked=ignore_untracked,
+                                     paths=paths)
+            return (False, out)
+        else:
+            return (True, '')
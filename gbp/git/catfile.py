@@ -0,0 +1,163 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Read git objects via persistent git cat-file processes"""
+
+import os
+import subprocess
+
+import gbp.log as log
+from gbp.git.errors import GitError
+from gbp.paths import to_bin
+
+
+class CatFileError(GitError):
+    """
+    Exception thrown by L{CatFile} when an object can't be looked up
+    via the persistent process. Callers should fall back to running a
+    separate git command in this case.
+    """
+    pass
+
+
+class CatFile(object):
+    """
+    Look up objects in a git repository using long running
+    I{git cat-file --batch} and I{git cat-file --batch-check} processes.
+
+    The processes are started on first use. They're restarted if used from
+    a forked child and terminated by L{close} or when the object is garbage
+    collected.
+    """
+    batch = '--batch'
+    batch_check = '--batch-check'
+
+    def __init__(self, repo):
+        """
+        @param repo: the git repository L{CatFile} acts on
+        @type repo: L{GitRepository}
+        """
+        self._repo = repo
+        self._procs = {}
+        self._pid = os.getpid()
+
+    def _spawn(self, mode):
+        cmd = ['git', 'cat-file', mode]
+        log.debug(cmd)
+        self._repo._count_spawn()
+        try:
+            return subprocess.Popen(cmd,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL,
+                                    close_fds=True,
+                                    cwd=self._repo.path)
+        except OSError as err:
+            raise CatFileError("Error spawning git cat-file: %s" % err)
+
+    def _get_proc(self, mode):
+        if self._pid != os.getpid():
+            # We were forked, the pipes belong to our parent so don't
+            # touch the processes and start our own ones instead.
+            self._procs = {}
+            self._pid = os.getpid()
+        proc = self._procs.get(mode)
+        if proc is None or proc.poll() is not None:
+            proc = self._procs[mode] = self._spawn(mode)
+        return proc
+
+    def _query(self, mode, obj):
+        name = to_bin(obj)
+        if not name or b'\n' in name:
+            raise CatFileError("Can't look up '%s' via git cat-file" % obj)
+
+        proc = self._get_proc(mode)
+        try:
+            proc.stdin.write(name + b'\n')
+            proc.stdin.flush()
+            header = proc.stdout.readline()
+            parts = header.split()
+            if len(parts) != 3 or not parts[2].isdigit():
+                if header.endswith(b' missing\n') or header.endswith(b' ambiguous\n'):
+                    return None
+                raise CatFileError("Unexpected output from git cat-file for '%s': %s" %
+                                   (obj, header))
+            sha1, type_, size = parts[0].decode(), parts[1].decode(), int(parts[2])
+            content = None
+            if mode == self.batch:
+                content = proc.stdout.read(size + 1)[:-1]
+                if len(content) != size:
+                    raise CatFileError("Short read from git cat-file for '%s'" % obj)
+        except (OSError, ValueError) as err:
+            self._terminate(mode)
+            raise CatFileError("Error talking to git cat-file: %s" % err)
+        except CatFileError:
+            self._terminate(mode)
+            raise
+        return sha1, type_, size, content
+
+    def check(self, obj):
+        """
+        Look up object type and size
+
+        @param obj: the object name, anything git understands as an object name
+        @type obj: C{str}
+        @return: sha1, type and size of the object or C{None} if it doesn't exist
+        @rtype: C{tuple} of C{str}, C{str}, C{int}
+        @raises CatFileError: if the object can't be looked up this way
+        """
+        ret = self._query(self.batch_check, obj)
+        return ret[:3] if ret else None
+
+    def read(self, obj):
+        """
+        Look up an object including its contents
+
+        @param obj: the object name, anything git understands as an object name
+        @type obj: C{str}
+        @return: sha1, type, size and content of the object or C{None}
+            if it doesn't exist
+        @rtype: C{tuple} of C{str}, C{str}, C{int}, C{bytes}
+        @raises CatFileError: if the object can't be looked up this way
+        """
+        return self._query(self.batch, obj)
+
+    def _terminate(self, mode):
+        proc = self._procs.pop(mode, None)
+        if proc is None:
+            return
+        for pipe in (proc.stdin, proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        try:
+            proc.wait()
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Terminate all running cat-file processes
+        """
+        if self._pid != os.getpid():
+            self._procs = {}
+            return
+        for mode in list(self._procs.keys()):
+            self._terminate(mode)
+
+    def __del__(self):
+        self.close()
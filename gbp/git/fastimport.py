@@ -138,6 +138,7 @@ data %(length)s
             self._out.close()
         if self._fi:
             self._fi.wait()
+        self._repo.invalidate_ref_cache()
 
     def __del__(self):
         self.close()
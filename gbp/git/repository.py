@@ -16,18 +16,25 @@
 #    <http://www.gnu.org/licenses/>
 """A Git repository"""
 
+import functools
 import subprocess
 import os.path
 import re
 import sys
-from collections import defaultdict
+import tempfile
+import threading
+import uuid
+from collections import defaultdict, OrderedDict
 
+import gbp.capabilities
 import gbp.log as log
+import gbp.profile
 from gbp.errors import GbpError
 from gbp.git.modifier import GitModifier
 from gbp.git.commit import GitCommit
 from gbp.git.errors import GitError
 from gbp.git.args import GitArgs
+from gbp.git.catfile import CatFile, CatFileError
 from gbp.paths import to_bin
 
 
@@ -65,6 +72,20 @@ class GitRemote(object):
         return self._push_urls
 
 
+def _modifies_refs(method):
+    """
+    Decorator for L{GitRepository} methods that change refs so the
+    cached ref snapshot gets dropped
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.invalidate_ref_cache()
+    return wrapper
+
+
 class GitRepository(object):
     """
     Represents a git repository at I{path}. It's currently assumed that the git
@@ -72,9 +93,27 @@ class GitRepository(object):
 
     @ivar _path: The path to the working tree
     @ivar _bare: Whether this is a bare repository
+    @cvar use_cat_file: Whether to look up objects via a persistent
+        I{git cat-file} process instead of running git for each lookup
+    @cvar spawned_processes: Number of git processes spawned by all
+        instances so far. Useful to check how many git calls an
+        operation needs.
+    @cvar tree_cache_entries: Maximum number of tree entries kept in the
+        in memory tree listing cache
+    @cvar persist_tree_cache: Whether to also keep tree listings below
+        I{.git/gbp/trees/} so they survive the process. Defaults to
+        C{True} if I{GBP_PERSIST_TREE_CACHE} is set in the environment.
+    @cvar tree_cache_max_size: Maximum size in bytes of the listings kept
+        below I{.git/gbp/trees/}. The least recently used ones are
+        evicted first.
     @raises GitRepositoryError: on git errors GitRepositoryError is raised by
         all methods.
     """
+    use_cat_file = True
+    spawned_processes = 0
+    tree_cache_entries = 200000
+    persist_tree_cache = bool(os.getenv('GBP_PERSIST_TREE_CACHE'))
+    tree_cache_max_size = 64 << 20
 
     def _check_bare(self):
         """Check whether this is a bare repository"""
@@ -121,10 +160,125 @@ class GitRepository(object):
             git repository
         """
         self._bare = False
+        self._catfile = None
+        self._ref_snapshot = None
+        self._tree_cache = OrderedDict()
+        self._tree_cache_size = 0
+        # Guards the cat-file processes and the tree cache so threads can
+        # share a repository object
+        self._lock = threading.RLock()
+        self._submodule_lock = threading.Lock()
         self._path = self._check_repo(path, toplevel)
         self._check_bare()
         self._get_git_dir()
 
+    def close(self):
+        """
+        Release resources held by this object like the persistent
+        I{git cat-file} processes. The object can still be used afterwards.
+        """
+        with self._lock:
+            if self._catfile:
+                self._catfile.close()
+                self._catfile = None
+
+    def _cat_file(self, obj, content=False):
+        """
+        Look up I{obj} using the persistent cat-file processes
+
+        @param obj: the object to look up
+        @type obj: C{str}
+        @param content: whether to fetch the object's content too
+        @type content: C{bool}
+        @return: sha1, type, size (and content) of the object or C{None} if
+            the object doesn't exist
+        @rtype: C{tuple}
+        @raises CatFileError: if the object can't be looked up this way,
+            callers should fall back to running git directly
+        """
+        if not self.use_cat_file:
+            raise CatFileError("cat-file lookups disabled")
+        with self._lock:
+            if self._catfile is None:
+                self._catfile = CatFile(self)
+            return self._catfile.read(obj) if content else self._catfile.check(obj)
+
+    @staticmethod
+    def _count_spawn():
+        """Account for a spawned git process"""
+        GitRepository.spawned_processes += 1
+
+    def invalidate_ref_cache(self):
+        """
+        Drop the cached snapshot of all refs. Only needed when changing
+        refs without using L{GitRepository}'s methods.
+        """
+        self._ref_snapshot = None
+
+    def _ref_storage_stamp(self):
+        """
+        Cheap identity of the ref storage: the packed refs and the
+        directories holding loose refs. Git writes a loose ref to a lock
+        file and renames it into place so updating, adding or removing
+        one changes its directory. Changes done via our own methods drop
+        the snapshot anyway.
+        """
+        common_dir = self.git_dir
+        try:
+            with open(os.path.join(self.git_dir, 'commondir')) as f:
+                common_dir = os.path.join(self.git_dir, f.read().strip())
+        except OSError:
+            pass
+
+        stamp = []
+        for path in [os.path.join(common_dir, 'packed-refs'),
+                     os.path.join(common_dir, 'reftable', 'tables.list')]:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, st.st_ino, st.st_size, st.st_mtime_ns))
+
+        dirs = [os.path.join(common_dir, 'refs')]
+        while dirs:
+            path = dirs.pop()
+            try:
+                st = os.stat(path)
+                with os.scandir(path) as entries:
+                    dirs.extend(entry.path for entry in entries
+                                if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+            stamp.append((path, st.st_ino, st.st_mtime_ns, st.st_ctime_ns))
+        return stamp
+
+    def _refs(self):
+        """
+        A snapshot of all refs fetched with a single git call. It's reused
+        until refs are changed via one of our methods or the ref storage
+        changes on disk.
+
+        @return: refname -> (sha1, short refname, upstream remote, upstream merge)
+        @rtype: C{dict}
+        """
+        stamp = self._ref_storage_stamp()
+        snapshot = self._ref_snapshot
+        if snapshot is not None and snapshot[0] == stamp:
+            return snapshot[1]
+
+        args = ['--format=%(objectname)%00%(refname)%00%(refname:short)%00'
+                '%(upstream:remotename)%00%(upstream:remoteref)']
+        out, err, ret = self._git_inout('for-each-ref', args, capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to list refs: %s" % err.decode().strip())
+
+        refs = {}
+        for line in out.decode().splitlines():
+            sha1, name, short, remote, merge = line.split('\0')
+            refs[name] = (sha1, short, remote, merge)
+        self._ref_snapshot = (stamp, refs)
+        return refs
+
     @staticmethod
     def __build_env(extra_env):
         """Prepare environment for subprocess calls"""
@@ -149,21 +303,91 @@ class GitRepository(object):
         @return: stdout, return code
         @rtype: C{tuple} of C{list} of C{bytestr} and C{int}
 
-        @deprecated: use L{gbp.git.repository.GitRepository._git_inout} instead.
+        @deprecated: use L{gbp.git.repository.GitRepository._git_inout} or
+            L{gbp.git.repository.GitRepository._git_iter_lines} instead.
         """
-        output = []
-
         if not cwd:
             cwd = self.path
 
         env = self.__build_env(extra_env)
         cmd = ['git', command] + args
         log.debug(cmd)
+        self._count_spawn()
+        started = gbp.profile.start()
         popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env, cwd=cwd)
-        while popen.poll() is None:
-            output += popen.stdout.readlines()
-        output += popen.stdout.readlines()
-        return output, popen.returncode
+        stdout, dummy = popen.communicate()
+        gbp.profile.stop(started, cmd, popen.returncode, bytes_out=len(stdout))
+        return stdout.splitlines(keepends=True), popen.returncode
+
+    def _git_iter_lines(self, command, args=[], extra_env=None, cwd=None, sep=b'\n',
+                        config_args=None):
+        """
+        Run a git command and yield its output line by line while the
+        command is still running. Output is only read as fast as the
+        caller consumes it so git blocks instead of the whole output
+        piling up in memory. If the caller stops early the command
+        is killed.
+
+        @param command: git command to run
+        @type command: C{str}
+        @param args: list of arguments
+        @type args: C{list}
+        @param extra_env: extra environment variables to pass
+        @type extra_env: C{dict}
+        @param cwd: directory to switch to when running the command, defaults to I{self.path}
+        @type cwd: C{str}
+        @param sep: the line separator
+        @type sep: C{bytestr}
+        @param config_args: configuration options passed to git via I{-c}
+        @type config_args: C{list} of C{str}
+        @return: the output lines without the separator
+        @rtype: generator of C{bytestr}
+        @raises GitRepositoryError: if the command fails. This happens after
+            all output lines got yielded. Messages on stderr of a
+            successful command are passed on.
+        """
+        if not cwd:
+            cwd = self.path
+
+        env = self.__build_env(extra_env)
+        cmd = ['git']
+        for arg in config_args or []:
+            cmd.extend(['-c', arg])
+        cmd += [command] + args
+        log.debug(cmd)
+        self._count_spawn()
+        started = gbp.profile.start()
+        bytes_out = 0
+        # stderr goes to a file since a full pipe would block git while
+        # we're still waiting for stdout
+        errfile = tempfile.TemporaryFile()
+        popen = subprocess.Popen(cmd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=errfile,
+                                 env=env,
+                                 close_fds=True,
+                                 cwd=cwd)
+        try:
+            if started is None:
+                yield from self._iter_split(popen.stdout, sep)
+            else:
+                for line in self._iter_split(popen.stdout, sep):
+                    bytes_out += len(line) + len(sep)
+                    yield line
+            ret = popen.wait()
+            errfile.seek(0)
+            stderr = errfile.read().decode(errors='replace')
+            if ret:
+                raise GitRepositoryError("Error running git %s: %s" %
+                                         (command, stderr.strip()))
+            sys.stderr.write(stderr)
+        finally:
+            if popen.poll() is None:
+                popen.kill()
+            popen.stdout.close()
+            popen.wait()
+            errfile.close()
+            gbp.profile.stop(started, cmd, popen.returncode, bytes_out=bytes_out)
 
     def _git_inout(self, command, args, input=None, extra_env=None, cwd=None,
                    capture_stderr=False, config_args=None):
@@ -205,6 +429,8 @@ class GitRepository(object):
         stdin_arg = subprocess.PIPE if input is not None else None
 
         log.debug(cmd)
+        cls._count_spawn()
+        started = gbp.profile.start()
         popen = subprocess.Popen(cmd,
                                  stdin=stdin_arg,
                                  stdout=subprocess.PIPE,
@@ -213,6 +439,9 @@ class GitRepository(object):
                                  close_fds=True,
                                  cwd=cwd)
         (stdout, stderr) = popen.communicate(input)
+        gbp.profile.stop(started, cmd, popen.returncode,
+                         bytes_in=len(input) if input else 0,
+                         bytes_out=len(stdout))
         return stdout, stderr, popen.returncode
 
     def _git_command(self, command, args=[], extra_env=None):
@@ -243,6 +472,10 @@ class GitRepository(object):
         """
         Check if the git command has certain feature enabled.
 
+        The options of each command are cached (see
+        L{gbp.capabilities.CapabilityCache}) so git's man page is only
+        parsed once per git version.
+
         @param command: git command
         @type command: C{str}
         @param feature: feature / command option to check
@@ -250,6 +483,19 @@ class GitRepository(object):
         @return: True if feature is supported
         @rtype: C{bool}
         """
+        options = gbp.capabilities.lookup('git', 'options:%s' % command,
+                                          lambda: self._cmd_options(command))
+        return feature in options
+
+    def _cmd_options(self, command):
+        """
+        Get the options of a git command from its man page
+
+        @param command: git command
+        @type command: C{str}
+        @return: the option names without leading dashes
+        @rtype: C{list} of C{str}
+        """
         args = GitArgs(command, '-m')
         help, stderr, ret = self._git_inout('help',
                                             args.args,
@@ -264,6 +510,7 @@ class GitRepository(object):
         option_re = re.compile(r'--?(?P<name>[a-zA-Z\-]+).*')
         optopt_re = re.compile(r'--\[(?P<prefix>[a-zA-Z\-]+)\]-?')
         man_section = None
+        options = set()
         for line in help.decode().splitlines():
             if man_section == "OPTIONS" and line.startswith('       -'):
                 opts = line.split(',')
@@ -275,13 +522,13 @@ class GitRepository(object):
                         prefix = match.group('prefix').strip('-')
                         opt = re.sub(optopt_re, '--%s-' % prefix, opt)
                     match = option_re.match(opt)
-                    if match and match.group('name') == feature:
-                        return True
+                    if match:
+                        options.add(match.group('name'))
             # Check man section
             match = section_re.match(line)
             if match:
                 man_section = match.group('section')
-        return False
+        return sorted(options)
 
     @property
     def path(self) -> str:
@@ -317,6 +564,7 @@ class GitRepository(object):
         return self.rev_parse('HEAD')
 
 #{ Branches and Merging
+    @_modifies_refs
     def rename_branch(self, branch: str, newbranch: str):
         """
         Rename branch
@@ -327,6 +575,7 @@ class GitRepository(object):
         args = GitArgs("-m", branch, newbranch)
         self._git_command("branch", args.args)
 
+    @_modifies_refs
     def create_branch(self, branch: str, rev: str | None = None, force: bool = False):
         """
         Create a new branch
@@ -342,6 +591,7 @@ class GitRepository(object):
         args.add_true(rev, rev)
         self._git_command("branch", args.args)
 
+    @_modifies_refs
     def delete_branch(self, branch: str, remote: bool = False):
         """
         Delete branch I{branch}
@@ -395,16 +645,10 @@ class GitRepository(object):
         @param remote: only look for remote branches
         @return: C{True} if the repository has this branch, C{False} otherwise
         """
-        args = GitArgs('--verify')
-
         branch_pattern = 'refs/remotes/%s' if remote else 'refs/heads/%s'
-        args.add(branch_pattern % branch)
-        try:
-            self._git_command('show-ref', args.args)
-        except GitRepositoryError:
-            return False
-        return True
+        return branch_pattern % branch in self._refs()
 
+    @_modifies_refs
     def set_branch(self, branch: str):
         """
         Switch to branch I{branch}
@@ -427,11 +671,16 @@ class GitRepository(object):
         @return: repo and branch we would merge from
         @rtype: C{str}
         """
-        try:
-            remote = self.get_config("branch.%s.remote" % branch)
-            merge = self.get_config("branch.%s.merge" % branch)
-        except KeyError:
-            return None
+        # The snapshot only knows about upstreams of existing branches with
+        # a configured remote so fall back to looking at the config
+        _, _, remote, merge = self._refs().get('refs/heads/%s' % branch,
+                                               (None, None, None, None))
+        if not (remote and merge):
+            try:
+                remote = self.get_config("branch.%s.remote" % branch)
+                merge = self.get_config("branch.%s.merge" % branch)
+            except KeyError:
+                return None
         remote += merge.replace("refs/heads", "", 1)
         return remote
 
@@ -455,6 +704,7 @@ class GitRepository(object):
         else:
             raise GitRepositoryError("Failed to get common ancestor: %s" % stderr.decode().strip())
 
+    @_modifies_refs
     def merge(self, commit, verbose: bool = False, edit: bool = False):
         """
         Merge changes from the named commit into the current branch
@@ -473,6 +723,7 @@ class GitRepository(object):
         args.add(commit)
         self._git_command("merge", args.args)
 
+    @_modifies_refs
     def abort_merge(self):
         """
         Abort a merge
@@ -492,20 +743,26 @@ class GitRepository(object):
         """
         has_local = False       # local repo has new commits
         has_remote = False      # remote repo has new commits
-        out = self._git_getoutput('rev-list',
-                                  ["--left-right",
-                                   "%s...%s" % (from_branch, to_branch),
-                                   "--"])[0]
+        out = self._git_iter_lines('rev-list',
+                                   ["--left-right",
+                                    "%s...%s" % (from_branch, to_branch),
+                                    "--"])
+        try:
+            for line in out:
+                if line.startswith(b"<"):
+                    has_local = True
+                elif line.startswith(b">"):
+                    has_remote = True
+                if has_local and has_remote:
+                    break
+        except GitRepositoryError:
+            pass
+        finally:
+            out.close()
 
-        if not out:  # both branches have the same commits
+        if not has_local and not has_remote:  # both branches have the same commits
             return True, True
 
-        for line in (li.decode() for li in out):
-            if line.startswith("<"):
-                has_local = True
-            elif line.startswith(">"):
-                has_remote = True
-
         if has_local and has_remote:
             return False, False
         elif has_local:
@@ -522,10 +779,9 @@ class GitRepository(object):
         @param remote: whether to list local or remote branches
         @return: local or remote branches
         """
-        args = ['--format=%(refname:short)']
-        args += ['refs/remotes/'] if remote else ['refs/heads/']
-        out = self._git_getoutput('for-each-ref', args)[0]
-        return [ref.decode().strip() for ref in out]
+        prefix = 'refs/remotes/' if remote else 'refs/heads/'
+        return [short for name, (_, short, _, _) in self._refs().items()
+                if name.startswith(prefix)]
 
     def get_local_branches(self):
         """
@@ -545,6 +801,7 @@ class GitRepository(object):
         """
         return self._get_branches(remote=True)
 
+    @_modifies_refs
     def update_ref(self, ref: str, new: str, old: str | None = None, msg: str | None = None):
         """
         Update ref I{ref} to commit I{new} if I{ref} currently points to
@@ -574,14 +831,20 @@ class GitRepository(object):
         args.add('--contains')
         args.add(commit)
 
-        out, ret = self._git_getoutput('branch', args.args)
-        for line in [li.decode() for li in out]:
-            # remove prefix '*' for current branch before comparing
-            line = line.replace('*', '')
-            if line.strip() == branch:
-                return True
+        out = self._git_iter_lines('branch', args.args)
+        try:
+            for line in out:
+                # remove prefix '*' for current branch before comparing
+                line = line.decode().replace('*', '')
+                if line.strip() == branch:
+                    return True
+        except GitRepositoryError:
+            pass
+        finally:
+            out.close()
         return False
 
+    @_modifies_refs
     def set_upstream_branch(self, local_branch: str, upstream: str):
         """
         Set upstream branches for local branch
@@ -638,6 +901,7 @@ class GitRepository(object):
 
 #{ Tags
 
+    @_modifies_refs
     def create_tag(self,
                    name: str,
                    msg: str | None = None,
@@ -665,6 +929,7 @@ class GitRepository(object):
         args += [commit] if commit else []
         self._git_command("tag", args)
 
+    @_modifies_refs
     def delete_tag(self, tag: str):
         """
         Delete a tag named I{tag}
@@ -674,6 +939,7 @@ class GitRepository(object):
         if self.has_tag(tag):
             self._git_command("tag", ["-d", tag])
 
+    @_modifies_refs
     def move_tag(self, old: str, new: str):
         self._git_command("tag", [new, old])
         self.delete_tag(old)
@@ -685,8 +951,9 @@ class GitRepository(object):
         @param tag: tag to look for
         @return: C{True} if the repository has that tag, C{False} otherwise
         """
-        out, ret = self._git_getoutput('tag', ['-l', tag])
-        return [False, True][len(out)]
+        if 'refs/tags/%s' % tag in self._refs():
+            return True
+        return len(self.get_tags(tag)) > 0
 
     def describe(self,
                  commitish: str,
@@ -709,6 +976,19 @@ class GitRepository(object):
         references the supplied commit)
         @return: tag name plus/or the abbreviated sha1
         """
+        args = self._describe_args(commitish, pattern, longfmt, always,
+                                   abbrev, tags, exact_match)
+        tag, err, ret = self._git_inout('describe', args,
+                                        extra_env={'LC_ALL': 'C'},
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Can't describe %s. Git error: %s" %
+                                     (commitish, err.decode().strip()))
+        return tag.decode().strip()
+
+    @staticmethod
+    def _describe_args(commitish, pattern, longfmt, always, abbrev, tags, exact_match):
+        """Build the arguments to git describe, see L{describe}"""
         args = GitArgs()
         args.add_true(pattern, ['--match', pattern])
         args.add_true(longfmt, '--long')
@@ -722,14 +1002,7 @@ class GitRepository(object):
         args.add_true(tags, '--tags')
         args.add_true(exact_match, '--exact-match')
         args.add(commitish)
-
-        tag, err, ret = self._git_inout('describe', args.args,
-                                        extra_env={'LC_ALL': 'C'},
-                                        capture_stderr=True)
-        if ret:
-            raise GitRepositoryError("Can't describe %s. Git error: %s" %
-                                     (commitish, err.decode().strip()))
-        return tag.decode().strip()
+        return args.args
 
     def find_tag(self, commit: str, pattern: str | None = None):
         """
@@ -759,8 +1032,12 @@ class GitRepository(object):
         @param pattern: only list tags matching I{pattern}
         @return: tags
         """
-        args = ['-l', pattern] if pattern else []
-        return [line.decode().strip() for line in self._git_getoutput('tag', args)[0]]
+        if pattern and any(c in pattern for c in '*?[\\'):
+            # Leave wildcards to git so they match the same way
+            return [line.decode().strip() for line in self._git_getoutput('tag', ['-l', pattern])[0]]
+        return [name[len('refs/tags/'):] for name in self._refs()
+                if name.startswith('refs/tags/') and
+                (not pattern or name[len('refs/tags/'):] == pattern)]
 
     def verify_tag(self, tag: str) -> bool:
         """
@@ -778,6 +1055,7 @@ class GitRepository(object):
         return True
 
 #}
+    @_modifies_refs
     def force_head(self, commit: str, hard: bool = False):
         """
         Force HEAD to a specific commit
@@ -918,6 +1196,44 @@ class GitRepository(object):
             raise GitRepositoryError("revision '%s' not found" % name)
         return self.strip_sha1(sha[0].decode(), short)
 
+    def rev_parse_many(self, names, short=0):
+        """
+        Find the SHA1s of several names at once. Unlike L{rev_parse} this
+        doesn't fail if a name can't be found.
+
+        @param names: the names to look for
+        @type names: C{list} of C{str}
+        @param short:  try to abbreviate SHA1s to given length
+        @type short: C{int}
+        @return: the names' SHA1s in the same order as I{names}, C{None}
+            for names that can't be found
+        @rtype: C{list} of C{str}
+        """
+        try:
+            shas = [self._abbrev_sha1(info[0], short) if info else None
+                    for info in (self._cat_file(name) for name in names)]
+        except CatFileError:
+            shas = []
+            for name in names:
+                try:
+                    shas.append(self.rev_parse(name, short=short))
+                except GitRepositoryError:
+                    shas.append(None)
+        return shas
+
+    def _abbrev_sha1(self, sha1, short):
+        """
+        Abbreviate I{sha1} to at least I{short} characters so it's
+        still unique like C{git rev-parse --short} does
+        """
+        if not short:
+            return sha1
+        for length in range(max(short, 4), len(sha1)):
+            info = self._cat_file(sha1[:length])
+            if info and info[0] == sha1:
+                return sha1[:length]
+        return sha1
+
     @staticmethod
     def strip_sha1(sha1, length=0):
         """
@@ -950,6 +1266,7 @@ class GitRepository(object):
         return s
 
 #{ Trees
+    @_modifies_refs
     def checkout(self, treeish):
         """
         Checkout treeish
@@ -968,10 +1285,41 @@ class GitRepository(object):
         @return: C{True} if the repository has that tree, C{False} otherwise
         @rtype: C{bool}
         """
+        try:
+            return self._is_treeish(treeish)
+        except CatFileError:
+            pass
         _out, _err, ret = self._git_inout('ls-tree', [treeish],
                                           capture_stderr=True)
         return [True, False][ret != 0]
 
+    def has_treeish_many(self, treeishs):
+        """
+        Check for several treeish objects at once
+
+        @param treeishs: treeish objects to look for
+        @type treeishs: C{list} of C{str}
+        @return: for each object C{True} if the repository has that tree,
+            C{False} otherwise
+        @rtype: C{list} of C{bool}
+        """
+        try:
+            return [self._is_treeish(treeish) for treeish in treeishs]
+        except CatFileError:
+            return [self.has_treeish(treeish) for treeish in treeishs]
+
+    def _is_treeish(self, treeish):
+        """
+        Check if I{treeish} is a treeish object using the persistent
+        cat-file process
+        """
+        # Can't append ^{tree} since it would become part of the path
+        # in names like <rev>:<path>
+        info = self._cat_file(treeish)
+        if info is not None and info[1] == 'tag':
+            info = self._cat_file('%s^{tree}' % info[0])
+        return info is not None and info[1] in ['tree', 'commit']
+
     def write_tree(self, index_file=None):
         """
         Create a tree object from the current index
@@ -993,6 +1341,18 @@ class GitRepository(object):
             raise GitRepositoryError("Can't write out current index: %s" % stderr.decode().strip())
         return tree.decode().strip()
 
+    def read_tree(self, treeish, index_file=None):
+        """
+        Read a tree into the index, the working copy is left alone
+
+        @param treeish: the tree to read
+        @type treeish: C{str}
+        @param index_file: alternate index file to read the tree into
+        @type index_file: C{str}
+        """
+        extra_env = {'GIT_INDEX_FILE': index_file} if index_file else None
+        self._git_command('read-tree', [treeish], extra_env=extra_env)
+
     def make_tree(self, contents):
         """
         Create a tree based on contents.
@@ -1000,12 +1360,9 @@ class GitRepository(object):
         @param contents: same format as I{GitRepository.list_tree} output.
         @type contents: C{list} of C{str}
         """
-        objs = b''
         args = GitArgs('-z')
-
-        for mode, type_, sha1, name in contents:
-            name = to_bin(name)
-            objs += b'%s %s %s\t%s\0' % (mode.encode(), type_.encode(), sha1.encode(), name)
+        objs = b''.join(b'%s %s %s\t%s\0' % (mode.encode(), type_.encode(), sha1.encode(), to_bin(name))
+                        for mode, type_, sha1, name in contents)
 
         sha1, err, ret = self._git_inout('mktree',
                                          args.args,
@@ -1024,6 +1381,14 @@ class GitRepository(object):
         @return: type of the repository object
         @rtype: C{str}
         """
+        try:
+            info = self._cat_file(obj)
+        except CatFileError:
+            pass
+        else:
+            if info is None:
+                raise GitRepositoryError("Not a Git repository object: '%s'" % obj)
+            return info[1]
         out, ret = self._git_getoutput('cat-file', args=['-t', obj])
         if ret:
             raise GitRepositoryError("Not a Git repository object: '%s'" % obj)
@@ -1035,6 +1400,9 @@ class GitRepository(object):
         'ls-tree' output: (mode, type, sha1, path). When sizes is True,
         includes object sizes: (mode, type, sha1, size, path)
 
+        Since trees are immutable listings without I{paths} are cached
+        by the tree's SHA1 (see L{tree_cache_entries}).
+
         @param treeish: the treeish object to list
         @type treeish: C{str}
         @param recurse: whether to list the tree recursively
@@ -1044,6 +1412,89 @@ class GitRepository(object):
         @return: the tree
         @rtype: C{list} of objects. See above.
         """
+        try:
+            yield from self._ls_tree(treeish, recurse, paths, sizes)
+        except GitRepositoryError as err:
+            raise GitRepositoryError("Failed to ls-tree '%s': '%s'" % (treeish, err))
+
+    def _resolve_tree(self, treeish):
+        """
+        Resolve I{treeish} to a tree's SHA1 without spawning git
+
+        @return: the SHA1 or C{None} if it can't be resolved this way
+        """
+        try:
+            info = self._cat_file('%s^{tree}' % treeish)
+        except CatFileError:
+            return None
+        return info[0] if info else None
+
+    def _tree_cache_get(self, key):
+        """Look up I{key} in the tree cache"""
+        with self._lock:
+            value = self._tree_cache.get(key)
+            if value is not None:
+                self._tree_cache.move_to_end(key)
+            return value
+
+    def _tree_cache_put(self, key, value):
+        """
+        Add I{key} to the tree cache evicting the least recently used
+        entries if it gets too large
+        """
+        size = len(value) if isinstance(value, tuple) else 1
+        if size > self.tree_cache_entries:
+            return
+        with self._lock:
+            old = self._tree_cache.pop(key, None)
+            if old is not None:
+                self._tree_cache_size -= len(old) if isinstance(old, tuple) else 1
+            self._tree_cache[key] = value
+            self._tree_cache_size += size
+            while self._tree_cache_size > self.tree_cache_entries:
+                dummy, old = self._tree_cache.popitem(last=False)
+                self._tree_cache_size -= len(old) if isinstance(old, tuple) else 1
+
+    def _tree_cache_file(self, sha1, recurse, sizes):
+        return os.path.join(self.git_dir, 'gbp', 'trees',
+                            '%s%s%s' % (sha1, '-r' if recurse else '', '-l' if sizes else ''))
+
+    def _ls_tree(self, treeish, recurse=False, paths=None, sizes=False):
+        """
+        List a tree using the tree cache if possible
+
+        @return: the tree entries, see L{list_tree}
+        @rtype: C{tuple} of C{tuple}s
+        @raises GitRepositoryError: with git's error message if listing fails
+        """
+        sha1 = None if paths else self._resolve_tree(treeish)
+        if sha1 is None:
+            return self._parse_ls_tree(self._run_ls_tree(treeish, recurse, paths, sizes), sizes)
+
+        key = (sha1, recurse, sizes)
+        entries = self._tree_cache_get(key)
+        if entries is not None:
+            return entries
+
+        out = None
+        cache_file = self._tree_cache_file(sha1, recurse, sizes) if self.persist_tree_cache else None
+        if cache_file:
+            try:
+                with open(cache_file, 'rb') as f:
+                    out = f.read()
+                # Mark as recently used
+                os.utime(cache_file)
+            except OSError:
+                pass
+        if out is None:
+            out = self._run_ls_tree(sha1, recurse, None, sizes)
+            if cache_file:
+                self._write_tree_cache_file(cache_file, out)
+        entries = self._parse_ls_tree(out, sizes)
+        self._tree_cache_put(key, entries)
+        return entries
+
+    def _run_ls_tree(self, treeish, recurse, paths, sizes):
         args = GitArgs('-z')
         args.add_true(recurse, '-r')
         args.add_true(sizes, '-l')
@@ -1053,8 +1504,12 @@ class GitRepository(object):
 
         out, err, ret = self._git_inout('ls-tree', args.args, capture_stderr=True)
         if ret:
-            raise GitRepositoryError("Failed to ls-tree '%s': '%s'" % (treeish, err.decode().strip()))
+            raise GitRepositoryError(err.decode().strip())
+        return out
 
+    @staticmethod
+    def _parse_ls_tree(out, sizes):
+        entries = []
         for line in out.split(b'\0'):
             if line:
                 parts = line.split(None, 4 if sizes else 3)
@@ -1064,10 +1519,47 @@ class GitRepository(object):
                     mode, type, sha1, size = (part.decode() for part in parts)
                     # Git submodules report '-' instead of a size
                     size = size if size != '-' else 0
-                    yield mode, type, sha1, int(size), filename
+                    entries.append((sys.intern(mode), sys.intern(type), sha1, int(size), filename))
                 else:
                     mode, type, sha1 = (part.decode() for part in parts)
-                    yield mode, type, sha1, filename
+                    entries.append((sys.intern(mode), sys.intern(type), sha1, filename))
+        return tuple(entries)
+
+    def _write_tree_cache_file(self, cache_file, out):
+        if len(out) > self.tree_cache_max_size:
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp = '%s.%d.tmp' % (cache_file, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(out)
+            os.replace(tmp, cache_file)
+            self._evict_tree_cache_files(os.path.dirname(cache_file))
+        except OSError as err:
+            log.debug("Can't write tree cache file '%s': %s" % (cache_file, err))
+
+    def _evict_tree_cache_files(self, cache_dir):
+        """Drop least recently used listings until they fit L{tree_cache_max_size}"""
+        entries = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for dummy, entry_size, path in sorted(entries):
+            if size <= self.tree_cache_max_size:
+                break
+            log.debug("Evicting tree cache file '%s'" % path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
 
 #}
 
@@ -1084,6 +1576,7 @@ class GitRepository(object):
             raise KeyError("'%s' not found in git config" % name)
         return value[0].decode()[:-1]  # first line with \n ending removed
 
+    @_modifies_refs
     def set_config(self, name, value):
         """
         Set a git config value in this repository
@@ -1173,8 +1666,13 @@ class GitRepository(object):
         @return: remote repositories
         @rtype: C{list} of C{str}
         """
-        out = self._git_getoutput('remote')[0]
-        return [remote.decode().strip() for remote in out]
+        remotes = []
+        try:
+            for remote in self._git_iter_lines('remote'):
+                remotes.append(remote.decode().strip())
+        except GitRepositoryError:
+            pass
+        return remotes
 
     def has_remote_repo(self, name):
         """
@@ -1190,6 +1688,7 @@ class GitRepository(object):
         else:
             return False
 
+    @_modifies_refs
     def add_remote_repo(self, name, url, tags=True, fetch=False):
         """
         Add a tracked remote repository
@@ -1209,10 +1708,12 @@ class GitRepository(object):
         args.add(name, url)
         self._git_command("remote", args.args)
 
+    @_modifies_refs
     def remove_remote_repo(self, name):
         args = GitArgs('rm', name)
         self._git_command("remote", args.args)
 
+    @_modifies_refs
     def fetch(self, repo=None, tags=False, depth=0, refspec=None,
               all_remotes=False):
         """
@@ -1240,6 +1741,7 @@ class GitRepository(object):
 
         self._git_command("fetch", args.args)
 
+    @_modifies_refs
     def pull(self, repo=None, ff_only=False, all_remotes=False):
         """
         Fetch and merge from another repository
@@ -1259,6 +1761,7 @@ class GitRepository(object):
             args.add_true(repo, repo)
         self._git_command("pull", args.args)
 
+    @_modifies_refs
     def push(self, repo=None, src=None, dst=None, ff_only=True, force=False,
              tags=False, dry_run=False):
         """
@@ -1297,6 +1800,7 @@ class GitRepository(object):
 
         self._git_command("push", args.args)
 
+    @_modifies_refs
     def push_tag(self, repo, tag, dry_run=False):
         """
         Push a tag to the remote repo
@@ -1340,6 +1844,32 @@ class GitRepository(object):
 
         self._git_command("add", args + paths, extra_env)
 
+    def add_files_incremental(self, paths, index_file, force=False):
+        """
+        Add files to an index file that is kept around between calls.
+        Git only rehashes files whose stat data changed since they were
+        last added so this is much faster than starting with an empty
+        index on large trees. Files missing from the working tree are
+        dropped from the index. If updating the index fails (e.g.
+        because it's corrupt) it's rebuilt from scratch.
+
+        @param paths: list of files to add
+        @type paths: list or C{str}
+        @param index_file: index file to use
+        @type index_file: C{str}
+        @param force: add files even if they would be ignored by .gitignore
+        @type force: C{bool}
+        """
+        if os.path.exists(index_file):
+            try:
+                self.add_files(paths, force=force, index_file=index_file)
+                return
+            except GitRepositoryError as err:
+                log.debug("Rebuilding index '%s': %s" % (index_file, err))
+            os.unlink(index_file)
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        self.add_files(paths, force=force, index_file=index_file)
+
     def remove_files(self, paths, verbose=False):
         """
         Remove files from the repository
@@ -1373,13 +1903,7 @@ class GitRepository(object):
                 args += ['--%s' % t]
             else:
                 raise GitRepositoryError("Unknown type '%s'" % t)
-        out, ret = self._git_getoutput('ls-files', args)
-        if ret:
-            raise GitRepositoryError("Error listing files: '%d'" % ret)
-        if out:
-            return [file for file in out[0].split(b'\0') if file]
-        else:
-            return []
+        return [file for file in self._git_iter_lines('ls-files', args, sep=b'\0') if file]
 
     def write_file(self, filename, filters=True):
         """
@@ -1418,6 +1942,7 @@ class GitRepository(object):
 
 #{ Committing
 
+    @_modifies_refs
     def _commit(self, msg, args=[], author_info=None):
         extra_env = author_info.get_author_env() if author_info else None
         self._git_command("commit", ['-q', '-m', msg] + args, extra_env=extra_env)
@@ -1487,14 +2012,18 @@ class GitRepository(object):
         @type create_missing_branch: C{bool}
         """
 
-        git_index_file = os.path.join(self.path, self._git_dir, 'gbp_index')
+        git_index_file = os.path.join(self.git_dir, 'gbp_index')
         try:
             os.unlink(git_index_file)
         except OSError:
             pass
-        self.add_files('.', force=True, index_file=git_index_file,
-                       work_tree=unpack_dir)
-        tree = self.write_tree(git_index_file)
+        try:
+            self.add_files('.', force=True, index_file=git_index_file,
+                           work_tree=unpack_dir)
+            tree = self.write_tree(git_index_file)
+        finally:
+            if os.path.exists(git_index_file):
+                os.unlink(git_index_file)
 
         if branch:
             try:
@@ -1567,6 +2096,23 @@ class GitRepository(object):
 
 #{ Commit Information
 
+    @staticmethod
+    def _commit_range_args(since, until, paths, num, first_parent, options):
+        """Build the git log arguments shared by L{get_commits} and friends"""
+        args = GitArgs()
+        args.add_true(num, '-%d' % num)
+        args.add_true(first_parent, '--first-parent')
+        if since:
+            args.add("%s..%s" % (since, until or 'HEAD'))
+        elif until:
+            args.add(until)
+        args.add_cond(options, options)
+        args.add("--")
+        if isinstance(paths, str):
+            paths = [paths]
+        args.add_cond(paths, paths)
+        return args.args
+
     def get_commits(self, since=None, until=None, paths=None, num=0,
                     first_parent=False, options=None):
         """
@@ -1585,26 +2131,33 @@ class GitRepository(object):
         @param first_parent: only follow first parent when seeing a
                              merge commit
         @type first_parent: C{bool}
+        @return: the commits' SHA1s, newest first
+        @rtype: C{list} of C{str}
+        """
+        return list(self.iter_commits(since, until, paths, num,
+                                      first_parent, options))
+
+    def iter_commits(self, since=None, until=None, paths=None, num=0,
+                     first_parent=False, options=None):
+        """
+        Like L{get_commits} but yield the commits while git log is
+        still running so callers don't need to wait for (and keep)
+        the whole history.
+
+        @return: the commits' SHA1s, newest first
+        @rtype: generator of C{str}
         """
         args = GitArgs('--pretty=format:%H', '--no-show-signature')
-        args.add_true(num, '-%d' % num)
-        args.add_true(first_parent, '--first-parent')
-        if since:
-            args.add("%s..%s" % (since, until or 'HEAD'))
-        elif until:
-            args.add(until)
-        args.add_cond(options, options)
-        args.add("--")
-        if isinstance(paths, str):
-            paths = [paths]
-        args.add_cond(paths, paths)
+        args.add(self._commit_range_args(since, until, paths, num,
+                                         first_parent, options))
 
-        commits, ret = self._git_getoutput('log', args.args)
-        if ret:
+        try:
+            for commit in self._git_iter_lines('log', args.args):
+                yield commit.decode().strip()
+        except GitRepositoryError:
             where = " on %s" % paths if paths else ""
             raise GitRepositoryError("Error getting commits %s..%s%s" %
                                      (since, until, where))
-        return [commit.decode().strip() for commit in commits]
 
     def show(self, id):
         """
@@ -1612,6 +2165,17 @@ class GitRepository(object):
 
         @rtype: C{bytestr}
         """
+        # Blobs can be read via cat-file, everything else and errors
+        # need git-show's formatting. Check the type first so other
+        # objects aren't read twice.
+        try:
+            info = self._cat_file(id)
+            if info and info[1] == 'blob':
+                info = self._cat_file(info[0], content=True)
+                if info:
+                    return info[3]
+        except CatFileError:
+            pass
         obj, stderr, ret = self._git_inout('show', ["--pretty=medium", id],
                                            capture_stderr=True)
         if ret:
@@ -1656,6 +2220,26 @@ class GitRepository(object):
         """
         return self.get_commit_info(commit)['subject']
 
+    _commit_info_format = ('%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00'
+                           '%s%x00%f%x00%b%x00')
+
+    @staticmethod
+    def _commit_info_from_fields(commitish, fields, files):
+        """Build the dict returned by L{get_commit_info}"""
+        author = GitModifier(fields[0].decode().strip(),
+                             fields[1].decode().strip(),
+                             fields[2].decode().strip())
+        committer = GitModifier(fields[3].decode().strip(),
+                                fields[4].decode().strip(),
+                                fields[5].decode().strip())
+        return {'id': commitish,
+                'author': author,
+                'committer': committer,
+                'subject': fields[6].decode(),
+                'patchname': fields[7].decode(),
+                'body': fields[8].decode(),
+                'files': files}
+
     def get_commit_info(self, commitish):
         """
         Look up data of a specific commit-ish. Dereferences given commit-ish
@@ -1666,7 +2250,7 @@ class GitRepository(object):
         @rtype: dict
         """
         commit_sha1 = self.rev_parse("%s^0" % commitish)
-        args = GitArgs('--pretty=format:%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00%s%x00%f%x00%b%x00',
+        args = GitArgs('--pretty=format:%s' % self._commit_info_format,
                        '-z', '--date=raw', '--no-renames', '--name-status',
                        '--no-show-signature', commit_sha1)
         out, err, ret = self._git_inout('show', args.args)
@@ -1676,13 +2260,6 @@ class GitRepository(object):
 
         fields = out.split(b'\x00')
 
-        author = GitModifier(fields[0].decode().strip(),
-                             fields[1].decode().strip(),
-                             fields[2].decode().strip())
-        committer = GitModifier(fields[3].decode().strip(),
-                                fields[4].decode().strip(),
-                                fields[5].decode().strip())
-
         files = defaultdict(list)
         file_fields = fields[9:]
 
@@ -1694,13 +2271,97 @@ class GitRepository(object):
             path = file_fields.pop(0)
             files[status].append(path)
 
-        return {'id': commitish,
-                'author': author,
-                'committer': committer,
-                'subject': fields[6].decode(),
-                'patchname': fields[7].decode(),
-                'body': fields[8].decode(),
-                'files': files}
+        return self._commit_info_from_fields(commitish, fields, files)
+
+    @staticmethod
+    def _iter_split(stream, sep, bufsize=65536):
+        """
+        Split the data read from I{stream} at I{sep} yielding each
+        record as soon as it's complete
+        """
+        pending = bytearray()
+        while True:
+            chunk = stream.read1(bufsize)
+            if not chunk:
+                break
+            # Only look at the new data so long records don't get
+            # searched over and over again
+            start = max(len(pending) - len(sep) + 1, 0)
+            pending += chunk
+            while True:
+                pos = pending.find(sep, start)
+                if pos < 0:
+                    break
+                yield bytes(pending[:pos])
+                del pending[:pos + len(sep)]
+                start = 0
+        if pending:
+            yield bytes(pending)
+
+    def iter_commit_infos(self, since=None, until=None, paths=None, num=0,
+                          first_parent=False, options=None, reverse=False):
+        """
+        Look up data of all commits from since to until touching paths
+        using a single git process. This is equivalent to calling
+        L{get_commit_info} on each commit returned by L{get_commits} but
+        much faster on long histories.
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @param paths: only list commits touching paths
+        @type paths: C{list} of C{str}
+        @param num: maximum number of commits to fetch
+        @type num: C{int}
+        @param first_parent: only follow first parent when seeing a
+                             merge commit
+        @type first_parent: C{bool}
+        @param options: list of additional options passed to git log
+        @type  options: C{list} of C{str}ings
+        @param reverse: yield the oldest commit first
+        @type reverse: C{bool}
+        @return: commit information as returned by L{get_commit_info} with
+            the commit's SHA1 as I{id}
+        @rtype: generator of C{dict}
+        """
+        # Status and path records never match the marker so it
+        # separates the commits independent of the hash length
+        marker = 'gbp-commit-%s' % uuid.uuid4().hex
+        args = GitArgs('-z', '--format=%s%%x00%%H%%x00%s' % (marker, self._commit_info_format),
+                       '--date=raw', '--no-renames', '--name-status', '--cc',
+                       '--full-diff', '--no-show-signature')
+        args.add_true(reverse, '--reverse')
+        args.add(self._commit_range_args(since, until, paths, num,
+                                         first_parent, options))
+
+        records = self._git_iter_lines('log', args.args, sep=b'\x00')
+        try:
+            record = next(records, None)
+            while record is not None:
+                if record != marker.encode():
+                    # commit separator
+                    record = next(records, None)
+                    continue
+                sha1 = next(records, b'').decode()
+                fields = [next(records, b'') for _ in range(9)]
+                files = defaultdict(list)
+                record = next(records, None)
+                while record == b'':
+                    record = next(records, None)
+                while record is not None and record != marker.encode():
+                    path = next(records, b'')
+                    status = record.decode().strip()
+                    if status:
+                        files[status].append(path)
+                    record = next(records, None)
+                yield self._commit_info_from_fields(sha1, fields, files)
+        except GitRepositoryError as err:
+            where = " on %s" % paths if paths else ""
+            raise GitRepositoryError("Error getting commits %s..%s%s: %s" %
+                                     (since, until, where, err))
+        finally:
+            records.close()
 
 #{ Patches
     def format_patches(self, start, end, output_dir,
@@ -1726,22 +2387,43 @@ class GitRepository(object):
         options.add('%s%s%s' % (start, '...' if symmetric else '..', end))
         options.add_cond(thread, '--thread=%s' % thread, '--no-thread')
 
-        output, ret = self._git_getoutput('format-patch', options.args)
-        return [line.strip() for line in output]
+        patches = []
+        try:
+            for line in self._git_iter_lines('format-patch', options.args):
+                patches.append(line.strip())
+        except GitRepositoryError:
+            pass
+        return patches
+
+    def apply_patch(self, patch, index=True, context=None, strip=None, fix_ws=False,
+                    cached=False, index_file=None, check=False):
+        """
+        Apply a patch using git apply
 
-    def apply_patch(self, patch, index=True, context=None, strip=None, fix_ws=False):
-        """Apply a patch using git apply"""
+        @param cached: only apply the patch to the index, leave the
+            working copy alone
+        @type cached: C{bool}
+        @param index_file: alternate index file to apply the patch to
+        @type index_file: C{str}
+        @param check: only check if the patch applies
+        @type check: C{bool}
+        """
         args = []
         if context:
             args += ['-C', context]
-        if index:
+        if cached:
+            args.append("--cached")
+        elif index:
             args.append("--index")
+        if check:
+            args.append("--check")
         if fix_ws:
             args.append("--whitespace=fix")
         if strip is not None:
             args += ['-p', str(strip)]
         args.append(patch)
-        self._git_command("apply", args)
+        extra_env = {'GIT_INDEX_FILE': index_file} if index_file else None
+        self._git_command("apply", args, extra_env=extra_env)
 
     def diff(self, obj1, obj2=None, paths=None, stat=False, summary=False,
              text=False, ignore_submodules=True, abbrev=None, renames=False,
@@ -1775,6 +2457,22 @@ class GitRepository(object):
         @return: diff
         @rtype: C{binary}
         """
+        options, config_args = self._diff_args(stat, summary, text, ignore_submodules,
+                                               abbrev, renames, copies)
+        options.add(obj1)
+        options.add_true(obj2, obj2)
+        if paths:
+            options.add('--', paths)
+        output, stderr, ret = self._git_inout('diff',
+                                              options.args,
+                                              config_args=config_args.args)
+        if ret:
+            raise GitRepositoryError("Git diff failed")
+        return output
+
+    @staticmethod
+    def _diff_args(stat, summary, text, ignore_submodules, abbrev, renames, copies):
+        """Build the options and config arguments for patch output, see L{diff}"""
         options = GitArgs('-p', '--no-ext-diff')
         config_args = GitArgs()
         if stat is True:
@@ -1796,19 +2494,75 @@ class GitRepository(object):
             options.add('-M%s', renames)
         # Reduce churn if different users configured different diff algorithms.
         options.add('--diff-algorithm=default')
-        options.add(obj1)
-        options.add_true(obj2, obj2)
-        if paths:
-            options.add('--', paths)
         if abbrev is not None:
             config_args.add('core.abbrev=%d' % abbrev)
         config_args.add('diff.noprefix=false')
-        output, stderr, ret = self._git_inout('diff',
-                                              options.args,
-                                              config_args=config_args.args)
-        if ret:
-            raise GitRepositoryError("Git diff failed")
-        return output
+        return options, config_args
+
+    def iter_commit_diffs(self, since, until, stat=False, summary=False, text=False,
+                          ignore_submodules=True, abbrev=None, renames=False,
+                          copies=False, reverse=False):
+        """
+        Look up data and diff of all commits from since to until using a
+        single git process. Each diff is the same as L{diff}'s output for
+        I{<commit>^!} with the same options.
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @param reverse: yield the oldest commit first
+        @type reverse: C{bool}
+        @return: commit information as returned by L{get_commit_info} with
+            the commit's SHA1 as I{id} but without I{files} and the
+            commit's diff
+        @rtype: generator of C{tuple} of C{dict} and C{bytes}
+
+        See L{diff} for the other parameters.
+        """
+        # Diff output lines never start with the marker so it separates
+        # the commits
+        marker = 'gbp-commit-%s' % uuid.uuid4().hex
+        options, config_args = self._diff_args(stat, summary, text, ignore_submodules,
+                                               abbrev, renames, copies)
+        args = GitArgs('--format=format:%s%%H%%x00%%P%%x00%s' % (marker, self._commit_info_format),
+                       '--date=raw', '--no-show-signature')
+        args.add(options.args)
+        args.add_true(reverse, '--reverse')
+        args.add(self._commit_range_args(since, until, None, 0, False, None))
+
+        records = self._git_iter_lines('log', args.args, sep=b'\n' + marker.encode(),
+                                       config_args=config_args.args)
+        try:
+            for record in records:
+                if record.startswith(marker.encode()):
+                    # First commit
+                    record = record[len(marker):]
+                fields = record.split(b'\x00', 11)
+                if len(fields) != 12:
+                    raise GitRepositoryError("Unexpected output of git log")
+                sha1, parents = fields[0].decode(), fields[1].split()
+                info = self._commit_info_from_fields(sha1, fields[2:11], None)
+                del info['files']
+                if len(parents) > 1:
+                    # Merges don't have a diff in git log
+                    diff = self.diff('%s^!' % sha1, stat=stat, summary=summary, text=text,
+                                     ignore_submodules=ignore_submodules, abbrev=abbrev,
+                                     renames=renames, copies=copies)
+                else:
+                    # The diff is separated from the commit message by
+                    # a '---' line if there's a diffstat, an empty line
+                    # otherwise
+                    diff = fields[11]
+                    for sep in [b'---\n', b'\n']:
+                        if diff.startswith(sep):
+                            diff = diff[len(sep):]
+                            break
+                yield info, diff
+        except GitRepositoryError as err:
+            raise GitRepositoryError("Error getting diffs %s..%s: %s" % (since, until, err))
+        finally:
+            records.close()
 
     def diff_status(self, obj1, obj2):
         """
@@ -1836,6 +2590,36 @@ class GitRepository(object):
             result[status].append(filepath)
 
         return result
+
+    def diff_tree(self, tree1, tree2, recurse=True):
+        """
+        Compare two trees without looking at the working copy
+
+        @param tree1: the old tree
+        @type tree1: C{str}
+        @param tree2: the new tree
+        @type tree2: C{str}
+        @param recurse: whether to descend into subtrees
+        @type recurse: C{bool}
+        @return: old mode, new mode, old SHA1, new SHA1, status and path
+            of each changed entry. Renames are reported as deletion and
+            addition.
+        @rtype: C{list} of C{tuple}s
+        @raises GitRepositoryError: if the trees can't be compared
+        """
+        args = GitArgs('-z', '--no-renames')
+        args.add_true(recurse, '-r')
+        args.add(tree1, tree2, '--')
+        out, err, ret = self._git_inout('diff-tree', args.args, capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to diff %s and %s: %s" %
+                                     (tree1, tree2, err.decode().strip()))
+        changes = []
+        elements = out.split(b'\x00')
+        while len(elements) > 1:
+            old_mode, new_mode, old_sha, new_sha, status = elements.pop(0).decode()[1:].split()
+            changes.append((old_mode, new_mode, old_sha, new_sha, status, elements.pop(0)))
+        return changes
 #}
 
     def archive(self, format, prefix, output, treeish, cwd=None):
@@ -1890,6 +2674,10 @@ class GitRepository(object):
         @rtype: C{bool}
         """
         if treeish:
+            try:
+                return self._cat_file('%s:.gitmodules' % treeish) is not None
+            except CatFileError:
+                pass
             try:
                 self.show('%s:.gitmodules' % treeish)
             except GitRepositoryError:
@@ -1928,7 +2716,8 @@ class GitRepository(object):
         if not fetch:
             args.append("--no-fetch")
 
-        self._git_command("submodule", args)
+        with self._submodule_lock:
+            self._git_command("submodule", args)
 
     def get_submodules(self, treeish, path=None, recursive=True):
         """
@@ -1944,22 +2733,30 @@ class GitRepository(object):
         if path is None:
             path = self.path
 
-        args = [treeish]
-        if recursive:
-            args += ['-r']
+        if path == self.path:
+            try:
+                entries = [(mode, objtype, commit, name.decode())
+                           for (mode, objtype, commit, name)
+                           in self._ls_tree(treeish, recurse=recursive)]
+            except GitRepositoryError as err:
+                raise GitRepositoryError("Failed to list submodules of %s: %s" %
+                                         (treeish, err))
+        else:
+            # Submodule commits need to be looked up in the submodule
+            args = [treeish]
+            if recursive:
+                args += ['-r']
 
-        out, err, ret = self._git_inout('ls-tree',
-                                        args,
-                                        cwd=path,
-                                        capture_stderr=True)
-        if ret:
-            raise GitRepositoryError("Failed to list submodules of %s: %s" %
-                                     (treeish, err.decode().strip()))
-        for line in out.split(b'\n'):
-            if not line:
-                continue
-            mode, objtype, commit, name = line.decode().split(None, 3)
+            out, err, ret = self._git_inout('ls-tree',
+                                            args,
+                                            cwd=path,
+                                            capture_stderr=True)
+            if ret:
+                raise GitRepositoryError("Failed to list submodules of %s: %s" %
+                                         (treeish, err.decode().strip()))
+            entries = [line.decode().split(None, 3) for line in out.split(b'\n') if line]
 
+        for mode, objtype, commit, name in entries:
             # A submodules is shown as "commit" object in ls-tree:
             if objtype == "commit":
                 nextpath = os.path.join(path, name)
@@ -0,0 +1,635 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Parse mail and patch headers like I{git mailinfo -k}
+
+This follows git's mailinfo.c closely, including its quirks, so the
+result is byte for byte what git would output. Input that needs more
+than that (multipart MIME, NUL bytes, charsets unknown to Python) isn't
+handled, callers are expected to fall back to git in that case.
+"""
+
+HEADERS = ['From', 'Subject', 'Date']
+SPACE = b' \t\n\r'
+
+FORMAT_PATCH_SEPARATOR = b"From e6807f3efca28b30decfecb1732a56c7db1137ee Mon Sep 17 00:00:00 2001\n"
+
+
+class Unsupported(Exception):
+    """The input needs features not handled here"""
+    pass
+
+
+def _isspace(c):
+    return c in SPACE
+
+
+def _skip_header(line, hdr):
+    """
+    Get the value of header I{hdr} from I{line}
+
+    >>> _skip_header(b'subject:  foo', 'Subject')
+    b'foo'
+    >>> _skip_header(b'Subjects: foo', 'Subject')
+    """
+    if line[:len(hdr)].lower() != hdr.lower().encode() or line[len(hdr):len(hdr) + 1] != b':':
+        return None
+    return line[len(hdr) + 1:].lstrip(SPACE)
+
+
+def _is_rfc2822_header(line):
+    """
+    >>> _is_rfc2822_header(b'X-Foo: bar')
+    True
+    >>> _is_rfc2822_header(b'From me Mon Sep 17 00:00:00 2001')
+    True
+    >>> _is_rfc2822_header(b'no header: bar')
+    False
+    """
+    if line.startswith(b'From ') or line.startswith(b'>From '):
+        return True
+    for c in line:
+        if c == ord(':'):
+            return True
+        if 33 <= c <= 57 or 59 <= c <= 126:
+            continue
+        break
+    return False
+
+
+def _cleanup_space(value):
+    """
+    Collapse whitespace into a single blank
+
+    >>> _cleanup_space(b' a \\t\\n b ')
+    b' a b '
+    """
+    out = bytearray()
+    space = False
+    for c in value:
+        if _isspace(c):
+            if not space:
+                out.append(ord(' '))
+            space = True
+        else:
+            out.append(c)
+            space = False
+    return bytes(out)
+
+
+def _hexval(c):
+    if ord('0') <= c <= ord('9'):
+        return c - ord('0')
+    if ord('a') <= c <= ord('f'):
+        return c - ord('a') + 10
+    if ord('A') <= c <= ord('F'):
+        return c - ord('A') + 10
+    return -1
+
+
+def decode_q_segment(data, rfc2047):
+    """
+    Decode quoted printable data
+
+    >>> decode_q_segment(b'a=3Db_c', True)
+    b'a=b c'
+    >>> decode_q_segment(b'soft=\\n', False)
+    b'soft'
+    >>> decode_q_segment(b'keep=zz', False)
+    b'keep=zz'
+    """
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        c = data[i]
+        i += 1
+        if c == ord('='):
+            if i >= len(data) or data[i] == ord('\n'):
+                break  # drop trailing newline
+            if i + 1 < len(data):
+                hi, lo = _hexval(data[i]), _hexval(data[i + 1])
+                if hi >= 0 and lo >= 0:
+                    out.append(hi << 4 | lo)
+                    i += 2
+                    continue
+        if rfc2047 and c == ord('_'):
+            c = ord(' ')
+        out.append(c)
+    return bytes(out)
+
+
+def decode_b_segment(data):
+    """
+    Decode base64 data ignoring any garbage
+
+    >>> decode_b_segment(b'Zm9v\\nYmFy=')
+    b'foobar'
+    """
+    out = bytearray()
+    pos = acc = 0
+    for c in data:
+        if c == ord('+'):
+            c = 62
+        elif c == ord('/'):
+            c = 63
+        elif ord('A') <= c <= ord('Z'):
+            c -= ord('A')
+        elif ord('a') <= c <= ord('z'):
+            c -= ord('a') - 26
+        elif ord('0') <= c <= ord('9'):
+            c -= ord('0') - 52
+        else:
+            continue
+        if pos == 0:
+            acc = c << 2
+        elif pos == 1:
+            out.append((acc | c >> 4) & 0xff)
+            acc = (c & 15) << 4
+        elif pos == 2:
+            out.append((acc | c >> 2) & 0xff)
+            acc = (c & 3) << 6
+        else:
+            out.append((acc | c) & 0xff)
+            acc = pos = 0
+            continue
+        pos += 1
+    return bytes(out)
+
+
+def convert_to_utf8(data, charset):
+    """
+    Recode I{data} from I{charset} to UTF-8
+
+    >>> convert_to_utf8(b'\\xfc', b'ISO-8859-1')
+    b'\\xc3\\xbc'
+    >>> convert_to_utf8(b'\\xfc', b'')
+    b'\\xfc'
+    """
+    if not charset or charset.lower() in [b'utf-8', b'utf8']:
+        return data
+    try:
+        return data.decode(charset.decode('ascii')).encode('utf-8')
+    except (LookupError, UnicodeError):
+        # Let git sort out charsets Python doesn't know and
+        # report conversion errors
+        raise Unsupported("Can't convert from '%s'" % charset.decode('ascii', 'replace'))
+
+
+def decode_header(value):
+    """
+    Decode RFC 2047 encoded words, whitespace between two of them gets
+    dropped. git fails on malformed encoded words so we don't handle them.
+
+    >>> decode_header(b'=?UTF-8?q?Andr=C3=A9?= =?ISO-8859-1?B?/A==?= <a@b>')
+    b'Andr\\xc3\\xa9\\xc3\\xbc <a@b>'
+    >>> decode_header(b'=?UTF-8?x?foo?=')
+    Traceback (most recent call last):
+    ...
+    gbp.mailinfo.Unsupported: Malformed encoded word
+    """
+    out = bytearray()
+    pos = 0
+    while True:
+        start = value.find(b'=?', pos)
+        if start < 0:
+            break
+        if pos != start:
+            # Keep what's before the encoded word unless it's just
+            # whitespace following another encoded word
+            if value[pos:start].strip(SPACE) or pos == 0:
+                out += value[pos:start]
+        cp = value.find(b'?', start + 2)
+        if cp < 0 or cp + 3 > len(value):
+            raise Unsupported("Malformed encoded word")
+        charset = value[start + 2:cp]
+        encoding = value[cp + 1:cp + 2].lower()
+        if not encoding or value[cp + 2:cp + 3] != b'?':
+            raise Unsupported("Malformed encoded word")
+        end = value.find(b'?=', cp + 3)
+        if end < 0:
+            raise Unsupported("Malformed encoded word")
+        if encoding == b'b':
+            decoded = decode_b_segment(value[cp + 3:end])
+        elif encoding == b'q':
+            decoded = decode_q_segment(value[cp + 3:end], True)
+        else:
+            raise Unsupported("Malformed encoded word")
+        out += convert_to_utf8(decoded, charset)
+        pos = end + 2
+    out += value[pos:]
+    return bytes(out)
+
+
+def _slurp_attr(value, name):
+    """
+    >>> _slurp_attr(b'text/plain; Charset="utf-8"', b'charset=')
+    b'utf-8'
+    >>> _slurp_attr(b'text/plain; charset=us-ascii; format=flowed', b'charset=')
+    b'us-ascii'
+    """
+    pos = value.lower().find(name)
+    if pos < 0:
+        return None
+    value = value[pos + len(name):]
+    ends = b'"' if value.startswith(b'"') else b'; \t'
+    if value.startswith(b'"'):
+        value = value[1:]
+    for i, c in enumerate(value):
+        if c in ends:
+            return value[:i]
+    return value
+
+
+def _unquote_quoted_pair(value):
+    """
+    Remove quotes and backslash escapes
+
+    >>> _unquote_quoted_pair(b'"Doe, John" (the \\\\(real\\\\) one) <j@d>')
+    b'Doe, John (the (real) one) <j@d>'
+    """
+    out = bytearray()
+    i = 0
+    while i < len(value):
+        c = value[i]
+        i += 1
+        if c == ord('"'):
+            literally = False
+            while i < len(value):
+                c = value[i]
+                i += 1
+                if literally:
+                    literally = False
+                elif c == ord('\\'):
+                    literally = True
+                    continue
+                elif c == ord('"'):
+                    break
+                out.append(c)
+            continue
+        elif c == ord('('):
+            out.append(c)
+            literally = False
+            depth = 1
+            while i < len(value):
+                c = value[i]
+                i += 1
+                if literally:
+                    literally = False
+                elif c == ord('\\'):
+                    literally = True
+                    continue
+                elif c == ord('('):
+                    depth += 1
+                elif c == ord(')'):
+                    depth -= 1
+                    if not depth:
+                        out.append(c)
+                        break
+                out.append(c)
+            continue
+        out.append(c)
+    return bytes(out)
+
+
+def _sane_name(name, email):
+    if not name or len(name) > 60 or any(c in name for c in b'@<>'):
+        return email
+    return name
+
+
+def parse_from(value):
+    """
+    Split a From: header into name and email like git does
+
+    >>> parse_from(b'John Doe <john@example.com>')
+    (b'John Doe', b'john@example.com')
+    >>> parse_from(b'john@example.com (John Doe)')
+    (b'John Doe', b'john@example.com')
+    >>> parse_from(b'John Doe <john>')
+    (b'John Doe', b'john')
+    >>> parse_from(b'john@example.com')
+    (b'john@example.com', b'john@example.com')
+    """
+    f = _unquote_quoted_pair(value)
+    at = f.find(b'@')
+    if at < 0:
+        bra = value.find(b'<')
+        if bra < 0:
+            return b'', b''
+        ket = value.find(b'>', bra)
+        if ket < 0:
+            return b'', b''
+        email = value[bra + 1:ket]
+        return _sane_name(value[:bra].strip(SPACE), email), email
+
+    f = bytearray(f)
+    while at > 0:
+        c = f[at - 1]
+        if _isspace(c):
+            break
+        if c == ord('<'):
+            f[at - 1] = ord(' ')
+            break
+        at -= 1
+    end = at
+    while end < len(f) and f[end] not in b' \n\t\r\v\f>':
+        end += 1
+    email = bytes(f[at:end])
+    del f[at:end + 1 if end < len(f) else end]
+
+    name = _cleanup_space(bytes(f)).strip(SPACE)
+    if name.startswith(b'(') and name.endswith(b')'):
+        name = name[1:-1]
+    return _sane_name(name, email), email
+
+
+def _is_format_patch_separator(line):
+    """
+    >>> _is_format_patch_separator(FORMAT_PATCH_SEPARATOR)
+    True
+    """
+    if len(line) != len(FORMAT_PATCH_SEPARATOR) or not line.startswith(b'From '):
+        return False
+    sha1 = line[5:45]
+    if len(sha1.strip(b'0123456789abcdef')):
+        return False
+    return line[45:] == FORMAT_PATCH_SEPARATOR[45:]
+
+
+def _patchbreak(line):
+    """
+    >>> _patchbreak(b'diff --git a/foo b/foo\\n')
+    True
+    >>> _patchbreak(b'--- a/foo\\n')
+    True
+    >>> _patchbreak(b'---  \\n')
+    True
+    >>> _patchbreak(b'----\\n')
+    False
+    """
+    if line.startswith(b'diff -') or line.startswith(b'Index: '):
+        return True
+    if len(line) < 4 or not line.startswith(b'---'):
+        return False
+    if line[3:4] == b' ' and not _isspace(line[4]):
+        return True
+    for c in line[3:]:
+        if c == ord('\n'):
+            return True
+        if not _isspace(c):
+            break
+    return False
+
+
+class _MailInfo(object):
+    """The state kept while parsing a mail"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.last_header = b''
+        # Headers from the mail header and from the body
+        self.p_hdr = {}
+        self.s_hdr = {}
+        self.charset = b''
+        self.transfer_encoding = None
+        self.header_stage = True
+        self.inbody_header_accum = b''
+        self.filter_stage = 0
+        self.patch_lines = 0
+        self.log_message = bytearray()
+
+    def _getline(self):
+        """Read the next line including the newline, C{None} on EOF"""
+        if self.pos >= len(self.data):
+            return None
+        end = self.data.find(b'\n', self.pos)
+        end = len(self.data) if end < 0 else end + 1
+        line = self.data[self.pos:end]
+        self.pos = end
+        return line
+
+    def _peek(self):
+        return self.data[self.pos] if self.pos < len(self.data) else None
+
+    def read_one_header_line(self):
+        """
+        Read a header with all its continuation lines
+
+        @return: whether we're still in the header and the line read
+        """
+        line = self._getline()
+        if line is None:
+            # Like git we hand the last header line on to the body
+            return False, self.last_header
+        line = line.rstrip(SPACE)
+        if not line or not _is_rfc2822_header(line):
+            return False, line + b'\n'
+        while self._peek() in [ord(' '), ord('\t')]:
+            continuation = self._getline()
+            if continuation.endswith(b'\n'):
+                continuation = continuation[:-1]
+            line += (b' ' + continuation[1:]).rstrip(SPACE)
+        self.last_header = line
+        return True, line
+
+    def check_header(self, line, hdr_data, overwrite):
+        for hdr in HEADERS:
+            if hdr in hdr_data and not overwrite:
+                continue
+            value = _skip_header(line, hdr)
+            if value is not None:
+                hdr_data[hdr] = decode_header(value)
+                return True
+
+        value = _skip_header(line, 'Content-Type')
+        if value is not None:
+            value = decode_header(value)
+            if _slurp_attr(value, b'boundary=') is not None:
+                raise Unsupported("Multipart messages")
+            self.charset = _slurp_attr(value, b'charset=') or b''
+            return True
+        value = _skip_header(line, 'Content-Transfer-Encoding')
+        if value is not None:
+            value = decode_header(value).lower()
+            if b'base64' in value:
+                self.transfer_encoding = 'base64'
+            elif b'quoted-printable' in value:
+                self.transfer_encoding = 'qp'
+            else:
+                self.transfer_encoding = None
+            return True
+        return _skip_header(line, 'Message-ID') is not None
+
+    def flush_inbody_header_accum(self):
+        if self.inbody_header_accum:
+            self.check_header(self.inbody_header_accum, self.s_hdr, False)
+            self.inbody_header_accum = b''
+
+    def check_inbody_header(self, line):
+        if self.inbody_header_accum and line[:1] in [b' ', b'\t']:
+            if self.inbody_header_accum.endswith(b'\n'):
+                self.inbody_header_accum = self.inbody_header_accum[:-1]
+            self.inbody_header_accum += line
+            return True
+
+        self.flush_inbody_header_accum()
+
+        if line.startswith(b'>From') and _isspace(line[5:6] or b'\0'):
+            return _is_format_patch_separator(line[1:])
+        if line.startswith(b'[PATCH]') and _isspace(line[7:8] or b'\0'):
+            self.s_hdr['Subject'] = line
+            return True
+        for hdr in HEADERS:
+            if hdr not in self.s_hdr and _skip_header(line, hdr) is not None:
+                self.inbody_header_accum += line
+                return True
+        return False
+
+    def handle_commit_msg(self, line):
+        if self.header_stage and line in [b'', b'\n']:
+            if self.inbody_header_accum:
+                self.flush_inbody_header_accum()
+                self.header_stage = False
+            return False
+
+        if self.header_stage:
+            self.header_stage = self.check_inbody_header(line)
+            if self.header_stage:
+                return False
+
+        line = convert_to_utf8(line, self.charset)
+        if _patchbreak(line):
+            return True
+        self.log_message += line
+        return False
+
+    def handle_filter(self, line):
+        if self.filter_stage == 0:
+            if not self.handle_commit_msg(line):
+                return
+            self.filter_stage = 1
+        self.patch_lines += 1
+
+    def handle_body(self, line):
+        prev = b''
+        while line is not None:
+            if self.transfer_encoding == 'qp':
+                line = decode_q_segment(line, False)
+            elif self.transfer_encoding == 'base64':
+                line = decode_b_segment(line)
+
+            if self.transfer_encoding:
+                # Decoded lines may contain multiple newlines or only
+                # part of a line
+                line = prev + line
+                prev = b''
+                chunks = self._split_lf(line)
+                for i, chunk in enumerate(chunks):
+                    if i == len(chunks) - 1 and not chunk.endswith(b'\n'):
+                        prev = chunk
+                        break
+                    self.handle_filter(chunk)
+            else:
+                self.handle_filter(line)
+            line = self._getline()
+
+        if prev:
+            self.handle_filter(prev)
+        self.flush_inbody_header_accum()
+
+    @staticmethod
+    def _split_lf(data):
+        """
+        Split at LF only keeping the line ends
+
+        >>> _MailInfo._split_lf(b'a\\rb\\nc')
+        [b'a\\rb\\n', b'c']
+        """
+        chunks = []
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start)
+            end = len(data) if end < 0 else end + 1
+            chunks.append(data[start:end])
+            start = end
+        return chunks
+
+    def info(self):
+        out = bytearray()
+        for hdr in HEADERS:
+            if self.patch_lines and hdr in self.s_hdr:
+                value = self.s_hdr[hdr]
+            elif hdr in self.p_hdr:
+                value = self.p_hdr[hdr]
+            else:
+                continue
+            if b'\0' in value:
+                raise Unsupported("NUL byte in '%s'" % hdr)
+
+            if hdr == 'Subject':
+                for line in value.split(b'\n'):
+                    out += b'Subject: %s\n' % line
+            elif hdr == 'From':
+                name, email = parse_from(_cleanup_space(value))
+                out += b'Author: %s\nEmail: %s\n' % (name, email)
+            else:
+                out += b'%s: %s\n' % (hdr.encode(), _cleanup_space(value))
+        out += b'\n'
+        return bytes(out)
+
+    def parse(self):
+        # Skip leading whitespace
+        while self._peek() is not None and _isspace(self._peek()):
+            self.pos += 1
+
+        in_header, line = self.read_one_header_line()
+        while in_header:
+            self.check_header(line, self.p_hdr, True)
+            in_header, line = self.read_one_header_line()
+
+        self.handle_body(line)
+        return self.info(), bytes(self.log_message)
+
+
+def mailinfo(data):
+    """
+    Parse a mail or patch header like I{git mailinfo -k} does
+
+    >>> info, msg = mailinfo(b'From: Foo Bar <foo@example.com>\\n'
+    ...                      b'Subject: =?UTF-8?q?Fix_b=C3=BCg?=\\n\\nLong\\n---\\n')
+    >>> print(info.decode(), end='')
+    Author: Foo Bar
+    Email: foo@example.com
+    Subject: Fix büg
+    <BLANKLINE>
+    >>> msg
+    b'Long\\n'
+    >>> mailinfo(b'Content-Type: multipart/mixed; boundary="xyz"\\n\\n')
+
+    @param data: the mail
+    @type data: C{bytes}
+    @return: the information git mailinfo prints and the message body or
+        C{None} if the mail can't be handled here
+    @rtype: C{tuple} of C{bytes} or C{None}
+    """
+    if b'\0' in data:
+        return None
+    try:
+        return _MailInfo(data).parse()
+    except Unsupported:
+        return None
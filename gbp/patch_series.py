@@ -22,6 +22,7 @@ import re
 import tempfile
 from gbp.errors import GbpError
 from gbp.git.repository import GitRepository
+from gbp.mailinfo import mailinfo
 
 VALID_DEP3_ENDS = re.compile(r'(?:---|\*\*\*|Index:)[ \t][^ \t]|^diff -|^---')
 
@@ -39,8 +40,11 @@ class Patch(object):
     @ivar info: Information retrieved from a RFC822 style patch header
     @type info: C{dict} with C{str} keys and values
     @ivar long_desc: the long description of the patch
+    @cvar git_mailinfo: parse the patch header using I{git mailinfo}
+        instead of L{gbp.mailinfo}
     """
     patch_exts = ['diff', 'patch']
+    git_mailinfo = False
 
     def __init__(self, path, topic=None, strip=None):
         self.path = path
@@ -59,19 +63,18 @@ class Patch(object):
         return repr
 
     def _read_info(self):
-        self._read_git_mailinfo()
+        self._read_mailinfo()
 
-    def _read_git_mailinfo(self):
+    def _read_mailinfo(self):
         """
         Read patch information into a structured form
 
-        using I{git mailinfo}
+        using L{gbp.mailinfo} or I{git mailinfo} for anything it
+        can't handle
         """
         self.info = {}
         self.long_desc = ''
 
-        body = tempfile.NamedTemporaryFile(prefix='gbp_')
-
         # No patch yet, file name information only
         if not os.path.exists(self.path):
             return
@@ -84,18 +87,11 @@ class Patch(object):
             toparse.append(line)
 
         input = b''.join(toparse)
-        if input.strip():
-            out, err, ret = GitRepository.git_inout(command='mailinfo',
-                                                    args=['-k', body.name, '/dev/null'],
-                                                    input=input,
-                                                    extra_env=None,
-                                                    cwd=None,
-                                                    capture_stderr=True)
-            if ret != 0:
-                raise GbpError("Failed to read patch header of '%s': %s" %
-                               (self.path, err))
+        if not input.strip():
+            out, body = b'', b''
         else:
-            out = b''
+            parsed = None if self.git_mailinfo else mailinfo(input)
+            out, body = parsed or self._run_git_mailinfo(input)
 
         # Header
         for line in out.decode().split('\n'):
@@ -104,15 +100,32 @@ class Patch(object):
                 header = rfc_header[:-1].lower()
                 self.info[header] = value.strip()
         # Body
+        self.long_desc = body.decode("utf-8", "backslashreplace")
+
+    def _run_git_mailinfo(self, input):
+        """
+        Parse a patch header using I{git mailinfo}
+
+        @return: git mailinfo's output and the message body
+        @rtype: C{tuple} of C{bytes}
+        """
+        body = tempfile.NamedTemporaryFile(prefix='gbp_')
         try:
-            self.long_desc = "".join([li.decode("utf-8", "backslashreplace") for li in body])
-        except (IOError, UnicodeDecodeError) as msg:
+            out, err, ret = GitRepository.git_inout(command='mailinfo',
+                                                    args=['-k', body.name, '/dev/null'],
+                                                    input=input,
+                                                    extra_env=None,
+                                                    cwd=None,
+                                                    capture_stderr=True)
+            if ret != 0:
+                raise GbpError("Failed to read patch header of '%s': %s" %
+                               (self.path, err))
+            return out, body.read()
+        except IOError as msg:
             raise GbpError("Failed to read patch header of '%s': %s" %
                            (self.path, msg))
         finally:
             body.close()
-            if os.path.exists(body.name):
-                os.unlink(body.name)
 
     def _get_subject_from_filename(self):
         """
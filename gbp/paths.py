@@ -16,6 +16,8 @@
 #    <http://www.gnu.org/licenses/>
 "Helpers to handle paths"
 
+import os
+
 
 def to_bin(path):
     """Convert to binary if not already
@@ -24,3 +26,27 @@ def to_bin(path):
     it shall still be convenient to pass in unicode strings
     """
     return path.encode() if not isinstance(path, bytes) else path
+
+
+def user_cache_dir():
+    """Directory to cache data across gbp invocations
+
+    This is I{$GBP_CACHE_DIR} if set or I{gbp/} below the XDG cache
+    directory otherwise.
+
+    >>> env_backup = os.environ.copy()
+    >>> os.environ['GBP_CACHE_DIR'] = '/tmp/gbp-cache'
+    >>> user_cache_dir()
+    '/tmp/gbp-cache'
+    >>> del os.environ['GBP_CACHE_DIR']
+    >>> os.environ['XDG_CACHE_HOME'] = '/tmp/xdg'
+    >>> user_cache_dir()
+    '/tmp/xdg/gbp'
+    >>> os.environ.clear()
+    >>> os.environ.update(env_backup)
+    """
+    cache_dir = os.getenv('GBP_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+    xdg_cache_home = os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(xdg_cache_home, 'gbp')
@@ -0,0 +1,348 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Run pipelines of external commands
+
+The stages are connected by OS pipes directly, there's no shell
+involved so arguments never need to be quoted::
+
+    pipe = Pipeline(['git', 'archive', '--prefix=foo/', 'HEAD'],
+                    ['xz', '-c'])
+    pipe.run(stdout='foo.tar.xz')
+
+Each stage's exit status and run time is available afterwards.
+"""
+
+import contextlib
+import os
+import shlex
+import subprocess
+import time
+
+import gbp.log
+import gbp.profile
+from gbp.errors import GbpError
+
+
+class PipelineError(GbpError):
+    """
+    A pipeline failed
+
+    @ivar stages: the failed stages
+    @type stages: C{list} of L{Stage}
+    """
+    def __init__(self, msg, stages=None):
+        super().__init__(msg)
+        self.stages = stages or []
+
+
+class Stage(object):
+    """
+    A single command of a L{Pipeline}
+
+    @ivar argv: the command line
+    @type argv: C{list} of C{str}
+    @ivar retcode: the exit status once run, negative if killed
+        by a signal
+    @type retcode: C{int}
+    @ivar time: wall clock time the command ran in seconds
+    @type time: C{float}
+    """
+    def __init__(self, argv, cwd=None, env=None):
+        self.argv = [str(arg) for arg in argv]
+        self.cwd = cwd
+        self.env = env
+        self.retcode = None
+        self.time = None
+        self._proc = None
+        self._started = None
+        self._profile = None
+
+    @property
+    def name(self):
+        return gbp.profile.command_name(self.argv)
+
+    @property
+    def failed(self):
+        return self.retcode not in [None, 0]
+
+    def describe(self):
+        """
+        Describe the stage's exit status
+
+        >>> stage = Stage(['tar', '-xf', 'a b.tar'])
+        >>> stage.retcode = 2
+        >>> stage.describe()
+        "'tar -xf 'a b.tar'' failed with exit code 2"
+        >>> stage.retcode = -13
+        >>> stage.describe()
+        "'tar -xf 'a b.tar'' killed by signal 13"
+        """
+        if self.retcode is not None and self.retcode < 0:
+            status = "killed by signal %d" % -self.retcode
+        else:
+            status = "failed with exit code %s" % self.retcode
+        return "'%s' %s" % (self, status)
+
+    def __str__(self):
+        return shlex.join(self.argv)
+
+    def __repr__(self):
+        return "<Stage %s retcode=%s>" % (self.argv, self.retcode)
+
+    def _start(self, stdin, stdout):
+        gbp.log.debug(self.argv)
+        self._started = time.monotonic()
+        self._profile = gbp.profile.start()
+        self._proc = subprocess.Popen(self.argv, stdin=stdin, stdout=stdout,
+                                      cwd=self.cwd, env=self.env)
+
+    def _wait(self, stdin=None, stdout=None, bytes_in=None):
+        self.retcode = self._proc.wait()
+        self.time = time.monotonic() - self._started
+        if bytes_in is None:
+            bytes_in = _file_size(stdin)
+        gbp.profile.stop(self._profile, self.argv, self.retcode,
+                         bytes_in=bytes_in, bytes_out=_file_size(stdout))
+
+
+class Pipeline(object):
+    """
+    Commands run concurrently with each one's output connected to the
+    next one's input
+    """
+    def __init__(self, *stages):
+        """
+        @param stages: the commands to run
+        @type stages: C{list} of C{str}
+        """
+        self.stages = []
+        for argv in stages:
+            self.append(argv)
+
+    def append(self, argv, cwd=None, extra_env=None):
+        """
+        Add a command to the end of the pipeline
+
+        @param argv: the command and its arguments
+        @type argv: C{list} of C{str}
+        @param cwd: directory to run the command in
+        @type cwd: C{str}
+        @param extra_env: extra environment variables to pass
+        @type extra_env: C{dict}
+        @return: the pipeline
+        @rtype: L{Pipeline}
+        """
+        if isinstance(argv, str):
+            raise TypeError("Pipeline stage must be a list of arguments, not '%s'" % argv)
+        env = None
+        if extra_env is not None:
+            env = os.environ.copy()
+            env.update(extra_env)
+        self.stages.append(Stage(argv, cwd, env))
+        return self
+
+    def __str__(self):
+        """
+        >>> str(Pipeline(['git', 'archive', 'HEAD'], ['xz', '-c']))
+        'git archive HEAD | xz -c'
+        """
+        return ' | '.join(str(stage) for stage in self.stages)
+
+    @property
+    def failed(self):
+        """The stages that failed in the last run"""
+        return [stage for stage in self.stages if stage.failed]
+
+    def run(self, stdin=None, stdout=None, check=True):
+        """
+        Run the pipeline and wait for all commands to finish
+
+        @param stdin: file to read the first command's input from, either
+            a file name or a file object. Defaults to our stdin.
+        @param stdout: file to write the last command's output to, either
+            a file name or a file object. Defaults to our stdout.
+        @param check: whether to raise an exception if a command fails
+        @type check: C{bool}
+        @return: the exit status of each command
+        @rtype: C{list} of C{int}
+        @raises PipelineError: if a command can't be started or (with
+            I{check}) exits non zero
+        """
+        return self._run(stdin, stdout, check)
+
+    def feed(self, data, stdout=None, check=True):
+        """
+        Run the pipeline writing data to the first command's input
+
+        @param data: the input
+        @type data: iterable of C{bytes}
+        @param stdout: file to write the last command's output to, see L{run}
+        @param check: whether to raise an exception if a command fails
+        @type check: C{bool}
+        @return: the exit status of each command
+        @rtype: C{list} of C{int}
+        @raises PipelineError: if a command can't be started or (with
+            I{check}) exits non zero. Exceptions raised while iterating
+            over I{data} are passed on after all commands got killed.
+        """
+        return self._run(subprocess.PIPE, stdout, check, data)
+
+    def _run(self, stdin, stdout, check, data=None):
+        if not self.stages:
+            raise ValueError("Can't run an empty pipeline")
+
+        files = []
+        try:
+            if isinstance(stdin, str):
+                stdin = open(stdin, 'rb')
+                files.append(stdin)
+            if isinstance(stdout, str):
+                stdout = open(stdout, 'wb')
+                files.append(stdout)
+            self._start(stdin, stdout)
+        finally:
+            for f in files:
+                f.close()
+
+        bytes_in = None
+        if data is not None:
+            bytes_in = self._write(data)
+        return self._finish(stdin, stdout, check, bytes_in)
+
+    @contextlib.contextmanager
+    def stream(self, stdin=None, check=True):
+        """
+        Run the pipeline reading the last command's output
+
+        The output should be read until its end, the commands are
+        waited for when leaving the context. If the context is left by an
+        exception all commands get killed.
+
+        >>> with Pipeline(['printf', 'a\\nb\\n'], ['sort', '-r']).stream() as out:
+        ...     out.read()
+        b'b\\na\\n'
+
+        @param stdin: file to read the first command's input from, see L{run}
+        @param check: whether to raise an exception if a command fails
+        @type check: C{bool}
+        @return: the last command's output
+        @rtype: binary file object
+        @raises PipelineError: if a command can't be started or (with
+            I{check}) exits non zero
+        """
+        if not self.stages:
+            raise ValueError("Can't run an empty pipeline")
+
+        files = []
+        try:
+            if isinstance(stdin, str):
+                stdin = open(stdin, 'rb')
+                files.append(stdin)
+            self._start(stdin, subprocess.PIPE)
+        finally:
+            for f in files:
+                f.close()
+
+        output = self.stages[-1]._proc.stdout
+        try:
+            yield output
+        except BaseException:
+            for stage in self.stages:
+                stage._proc.kill()
+            output.close()
+            for stage in self.stages:
+                stage._wait()
+            raise
+        output.close()
+        self._finish(stdin, None, check)
+
+    def _finish(self, stdin, stdout, check, bytes_in=None):
+        """Wait for all stages to exit"""
+        last = len(self.stages) - 1
+        for num, stage in enumerate(self.stages):
+            stage._wait(stdin=stdin if num == 0 else None,
+                        stdout=stdout if num == last else None,
+                        bytes_in=bytes_in if num == 0 else None)
+            gbp.log.debug("'%s' exited with %d after %.3fs" % (stage, stage.retcode, stage.time))
+
+        if check and self.failed:
+            raise PipelineError(", ".join(stage.describe() for stage in self.failed),
+                                self.failed)
+        return [stage.retcode for stage in self.stages]
+
+    def _write(self, data):
+        """Write data to the first stage, a failed stage stops writing"""
+        written = 0
+        pipe = self.stages[0]._proc.stdin
+        try:
+            for chunk in data:
+                pipe.write(chunk)
+                written += len(chunk)
+        except BrokenPipeError:
+            # The stage's exit status tells why
+            pass
+        except BaseException:
+            for stage in self.stages:
+                stage._proc.kill()
+                stage._wait()
+            raise
+        finally:
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+            if hasattr(data, 'close'):
+                data.close()
+        return written
+
+    def _start(self, stdin, stdout):
+        """Start all stages, on errors the started ones are stopped"""
+        for stage in self.stages:
+            stage.retcode = stage.time = stage._proc = None
+
+        prev = stdin
+        last = len(self.stages) - 1
+        try:
+            for num, stage in enumerate(self.stages):
+                try:
+                    stage._start(prev, stdout if num == last else subprocess.PIPE)
+                finally:
+                    # Only the next stage may hold the read end so it
+                    # gets SIGPIPE / EOF as expected
+                    if num:
+                        prev.close()
+                prev = stage._proc.stdout
+        except OSError as err:
+            for stage in self.stages:
+                if stage._proc:
+                    stage._proc.kill()
+                    stage._wait()
+            raise PipelineError("Can't run '%s': %s" % (stage, err))
+
+
+def _file_size(f):
+    if f is None:
+        return 0
+    if not isinstance(f, str):
+        f = getattr(f, 'name', None)
+        if not isinstance(f, str):
+            return 0
+    try:
+        return os.path.getsize(f)
+    except OSError:
+        return 0
@@ -15,8 +15,17 @@
 #    along with this program; if not, please see
 #    <http://www.gnu.org/licenses/>
 
+import copy
+import re
+import tarfile
+
+from gbp.errors import GbpError
 from .compressor import Compressor
 
+# Size of a tar block and of a record (the default blocking factor of 20)
+TAR_BLOCKSIZE = 512
+TAR_RECORDSIZE = 20 * TAR_BLOCKSIZE
+
 
 class Archive(object):
     # Supported archive formats
@@ -78,3 +87,253 @@ class Archive(object):
                             archive_fmt = split[-2]
 
         return (base_name, archive_fmt, compression)
+
+
+def _tar_member_size(header):
+    """
+    Size of a tar member's data including the padding to the next block
+
+    >>> _tar_member_size(b'x' * 124 + b'00000001750\\0' + b'\\0' * 376)
+    1024
+    >>> _tar_member_size(b'x' * 124 + b'\\x80' + (2**33).to_bytes(11, 'big') + b'\\0' * 376)
+    8589934592
+    """
+    field = header[124:136]
+    try:
+        if field[0] & 0x80:
+            # GNU base-256 encoding of large sizes
+            size = int.from_bytes(field[1:], 'big')
+        else:
+            size = int(field.split(b'\0', 1)[0].strip() or b'0', 8)
+    except ValueError:
+        raise GbpError("Invalid tar header: size %r" % field)
+    return -(-size // TAR_BLOCKSIZE) * TAR_BLOCKSIZE
+
+
+def strip_tar_eof(stream, chunk_size=1 << 16):
+    """
+    Read a tar archive from a stream, dropping its end of archive marker
+    (and the padding after it) so other archives can be appended
+
+    The stream is read until its end so its writer doesn't get I{SIGPIPE}.
+
+    @param stream: the tar archive
+    @type stream: binary file object
+    @param chunk_size: size to read at once
+    @type chunk_size: C{int}
+    @return: the archive's members
+    @rtype: generator of C{bytes}
+    @raises GbpError: if the archive is truncated or corrupt
+    """
+    zero_block = bytes(TAR_BLOCKSIZE)
+    skip = 0   # data of the current member not yet passed on
+    buf = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            if buf or skip:
+                raise GbpError("Truncated tar archive")
+            return
+        buf += data
+        pos = 0
+        while True:
+            if skip:
+                passed = min(skip, len(buf) - pos)
+                pos += passed
+                skip -= passed
+                if skip:
+                    break
+            if len(buf) - pos < TAR_BLOCKSIZE:
+                break
+            header = buf[pos:pos + TAR_BLOCKSIZE]
+            if header == zero_block:
+                if pos:
+                    yield buf[:pos]
+                while stream.read(chunk_size):
+                    pass
+                return
+            skip = _tar_member_size(header)
+            pos += TAR_BLOCKSIZE
+        if pos:
+            yield buf[:pos]
+        buf = buf[pos:]
+
+
+def concatenate_tar_streams(streams):
+    """
+    Concatenate tar archives into a single one without temporary files
+
+    >>> import io, tarfile
+    >>> def tar(name, size):
+    ...     out = io.BytesIO()
+    ...     with tarfile.open(fileobj=out, mode='w', format=tarfile.GNU_FORMAT) as t:
+    ...         info = tarfile.TarInfo(name)
+    ...         info.size = size
+    ...         t.addfile(info, io.BytesIO(bytes(size)))
+    ...     return io.BytesIO(out.getvalue())
+    >>> data = b''.join(concatenate_tar_streams([tar('a', 2048), tar('b', 0)]))
+    >>> len(data) % TAR_RECORDSIZE
+    0
+    >>> [(m.name, m.size) for m in tarfile.open(fileobj=io.BytesIO(data))]
+    [('a', 2048), ('b', 0)]
+
+    @param streams: the archives in the order their members should
+        appear in the result
+    @type streams: iterable of binary file objects
+    @return: the resulting archive
+    @rtype: generator of C{bytes}
+    """
+    size = 0
+    for stream in streams:
+        for chunk in strip_tar_eof(stream):
+            size += len(chunk)
+            yield chunk
+    # End of archive marker and padding to a full record like tar does
+    size += 2 * TAR_BLOCKSIZE
+    yield bytes(2 * TAR_BLOCKSIZE + -size % TAR_RECORDSIZE)
+
+
+def _glob_to_re(pattern):
+    """
+    Translate a shell glob to a regular expression the way tar matches
+    exclude patterns: wildcards match slashes too.
+
+    >>> _glob_to_re('a?[!bc]*')
+    'a.[^bc].*'
+    """
+    res = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            res.append('.*')
+        elif c == '?':
+            res.append('.')
+        elif c == '\\' and i < n:
+            res.append(re.escape(pattern[i]))
+            i += 1
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                chars = pattern[i:j].replace('\\', '\\\\')
+                if chars[0] in '!^':
+                    chars = '^' + chars[1:]
+                res.append('[%s]' % chars)
+                i = j + 1
+        else:
+            res.append(re.escape(c))
+    return ''.join(res)
+
+
+def compile_filters(filters):
+    """
+    Compile a list of tar exclude patterns into a single regular
+    expression. Like with I{tar --exclude} a pattern matches a member
+    if it matches any sequence of its path components and members
+    below a matching directory match as well.
+
+    >>> match = compile_filters(['*.o', 'debian', 'doc/*.html']).search
+    >>> [bool(match(name)) for name in ['foo-1.0/src/a.o', 'foo-1.0/debian',
+    ...                                 'foo-1.0/debian/rules', 'foo-1.0/debian.txt',
+    ...                                 'foo-1.0/doc/api/index.html', 'foo-1.0/README']]
+    [True, True, True, False, True, False]
+    >>> compile_filters([]) is None
+    True
+
+    @param filters: the patterns
+    @type filters: C{list} of C{str}
+    @return: the compiled expression, use its I{search} method for matching,
+        or C{None} if there are no filters
+    @rtype: C{re.Pattern}
+    """
+    patterns = [_glob_to_re(f.rstrip('/')) for f in filters if f.rstrip('/')]
+    if not patterns:
+        return None
+    return re.compile('(?:^|/)(?:%s)(?:/|$)' % '|'.join(patterns), re.DOTALL)
+
+
+def filter_tar_stream(stream, filters, chunk_size=1 << 20):
+    """
+    Read a tar archive from a stream and pass on all members not
+    matching I{filters}. Nothing gets written to disk. Hard links to
+    dropped members are dropped as well.
+
+    >>> import io
+    >>> def tar(*names):
+    ...     out = io.BytesIO()
+    ...     with tarfile.open(fileobj=out, mode='w') as t:
+    ...         for name in names:
+    ...             info = tarfile.TarInfo(name)
+    ...             info.size = len(name)
+    ...             t.addfile(info, io.BytesIO(name.encode()))
+    ...     return io.BytesIO(out.getvalue())
+    >>> data = b''.join(filter_tar_stream(tar('a/keep', 'a/drop.o', 'a/x' * 100), ['*.o']))
+    >>> len(data) % TAR_RECORDSIZE
+    0
+    >>> t = tarfile.open(fileobj=io.BytesIO(data))
+    >>> [(m.name[:8], t.extractfile(m).read()[:8]) for m in t]
+    [('a/keep', b'a/keep'), ('a/xa/xa/', b'a/xa/xa/')]
+
+    @param stream: the archive
+    @type stream: binary file object
+    @param filters: tar exclude patterns of the members to drop
+    @type filters: C{list} of C{str}
+    @param chunk_size: size to copy at once
+    @type chunk_size: C{int}
+    @return: the filtered archive
+    @rtype: generator of C{bytes}
+    @raises GbpError: if the archive is truncated or corrupt
+    """
+    excluded = compile_filters(filters)
+    dropped = set()
+    size = 0
+    try:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                if ((excluded and excluded.search(member.name)) or
+                        (member.islnk() and member.linkname in dropped)):
+                    dropped.add(member.name)
+                    continue
+                # Opened before touching the header since reading sparse
+                # members needs their sparse map
+                data = tar.extractfile(member) if member.isreg() else None
+                if member.issparse():
+                    # Store sparse files densely as regular ones
+                    member = copy.copy(member)
+                    member.type = tarfile.REGTYPE
+                    member.sparse = None
+                    member.pax_headers = {k: v for k, v in member.pax_headers.items()
+                                          if not k.startswith('GNU.sparse.')}
+                header = member.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, 'surrogateescape')
+                size += len(header)
+                yield header
+                if data is None:
+                    continue
+                left = member.size
+                while left:
+                    chunk = data.read(min(chunk_size, left))
+                    if not chunk:
+                        raise GbpError("Truncated tar archive")
+                    left -= len(chunk)
+                    size += len(chunk)
+                    yield chunk
+                padding = -member.size % TAR_BLOCKSIZE
+                size += padding
+                yield bytes(padding)
+    except tarfile.TarError as err:
+        raise GbpError("Invalid tar archive: %s" % err)
+    # Consume the padding after the end of archive marker so the
+    # writer doesn't get SIGPIPE
+    while stream.read(chunk_size):
+        pass
+    size += 2 * TAR_BLOCKSIZE
+    yield bytes(2 * TAR_BLOCKSIZE + -size % TAR_RECORDSIZE)
@@ -15,6 +15,9 @@
 #    along with this program; if not, please see
 #    <http://www.gnu.org/licenses/>
 
+import os
+import shutil
+
 
 class Compressor(object):
     # Map frequently used names of compression types to the internal ones:
@@ -31,9 +34,28 @@ class Compressor(object):
             'lzma': 'lzma',
             'xz': 'xz'}
 
-    def __init__(self, type_, level=None):
+    # Multi threaded compressors in order of preference with their
+    # options (thread count gets appended to the last one)
+    ThreadedCmds = {'gzip': [('pigz', '-n -p')],
+                    'bzip2': [('pbzip2', '-p'), ('lbzip2', '-n')],
+                    'xz': [('xz', '-T')]}
+
+    # Decompressors that use more than one thread. lbzip2 decompresses
+    # any bzip2 file in parallel, pbzip2 only the ones it created.
+    ThreadedDecompressCmds = {'gzip': [('pigz', '-d -p')],
+                              'bzip2': [('lbzip2', '-d -n'), ('pbzip2', '-d -p')],
+                              'xz': [('xz', '-d -T')]}
+
+    def __init__(self, type_, level=None, threads=None):
+        """
+        @param type_: compression type
+        @param level: compression level
+        @param threads: number of threads to compress with, C{0} uses
+            all CPUs, C{None} or C{1} use the single threaded tools.
+        """
         self._type = type_
         self._level = int(level) if level not in [None, ''] else None
+        self._threads = int(threads) if threads not in [None, ''] else None
 
     def is_known(self):
         return self.type in self.Opts.keys()
@@ -46,6 +68,13 @@ class Compressor(object):
     def level(self):
         return self._level
 
+    @property
+    def threads(self):
+        """Number of threads to compress with"""
+        if self._threads == 0:
+            return os.cpu_count() or 1
+        return self._threads or 1
+
     @property
     def _level_opt(self):
         return '-%d' % self.level if self.level is not None else ''
@@ -54,16 +83,93 @@ class Compressor(object):
     def _more_opts(self):
         return self.Opts.get(self._type, '')
 
+    def _threaded_cmd(self, cmds=None):
+        """
+        Find a multi threaded compressor
+
+        @param cmds: the tools to look at, defaults to the compressors
+        @type cmds: C{dict}
+        @return: the compressor and its options or C{None} if none is
+            available or needed
+        """
+        if self.threads < 2:
+            return None
+        if cmds is None:
+            cmds = self.ThreadedCmds
+        for cmd, opts in cmds.get(self.type, []):
+            if shutil.which(cmd):
+                return cmd, '%s%d' % (opts, self.threads)
+        return None
+
     def cmdline(self, stdout=True):
         """
+        The compressor's command line. If more than one thread is requested
+        and a multi threaded compressor is available it's used instead of
+        the default one. Its output is independent of the number of threads
+        but differs from the single threaded tool's output.
+
         >>> Compressor('gzip', level=9).cmdline()
         'gzip -9 -n -c'
         >>> Compressor('gzip').cmdline(True)
         'gzip  -n -c'
+        >>> Compressor('xz', level=6, threads=4).cmdline()
+        'xz -6 -T4 -c'
+        >>> Compressor('lzma', threads=4).cmdline()
+        'lzma   -c'
+        >>> Compressor('xz', threads=1).cmdline()
+        'xz   -c'
         """
-        return "%s %s %s %s" % (self.type, self._level_opt, self._more_opts,
+        threaded = self._threaded_cmd()
+        if threaded:
+            cmd, opts = threaded
+        else:
+            cmd, opts = self.type, self._more_opts
+        return "%s %s %s %s" % (cmd, self._level_opt, opts,
                                 "-c" if stdout else '')
 
+    def args(self, stdout=True):
+        """
+        The compressor's command line as argument list
+
+        >>> Compressor('gzip', level=9).args()
+        ['gzip', '-9', '-n', '-c']
+        """
+        return self.cmdline(stdout).split()
+
+    @property
+    def threaded_decompression(self):
+        """Whether a multi threaded decompressor is available and wanted"""
+        return self._threaded_cmd(self.ThreadedDecompressCmds) is not None
+
+    def decompress_cmdline(self, stdout=True):
+        """
+        The decompressor's command line. If more than one thread is
+        requested and a multi threaded decompressor is available it's
+        used instead of the default one.
+
+        >>> Compressor('gzip').decompress_cmdline()
+        'gzip -d -c'
+        >>> Compressor('xz', threads=4).decompress_cmdline()
+        'xz -d -T4 -c'
+        >>> Compressor('bzip2', threads=1).decompress_cmdline(stdout=False)
+        'bzip2 -d'
+        """
+        threaded = self._threaded_cmd(self.ThreadedDecompressCmds)
+        if threaded:
+            cmd, opts = threaded
+        else:
+            cmd, opts = self.type, '-d'
+        return " ".join([cmd, opts] + (["-c"] if stdout else []))
+
+    def decompress_args(self, stdout=True):
+        """
+        The decompressor's command line as argument list
+
+        >>> Compressor('lzma').decompress_args()
+        ['lzma', '-d', '-c']
+        """
+        return self.decompress_cmdline(stdout).split()
+
     def __repr__(self):
         """
         >>> Compressor('gzip').__repr__()
@@ -72,4 +178,5 @@ class Compressor(object):
         "<compressor type='gzip' level=9>"
         """
         level_str = "level=%s" % self.level if self.level is not None else ''
-        return "<compressor type='%s' %s>" % (self.type, level_str)
+        threads_str = " threads=%s" % self._threads if self._threads is not None else ''
+        return "<compressor type='%s' %s%s>" % (self.type, level_str, threads_str)
@@ -18,18 +18,34 @@
 
 import os
 import shutil
+import subprocess
 import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
 
-from gbp.command_wrappers import (CatenateTarArchive, CatenateZipArchive)
+from gbp.command_wrappers import CatenateZipArchive
+from gbp.errors import GbpError
 from gbp.git import GitRepository, GitRepositoryError
 from gbp.deb.pristinetar import DebianPristineTar
-from gbp import pipes
+from gbp.pipeline import Pipeline, PipelineError
+from gbp.pkg.archive import concatenate_tar_streams
 
 import gbp.log
+import gbp.profile
 
 
 class PkgGitRepository(GitRepository):
-    """A git repository that holds the source of a Distro package"""
+    """
+    A git repository that holds the source of a Distro package
+
+    @cvar archive_jobs: number of submodule archives generated in parallel
+    @cvar archive_spool_size: size up to which a submodule's archive is
+        kept in memory until it's written out
+    """
+    archive_jobs = min(os.cpu_count() or 1, 8)
+    archive_spool_size = 16 << 20
 
     def __init__(self, *args, **kwargs):
         super(PkgGitRepository, self).__init__(*args, **kwargs)
@@ -68,11 +84,59 @@ class PkgGitRepository(GitRepository):
         """
         Create a compressed source tree archive with submodules.
 
-        Concatenates the archives generated by git-archive into one and compresses
-        the end result.
+        Tar archives generated by git-archive are concatenated on the fly
+        and piped into the compressor. The submodules' archives are
+        generated in parallel, at most L{archive_jobs} ahead of the one
+        currently written out.
 
         Exception handling is left to the caller.
         """
+        if format != 'tar':
+            return self._archive_comp_submodules_tmp(treeish, output, prefix, comp, format)
+
+        prefix = self.sanitize_prefix(prefix)
+        submodules = self.get_submodules(treeish)
+        with ThreadPoolExecutor(max_workers=self.archive_jobs) as pool:
+            def submodule_archives():
+                pending = deque()
+                for (subdir, commit) in submodules:
+                    tarpath = [subdir, subdir[2:]][subdir.startswith("./")]
+                    gbp.log.debug("Processing submodule %s (%s)" % (subdir, commit[0:8]))
+                    pending.append(pool.submit(self._spool_archive, format,
+                                               '%s%s/' % (prefix, tarpath), commit,
+                                               os.path.join(self.path, subdir)))
+                    if len(pending) > self.archive_jobs:
+                        with pending.popleft().result() as archive:
+                            yield archive
+                while pending:
+                    with pending.popleft().result() as archive:
+                        yield archive
+
+            try:
+                with self._archive_stream(format, prefix, treeish) as main:
+                    data = concatenate_tar_streams(chain([main], submodule_archives()))
+                    if comp and comp.type:
+                        try:
+                            Pipeline(comp.args()).feed(data, stdout=output)
+                        except PipelineError as err:
+                            raise GitRepositoryError("Error creating %s: %s" % (output, err))
+                    else:
+                        with open(output, 'wb') as f:
+                            for chunk in data:
+                                f.write(chunk)
+            except GbpError as err:
+                if not isinstance(err, GitRepositoryError):
+                    err = GitRepositoryError("Error creating %s: %s" % (output, err))
+                raise err
+            finally:
+                pool.shutdown(cancel_futures=True)
+
+    def _archive_comp_submodules_tmp(self, treeish, output, prefix, comp, format):
+        """
+        Create a compressed source tree archive with submodules by
+        appending each submodule's archive to a temporary file.
+        Used for formats that can't be concatenated while streaming.
+        """
         prefix = self.sanitize_prefix(prefix)
         tempdir = tempfile.mkdtemp()
         main_archive = os.path.join(tempdir, "main.%s" % format)
@@ -89,23 +153,63 @@ class PkgGitRepository(GitRepository):
                 gbp.log.debug("Processing submodule %s (%s)" % (subdir, commit[0:8]))
                 self.archive(format=format, prefix='%s%s/' % (prefix, tarpath),
                              output=submodule_archive, treeish=commit, cwd=subdir)
-                if format == 'tar':
-                    CatenateTarArchive(main_archive)(submodule_archive)
-                elif format == 'zip':
-                    CatenateZipArchive(main_archive)(submodule_archive)
+                CatenateZipArchive(main_archive)(submodule_archive)
 
             # compress the output
             if comp and comp.type:
                 # Redirect through stdout directly to the correct output file in
                 # order to avoid determining the output filename of the compressor
-                ret = os.system("%s %s > %s" % (comp.cmdline(), main_archive, output))
-                if ret:
-                    raise GitRepositoryError("Error creating %s: %d" % (output, ret))
+                try:
+                    Pipeline(comp.args()).run(stdin=main_archive, stdout=output)
+                except PipelineError as err:
+                    raise GitRepositoryError("Error creating %s: %s" % (output, err))
             else:
                 shutil.move(main_archive, output)
         finally:
             shutil.rmtree(tempdir)
 
+    @contextmanager
+    def _archive_stream(self, format, prefix, treeish, cwd=None):
+        """
+        Run git-archive
+
+        @return: the archive's data
+        @rtype: binary file object
+        @raises GitRepositoryError: on exit if git-archive failed
+        """
+        cmd = ['git', 'archive', '--format=%s' % format, '--prefix=%s' % prefix, treeish]
+        gbp.log.debug(cmd)
+        self._count_spawn()
+        started = gbp.profile.start()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=cwd or self.path)
+        try:
+            yield proc.stdout
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            ret = proc.wait()
+            gbp.profile.stop(started, cmd, ret)
+        if ret:
+            raise GitRepositoryError("Unable to archive %s: git archive exited with %d" %
+                                     (treeish, ret))
+
+    def _spool_archive(self, format, prefix, treeish, cwd):
+        """
+        Run git-archive, keeping its output in memory, or a temporary
+        file if large.
+        """
+        archive = tempfile.SpooledTemporaryFile(max_size=self.archive_spool_size)
+        try:
+            with self._archive_stream(format, prefix, treeish, cwd) as stream:
+                shutil.copyfileobj(stream, archive, 1 << 16)
+        except BaseException:
+            archive.close()
+            raise
+        archive.seek(0)
+        return archive
+
     def _archive_comp_single(self, treeish, output, prefix, comp, format='tar'):
         """
         Create a compressed source tree archive without submodules
@@ -113,12 +217,14 @@ class PkgGitRepository(GitRepository):
         We have this as a special case since it avoids a temporary file
         """
         prefix = self.sanitize_prefix(prefix)
-        pipe = pipes.Template()
-        pipe.prepend("git archive --format=%s --prefix=%s %s" % (format, prefix, treeish), '.-')
+        pipe = Pipeline()
+        pipe.append(['git', 'archive', '--format=%s' % format, '--prefix=%s' % prefix, treeish],
+                    cwd=self.path)
         if comp and comp.type:
-            pipe.append(comp.cmdline(), '--')
-        ret = pipe.copy('', output)
-        if ret:
-            raise GitRepositoryError("Error creating %s: %d" % (output, ret))
+            pipe.append(comp.args())
+        try:
+            pipe.run(stdout=output)
+        except PipelineError as err:
+            raise GitRepositoryError("Error creating %s: %s" % (output, err))
 
 # vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
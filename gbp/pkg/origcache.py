@@ -0,0 +1,524 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Cache orig tarballs generated from git trees"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import gbp.log
+from gbp.paths import user_cache_dir
+
+# ioctl to share a file's extents with another one (Linux' FICLONE)
+_FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    """
+    Make dst have the same content as src without copying if possible.
+    Tries a reflink and then copies the data. Hardlinks aren't used
+    since they'd let changes to dst leak into src and vice versa.
+
+    @param src: the source file
+    @type src: C{str}
+    @param dst: the destination, replaced if it exists
+    @type dst: C{str}
+    @return: how the file got cloned: I{reflink} or I{copy}
+    @rtype: C{str}
+    """
+    tmp = "%s.gbp-tmp" % dst
+    try:
+        with open(src, 'rb') as s, open(tmp, 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+                method = 'reflink'
+            except OSError:
+                shutil.copyfileobj(s, d, 1 << 20)
+                method = 'copy'
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+    return method
+
+
+class OrigCache(object):
+    """
+    Orig tarballs keyed by what they're generated from
+
+    Tarballs are stored under a key derived from the tree they were
+    generated from and all options influencing their content so a
+    tarball generated from the same tree with the same options can be
+    used instead of generating it again. The least recently used ones
+    are dropped once the cache exceeds its size.
+
+    Cached tarballs are reflinked or copied so the cache and the
+    tarballs handed out never share an inode. The cached ones are made
+    read only.
+    """
+    dirname = 'origs'
+    statsfile = 'stats.json'
+    description = 'Orig tarball cache'
+    entry_name = 'tarballs'
+
+    def __init__(self, path=None, max_size=1024 << 20):
+        """
+        @param path: directory to keep the tarballs in, defaults to
+            I{origs} in L{gbp.paths.user_cache_dir}
+        @type path: C{str}
+        @param max_size: maximum size of all cached tarballs in bytes
+        @type max_size: C{int}
+        """
+        self._path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or os.path.join(user_cache_dir(), self.dirname)
+
+    @staticmethod
+    def key(tree, prefix, format, comp, submodules=None):
+        """
+        Key of a tarball generated from a tree
+
+        >>> from gbp.pkg.compressor import Compressor
+        >>> k = OrigCache.key('a' * 40, 'foo-1.0/', 'tar', Compressor('gzip', 9))
+        >>> len(k)
+        64
+        >>> k == OrigCache.key('a' * 40, 'foo-1.0/', 'tar', Compressor('gzip', 6))
+        False
+
+        @param tree: SHA1 of the tree the tarball is generated from
+        @type tree: C{str}
+        @param prefix: prefix of the tarball's members
+        @type prefix: C{str}
+        @param format: archive format
+        @type format: C{str}
+        @param comp: the compressor
+        @type comp: L{Compressor}
+        @param submodules: the included submodules
+        @type submodules: C{list} of C{tuple} of path and commit SHA1
+        @rtype: C{str}
+        """
+        # The compressor's command line covers the compressor type, level
+        # and the (multi threaded) tool used
+        data = {'tree': tree,
+                'prefix': prefix,
+                'format': format,
+                'compressor': comp.args() if comp and comp.type else None,
+                'submodules': sorted(submodules or [])}
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _entries(self):
+        """
+        @return: all cached tarballs, least recently used first
+        @rtype: C{list} of C{tuple} of path, size and last use
+        """
+        entries = []
+        try:
+            subdirs = os.listdir(self.path)
+        except FileNotFoundError:
+            return entries
+        for subdir in subdirs:
+            subdir = os.path.join(self.path, subdir)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime_ns))
+        return sorted(entries, key=lambda entry: (entry[2], entry[0]))
+
+    def fetch(self, key, output):
+        """
+        Put a cached tarball at output
+
+        @return: C{True} if the tarball was cached, C{False} otherwise
+        @rtype: C{bool}
+        """
+        entry = self._entry(key)
+        try:
+            method = clone_file(entry, output)
+        except FileNotFoundError:
+            self._count('misses')
+            return False
+        except OSError as err:
+            gbp.log.warn("Can't use cached tarball '%s': %s" % (entry, err))
+            self._count('misses')
+            return False
+        # Mark as recently used
+        os.utime(entry)
+        gbp.log.debug("Reused '%s' for '%s' (%s)" % (entry, output, method))
+        self._count('hits')
+        return True
+
+    def store(self, key, output):
+        """
+        Add a tarball to the cache evicting the least recently used
+        ones if it gets too large. Failures are only logged.
+
+        @param key: the tarball's key
+        @type key: C{str}
+        @param output: the tarball
+        @type output: C{str}
+        """
+        if os.path.getsize(output) > self.max_size:
+            gbp.log.debug("Not caching '%s', it's larger than the cache" % output)
+            return
+        entry = self._entry(key)
+        try:
+            self._mkdir(os.path.dirname(entry))
+            clone_file(output, entry)
+            os.chmod(entry, 0o444)
+            os.utime(entry)
+            self.evict()
+        except OSError as err:
+            gbp.log.warn("Can't cache '%s' at '%s': %s" % (output, entry, err))
+
+    def evict(self):
+        """
+        Drop least recently used tarballs until the cache fits its size
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        for path, entry_size, dummy in entries:
+            if size <= self.max_size:
+                break
+            gbp.log.debug("Evicting '%s' from %s" % (path, self.description.lower()))
+            try:
+                self._remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        if evicted:
+            self._update_stats('evictions', evicted)
+
+    @staticmethod
+    def _remove(path):
+        os.unlink(path)
+
+    def clear(self):
+        """
+        Drop all cached tarballs and statistics
+        """
+        if os.path.isdir(self.path):
+            _rmtree(self.path)
+
+    def _mkdir(self, path):
+        # Create our own directories but not a missing $HOME
+        dirs = []
+        while not os.path.isdir(path) and path != self.path:
+            dirs.insert(0, path)
+            path = os.path.dirname(path)
+        if not os.path.isdir(self.path):
+            cache_dir = os.path.dirname(self.path)
+            if not os.path.isdir(cache_dir):
+                if not os.path.isdir(os.path.dirname(cache_dir)):
+                    raise OSError(errno.ENOENT, "Missing parent directory", cache_dir)
+                os.mkdir(cache_dir)
+            os.mkdir(self.path)
+        for d in dirs:
+            os.mkdir(d)
+
+    def _load_stats(self):
+        try:
+            with open(os.path.join(self.path, self.statsfile)) as f:
+                stats = json.load(f)
+            if isinstance(stats, dict):
+                return stats
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _count(self, counter, num=1):
+        with self._lock:
+            self._update_stats(counter, num)
+
+    def _update_stats(self, counter, num):
+        stats = self._load_stats()
+        stats[counter] = stats.get(counter, 0) + num
+        try:
+            self._mkdir(self.path)
+            fd, tmp = tempfile.mkstemp(prefix=self.statsfile, dir=self.path)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(stats, f)
+                os.replace(tmp, os.path.join(self.path, self.statsfile))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as err:
+            gbp.log.debug("Can't write orig cache statistics: %s" % err)
+
+    def stats(self):
+        """
+        Statistics about the cache's use
+
+        @return: number of entries, their size, the maximum size and
+            the number of hits, misses and evictions
+        @rtype: C{dict}
+        """
+        entries = self._entries()
+        stats = {'path': self.path,
+                 'entries': len(entries),
+                 'size': sum(entry[1] for entry in entries),
+                 'max_size': self.max_size}
+        counters = self._load_stats()
+        for counter in ['hits', 'misses', 'evictions']:
+            stats[counter] = counters.get(counter, 0)
+        return stats
+
+    def format_stats(self):
+        """
+        Format the cache's statistics for humans
+        """
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = 100.0 * stats['hits'] / lookups if lookups else 0.0
+        return ("%s at '%s':\n"
+                "  %d %s, %.1f of %.1f MiB used\n"
+                "  %d hits, %d misses (%.0f%% hit rate), %d evictions\n" %
+                (self.description, stats['path'], stats['entries'], self.entry_name,
+                 stats['size'] / float(1 << 20), stats['max_size'] / float(1 << 20),
+                 stats['hits'], stats['misses'], ratio, stats['evictions']))
+
+
+class UnpackedOrigCache(OrigCache):
+    """
+    Unpacked orig tarballs keyed by the tarball's checksum
+
+    Each entry holds the tree an orig tarball unpacks to with a leading
+    directory stripped. Export directories are populated from it via
+    L{clone_file} and get the modes and times recorded in the entry's
+    manifest. Cached files are kept read only and entries whose files
+    got modified anyway are dropped when used the next time.
+    """
+    dirname = 'unpacked'
+    description = 'Unpacked orig tarball cache'
+    entry_name = 'trees'
+    manifest = 'manifest.json'
+    # Bump when the layout of the cached trees changes
+    version = 1
+
+    def __init__(self, path=None, max_size=4096 << 20):
+        super().__init__(path, max_size)
+
+    def key(self, tarball, component=None):
+        """
+        Key of the tree a tarball unpacks to
+
+        @param tarball: the orig tarball
+        @type tarball: C{str}
+        @param component: the component the tarball is unpacked as
+        @type component: C{str}
+        @rtype: C{str}
+        """
+        checksum = hashlib.sha256()
+        with open(tarball, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                checksum.update(chunk)
+        data = {'sha256': checksum.hexdigest(),
+                'component': component,
+                'version': self.version}
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def _entries(self):
+        entries = []
+        try:
+            subdirs = os.listdir(self.path)
+        except FileNotFoundError:
+            return entries
+        for subdir in subdirs:
+            subdir = os.path.join(self.path, subdir)
+            if len(os.path.basename(subdir)) != 2 or not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                path = os.path.join(subdir, name)
+                manifest = self._load_manifest(path)
+                if manifest is None:
+                    continue
+                try:
+                    st = os.stat(os.path.join(path, self.manifest))
+                except FileNotFoundError:
+                    continue
+                entries.append((path, manifest['size'], st.st_mtime_ns))
+        return sorted(entries, key=lambda entry: (entry[2], entry[0]))
+
+    @staticmethod
+    def _remove(path):
+        # Move out of the way first so it's never seen half removed
+        tmp = tempfile.mkdtemp(prefix='.evicted-', dir=os.path.dirname(os.path.dirname(path)))
+        try:
+            os.rename(path, os.path.join(tmp, 'entry'))
+        finally:
+            _rmtree(tmp)
+
+    def _load_manifest(self, entry):
+        try:
+            with open(os.path.join(entry, self.manifest)) as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict) and manifest.get('version') == self.version:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def mkdtemp(self):
+        """
+        Create a temporary directory to unpack a tarball in so it can
+        be moved into the cache by L{store}
+
+        @return: the directory or C{None} if the cache isn't usable
+        @rtype: C{str}
+        """
+        try:
+            self._mkdir(self.path)
+            return tempfile.mkdtemp(prefix='.unpack-', dir=self.path)
+        except OSError as err:
+            gbp.log.warn("Can't use %s at '%s': %s" % (self.description.lower(), self.path, err))
+            return None
+
+    def fetch(self, key, output):
+        """
+        Populate output with a cached tree
+
+        @param output: the directory to populate, must be empty or not exist
+        @type output: C{str}
+        @return: C{True} if the tree was cached, C{False} otherwise
+        @rtype: C{bool}
+        """
+        entry = self._entry(key)
+        manifest = self._load_manifest(entry)
+        if manifest is None:
+            self._count('misses')
+            return False
+
+        tree = os.path.join(entry, 'tree')
+        methods = set()
+        try:
+            os.makedirs(output, exist_ok=True)
+            for rel, (mode, size, mtime) in sorted(manifest['files'].items()):
+                src = os.path.join(tree, rel)
+                dst = os.path.join(output, rel)
+                if stat.S_ISDIR(mode):
+                    os.makedirs(dst, exist_ok=True)
+                elif stat.S_ISLNK(mode):
+                    os.symlink(os.readlink(src), dst)
+                else:
+                    st = os.stat(src)
+                    if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                        raise ValueError("'%s' got modified" % src)
+                    methods.add(clone_file(src, dst))
+                    os.chmod(dst, stat.S_IMODE(mode))
+                    os.utime(dst, ns=(mtime, mtime))
+            # Directory modes and times last since adding files changes them
+            for rel, (mode, size, mtime) in sorted(manifest['files'].items(), reverse=True):
+                if stat.S_ISDIR(mode):
+                    dst = os.path.join(output, rel)
+                    os.chmod(dst, stat.S_IMODE(mode))
+                    os.utime(dst, ns=(mtime, mtime))
+        except (OSError, ValueError) as err:
+            gbp.log.warn("Can't use cached tree '%s': %s" % (entry, err))
+            self._count('misses')
+            with self._lock:
+                try:
+                    self._remove(entry)
+                except OSError:
+                    pass
+            for name in os.listdir(output):
+                path = os.path.join(output, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    _rmtree(path)
+                else:
+                    os.unlink(path)
+            return False
+        os.utime(os.path.join(entry, self.manifest))
+        gbp.log.debug("Populated '%s' from '%s' (%s)" % (output, entry, ', '.join(sorted(methods))))
+        self._count('hits')
+        return True
+
+    def store(self, key, unpacked):
+        """
+        Move an unpacked tree into the cache evicting the least recently
+        used ones if it gets too large. Failures are only logged.
+
+        @param key: the tree's key
+        @type key: C{str}
+        @param unpacked: the unpacked tree, should be created via L{mkdtemp}
+            so it's on the same file system as the cache
+        @type unpacked: C{str}
+        """
+        entry = self._entry(key)
+        files = {}
+        size = 0
+        for root, dirs, names in os.walk(unpacked):
+            for name in dirs + names:
+                path = os.path.join(root, name)
+                st = os.lstat(path)
+                files[os.path.relpath(path, unpacked)] = (st.st_mode, st.st_size, st.st_mtime_ns)
+                if stat.S_ISREG(st.st_mode):
+                    size += st.st_size
+        if size > self.max_size:
+            gbp.log.debug("Not caching '%s', it's larger than the cache" % unpacked)
+            return
+
+        try:
+            self._mkdir(os.path.dirname(entry))
+            tmp = tempfile.mkdtemp(prefix='.store-', dir=self.path)
+            try:
+                os.rename(unpacked, os.path.join(tmp, 'tree'))
+                # Guard the cached files against accidental changes
+                for rel, (mode, dummy, dummy) in files.items():
+                    if stat.S_ISREG(mode):
+                        os.chmod(os.path.join(tmp, 'tree', rel), stat.S_IMODE(mode) & ~0o222)
+                with open(os.path.join(tmp, self.manifest), 'w') as f:
+                    json.dump({'version': self.version, 'size': size, 'files': files}, f)
+                os.rename(tmp, entry)
+            except BaseException:
+                _rmtree(tmp)
+                raise
+            self.evict()
+        except OSError as err:
+            gbp.log.warn("Can't cache '%s' at '%s': %s" % (unpacked, entry, err))
+
+
+def _rmtree(path):
+    """Remove a tree even if it contains read only directories"""
+    def onexc(func, path, exc):
+        os.chmod(os.path.dirname(path), 0o700)
+        func(path)
+    shutil.rmtree(path, onexc=onexc)
@@ -16,37 +16,227 @@
 #    <http://www.gnu.org/licenses/>
 """Handle checkin and checkout of archives from the pristine-tar branch"""
 
+import copy
+import json
 import re
 import os
+import threading
+import gbp.capabilities
 import gbp.log
 from gbp.command_wrappers import Command
+from gbp.git.repository import GitRepositoryError
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from gbp.pkg.git import PkgGitRepository
 
 
+def grep_to_re(regexp: str) -> str:
+    r"""
+    Convert a git-grep (basic) regular expression into a Python one.
+    In basic regular expressions C{+?|(){}} are literal characters
+    unless escaped.
+
+    >>> print(grep_to_re(r'g++_1\.0\.orig\.tar\.\w\+'))
+    g\+\+_1\.0\.orig\.tar\.\w+
+    """
+    converted = ''
+    escaped = False
+    for char in regexp:
+        if escaped:
+            converted += char if char in '+?|(){}' else '\\' + char
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        else:
+            converted += '\\' + char if char in '+?|(){}' else char
+    return converted + ('\\\\' if escaped else '')
+
+
+class PristineTarIndex(object):
+    """
+    Tarballs stored on a pristine-tar branch
+
+    Maps each tarball to the newest commit that stored it and whether
+    that commit added a signature. The tarballs are taken from the
+    I{*.delta}, I{*.id} and I{*.asc} files the commits add and their
+    subjects. The index is kept in the repository's I{gbp} directory
+    together with the branch head it was built for so only commits
+    added since then need to be looked at.
+    """
+    filename = 'pristine-tar-index.json'
+    _subject_re = re.compile(r'pristine-tar data for (\S+)')
+
+    def __init__(self, repo: 'PkgGitRepository', branch: str):
+        self.repo = repo
+        self.branch = branch
+        self.head = None
+        self.count = 0
+        self.tarballs = {}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.repo.git_dir, 'gbp', self.filename)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                index = json.load(f)[self.branch]
+            self.head, self.count, self.tarballs = index['head'], index['count'], index['tarballs']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.head, self.count, self.tarballs = None, 0, {}
+
+    def _save(self):
+        try:
+            try:
+                with open(self.path) as f:
+                    indexes = json.load(f)
+                if not isinstance(indexes, dict):
+                    indexes = {}
+            except (OSError, ValueError):
+                indexes = {}
+            indexes[self.branch] = {'head': self.head,
+                                    'count': self.count,
+                                    'tarballs': self.tarballs}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(indexes, f)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            gbp.log.debug("Can't write pristine-tar index '%s': %s" % (self.path, err))
+
+    def _add(self, info):
+        """Add the tarballs stored by a commit"""
+        added = set()
+        for status, paths in info['files'].items():
+            if status == 'D':
+                continue
+            added.update(path.decode() for path in paths)
+        names = set()
+        for path in added:
+            for ext in ['.delta', '.id']:
+                if path.endswith(ext):
+                    names.add(path[:-len(ext)])
+        match = self._subject_re.match(info['subject'])
+        if match:
+            names.add(match.group(1))
+        self.count += 1
+        for name in names:
+            self.tarballs[name] = [info['id'], '%s.asc' % name in added, self.count]
+
+    def update(self):
+        """
+        Bring the index up to date with the branch, only looking at the
+        commits added since it was last updated if possible.
+        """
+        head = self.repo.rev_parse(self.branch)
+        if self.head is None:
+            self._load()
+        if self.head == head:
+            return
+
+        since = None
+        if self.head:
+            try:
+                if self.repo.get_merge_base(self.head, head) == self.head:
+                    since = self.head
+            except GitRepositoryError:
+                pass
+        if since:
+            gbp.log.debug("Updating pristine-tar index from %s to %s" % (since, head))
+        else:
+            gbp.log.debug("Building pristine-tar index for %s" % head)
+            self.count, self.tarballs = 0, {}
+        for info in self.repo.iter_commit_infos(since=since, until=head,
+                                                options=['--no-merges'],
+                                                reverse=True):
+            self._add(info)
+        self.head = head
+        self._save()
+
+    def find(self, archive_regexp: str) -> tuple[str, str, bool] | None:
+        """
+        Find the newest tarball matching I{archive_regexp}
+
+        @param archive_regexp: start of the tarball name as git-grep (basic)
+            regular expression
+        @return: the tarball, its commit and whether the commit stores a
+            signature or C{None} if not found
+        """
+        self.update()
+        regexp = re.compile(grep_to_re(archive_regexp))
+        found = [(seq, name, commit, sig) for name, (commit, sig, seq) in self.tarballs.items()
+                 if regexp.match(name)]
+        if not found:
+            return None
+        dummy, name, commit, sig = max(found)
+        return name, commit, sig
+
+    def latest(self) -> tuple[str, str, bool] | None:
+        """
+        The tarball stored last
+
+        @return: the tarball, its commit and whether the commit stores a
+            signature or C{None} if there are no tarballs
+        """
+        return self.find('')
+
+
 class PristineTar(Command):
     """The pristine-tar branch in a git repository"""
     branch = 'pristine-tar'
 
     def __init__(self, repo: 'PkgGitRepository'):
         self.repo = repo
+        self._indexes = {}
+        self._lock = threading.Lock()
         super(PristineTar, self).__init__('pristine-tar',
                                           cwd=repo.path,
                                           capture_stderr=True)
 
+    def index(self, branch: str | None = None) -> PristineTarIndex:
+        """
+        The up to date index of the tarballs on a pristine-tar branch
+
+        @param branch: the branch, defaults to the local pristine-tar branch
+        """
+        branch = branch or self.branch
+        with self._lock:
+            if branch not in self._indexes:
+                self._indexes[branch] = PristineTarIndex(self.repo, branch)
+            index = self._indexes[branch]
+            index.update()
+        return index
+
+    def fork(self) -> 'PristineTar':
+        """
+        A copy for running pristine-tar in another thread. It has its own
+        command state (like I{retcode} and I{run_error}) but shares the
+        tarball indexes.
+        """
+        return copy.copy(self)
+
+    def _help(self) -> str:
+        """
+        Get pristine-tar's usage output
+        """
+        self.call(['--help'], quiet=True)  # There's no --help so we always exit 1
+        return self.stderr
+
     def _has_in_output(self, match: str) -> bool:
         """
-        Check if pristine_tar has a certain feature enabled.
+        Check if pristine_tar has a certain feature enabled. The usage
+        output is cached (see L{gbp.capabilities.CapabilityCache}) so
+        pristine-tar is only run once per version.
 
         @param feature: feature / command option to check
         @return: True if feature is supported
         @rtype: C{bool}
         """
-        self.call(['--help'], quiet=True)  # There's no --help so we always exit 1
+        usage = gbp.capabilities.lookup(self.cmd, 'help', self._help)
         r = re.compile(match)
-        for line in self.stderr.splitlines():
+        for line in usage.splitlines():
             if r.match(line):
                 return True
         return False
@@ -67,18 +257,6 @@ class PristineTar(Command):
         """
         return True if self.get_commit(archive_regexp)[0] else False
 
-    def _commit_contains_file(self, commit: str, regexp: str) -> bool:
-        """Does the given commit contain a file with the given regex"""
-        files = self.repo.get_commit_info(commit)['files']
-        # CPython wants '+' (which is valid in source package names)
-        # escaped but git-grep doesn't so we do it that late:
-        cregex = re.compile(regexp.replace('+', '\\+'))
-        for _, v in files.items():
-            for f in v:
-                if cregex.match(f.decode()):
-                    return True
-        return False
-
     def get_commit(self, archive_regexp: str) -> tuple[str | None, bool]:
         """
         Get the pristine-tar commit of a package matching I{archive_regexp}.
@@ -90,12 +268,11 @@ class PristineTar(Command):
         if not self.repo.has_pristine_tar_branch():
             return None, False
 
-        regex = ('pristine-tar .* %s' % archive_regexp)
-        commits = self.repo.grep_log(regex, self.branch, merges=False)
-        if commits:
-            commit = commits[-1]
+        found = self.index().find(archive_regexp)
+        if found:
+            dummy, commit, signature = found
             gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
-            return commit, self._commit_contains_file(commit, '%s.asc' % archive_regexp)
+            return commit, signature
         return None, False
 
     def checkout(self, archive: str, quiet=False, signaturefile: str | None = None):
@@ -126,7 +303,10 @@ class PristineTar(Command):
                           (self.branch, upstream))
         if signaturefile and self.has_feature_sig():
             args += ['-s', signaturefile]
-        self.__call__(args, quiet=quiet)
+        try:
+            self.__call__(args, quiet=quiet)
+        finally:
+            self.repo.invalidate_ref_cache()
 
     def verify(self, archive: str, quiet=False):
         """Verify an archive's I{archive} checksum using to the pristine tar branch"""
@@ -20,8 +20,10 @@ import os
 
 import gbp.command_wrappers as gbpc
 
+from gbp.pkg.archive import Archive, filter_tar_stream
 from gbp.pkg.compressor import Compressor
 from gbp.pkg.pkgpolicy import PkgPolicy
+from gbp.pipeline import Pipeline
 
 from gbp.errors import GbpError
 
@@ -168,8 +170,12 @@ class UpstreamSource(object):
         Unpack a tarball to I{dir} applying a list of I{filters}. Leave the
         cleanup to the caller in case of an error.
         """
+        compression = None
+        decompressor = self._decompressor()
+        if decompressor and decompressor.threaded_decompression:
+            compression = '--use-compress-program=%s' % decompressor.decompress_cmdline(stdout=False)
         try:
-            unpackArchive = gbpc.UnpackTarArchive(self.path, dir, filters)
+            unpackArchive = gbpc.UnpackTarArchive(self.path, dir, filters, compression)
             unpackArchive()
         except gbpc.CommandExecFailed:
             # unpackArchive already printed an error message
@@ -204,6 +210,51 @@ class UpstreamSource(object):
             raise GbpError
         return type(self)(newarchive)
 
+    def repack(self, newarchive: str, filters: list[str] | None = None) -> Self:
+        """
+        Create a new tarball from the current one dropping the members
+        matching I{filters}. The archive is streamed through a
+        (multi threaded if possible) decompressor, the filter and the
+        compressor without unpacking it.
+
+        @param newarchive: the name of the new archive
+        @param filters: tar filters to apply
+        @return: the new upstream source
+        """
+        if not self.is_orig():
+            raise GbpError("Can only repack tarballs, not %s" % self.path)
+
+        if not filters:
+            filters = []
+
+        if not isinstance(filters, list):
+            raise GbpError("Filters must be a list")
+
+        compression = Archive.parse_filename(newarchive)[2]
+        if compression not in Compressor.Opts:
+            raise GbpError("Unknown compression of %s" % newarchive)
+
+        reader = Pipeline(self._decompressor().decompress_args())
+        writer = Pipeline(Compressor(compression).args())
+        try:
+            with reader.stream(stdin=self.path) as tar:
+                writer.feed(filter_tar_stream(tar, filters), stdout=newarchive)
+        except (GbpError, OSError) as err:
+            if os.path.exists(newarchive):
+                os.unlink(newarchive)
+            raise GbpError("Couldn't repack '%s': %s" % (self.path, err))
+        return type(self)(newarchive)
+
+    def _decompressor(self) -> Compressor | None:
+        """
+        The decompressor for a tarball using all CPUs if a multi
+        threaded one is available
+        """
+        compression = Archive.parse_filename(self.path)[2]
+        if compression not in Compressor.Opts:
+            return None
+        return Compressor(compression, threads=0)
+
     @staticmethod
     def known_compressions():
         return Compressor.Exts.values()
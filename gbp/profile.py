@@ -0,0 +1,236 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 Guido Günther <agx@sigxcpu.org>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Record the external commands gbp runs
+
+Profiling is off by default. It's switched on by setting I{GBP_PROFILE}
+to a file name (or I{-} for stderr) or via L{enable}. The report is
+written at exit, as JSON if the file name ends in I{.json} and as a
+text table otherwise.
+
+Callers wrap each external command like::
+
+    started = gbp.profile.start()
+    ...
+    gbp.profile.stop(started, argv, retcode, bytes_in, bytes_out)
+
+which is a single function call and comparison when profiling is disabled.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+
+# The recorded runs, C{None} if profiling is disabled
+_runs = None
+_output = None
+_pid = None
+
+
+def enable(output='-'):
+    """
+    Start recording external commands
+
+    @param output: where to write the report at exit, I{-} for stderr
+    @type output: C{str}
+    """
+    global _runs, _output, _pid
+
+    if _runs is None:
+        _runs = []
+        atexit.register(_write_report)
+    _output = output
+    _pid = os.getpid()
+
+
+def disable():
+    """
+    Stop recording external commands and drop all recorded runs
+    """
+    global _runs
+    _runs = None
+
+
+def enabled():
+    """
+    @return: whether external commands are recorded
+    @rtype: C{bool}
+    """
+    return _runs is not None
+
+
+def start():
+    """
+    Mark the start of an external command
+
+    @return: token to pass to L{stop}, C{None} if profiling is disabled
+    """
+    if _runs is None:
+        return None
+    return time.monotonic()
+
+
+def command_name(argv):
+    """
+    Name used to group runs of the same command. This is the
+    program name and for git the subcommand too.
+
+    >>> command_name(['/usr/bin/git', '-c', 'a=b', 'rev-parse', 'HEAD'])
+    'git rev-parse'
+    >>> command_name('tar -cf - foo | xz')
+    'tar'
+    >>> command_name(['xz', '-T0'])
+    'xz'
+    """
+    if isinstance(argv, str):
+        argv = argv.split()
+    if not argv:
+        return ''
+    name = os.path.basename(argv[0])
+    if name == 'git':
+        args = iter(argv[1:])
+        for arg in args:
+            if arg in ['-c', '-C']:
+                next(args, None)
+            elif not arg.startswith('-'):
+                return '%s %s' % (name, arg)
+    return name
+
+
+def stop(started, argv, retcode, bytes_in=0, bytes_out=0, name=None):
+    """
+    Record a finished external command
+
+    @param started: the token returned by L{start}
+    @param argv: the command line
+    @type argv: C{list} of C{str} or C{str}
+    @param retcode: the command's exit status
+    @type retcode: C{int}
+    @param bytes_in: number of bytes passed to the command on stdin
+    @type bytes_in: C{int}
+    @param bytes_out: number of bytes read from the command's stdout
+    @type bytes_out: C{int}
+    @param name: name to group this run under, defaults to L{command_name}
+    @type name: C{str}
+    """
+    if started is None or _runs is None:
+        return
+    elapsed = time.monotonic() - started
+    if not isinstance(argv, str):
+        argv = [str(arg) for arg in argv]
+    _runs.append({'name': name or command_name(argv),
+                  'argv': argv,
+                  'time': elapsed,
+                  'retcode': retcode,
+                  'bytes_in': bytes_in or 0,
+                  'bytes_out': bytes_out or 0})
+
+
+def runs():
+    """
+    @return: the recorded runs
+    @rtype: C{list} of C{dict}
+    """
+    return list(_runs or [])
+
+
+def summary():
+    """
+    Summarize the recorded runs per command, most expensive first
+
+    @rtype: C{list} of C{dict}
+    """
+    commands = {}
+    for run in _runs or []:
+        cmd = commands.setdefault(run['name'], {'name': run['name'],
+                                                'calls': 0,
+                                                'failed': 0,
+                                                'time': 0.0,
+                                                'max': 0.0,
+                                                'bytes_in': 0,
+                                                'bytes_out': 0})
+        cmd['calls'] += 1
+        cmd['failed'] += 1 if run['retcode'] else 0
+        cmd['time'] += run['time']
+        cmd['max'] = max(cmd['max'], run['time'])
+        cmd['bytes_in'] += run['bytes_in']
+        cmd['bytes_out'] += run['bytes_out']
+    return sorted(commands.values(), key=lambda cmd: (-cmd['time'], cmd['name']))
+
+
+def format_text():
+    """
+    Format the recorded runs as a text table
+
+    @rtype: C{str}
+    """
+    cmds = summary()
+    width = max([len(cmd['name']) for cmd in cmds] + [len('command')])
+    lines = ["%-*s %7s %7s %10s %10s %12s %12s" % (width, 'command', 'calls', 'failed',
+                                                   'total[s]', 'max[s]', 'bytes in', 'bytes out')]
+    for cmd in cmds:
+        lines.append("%-*s %7d %7d %10.3f %10.3f %12d %12d" % (width, cmd['name'],
+                                                               cmd['calls'], cmd['failed'],
+                                                               cmd['time'], cmd['max'],
+                                                               cmd['bytes_in'], cmd['bytes_out']))
+    total = sum(cmd['time'] for cmd in cmds)
+    lines.append("%d commands run, %.3fs total" % (len(_runs or []), total))
+    return "\n".join(lines) + "\n"
+
+
+def format_json():
+    """
+    Format the recorded runs as JSON
+
+    @rtype: C{str}
+    """
+    return json.dumps({'commands': summary(), 'runs': runs()}, indent=2) + "\n"
+
+
+def write_report(output):
+    """
+    Write the report
+
+    @param output: file name, I{-} for stderr
+    @type output: C{str}
+    """
+    if output.endswith('.json'):
+        report = format_json()
+    else:
+        report = format_text()
+
+    if output == '-':
+        sys.stderr.write(report)
+    else:
+        with open(output, 'w') as f:
+            f.write(report)
+
+
+def _write_report():
+    # Forked children inherit the atexit handler, only report once
+    if _runs is None or _pid != os.getpid():
+        return
+    try:
+        write_report(_output)
+    except OSError as err:
+        sys.stderr.write("gbp: can't write profile to '%s': %s\n" % (_output, err))
+
+
+if os.getenv('GBP_PROFILE'):
+    enable(os.getenv('GBP_PROFILE'))
@@ -39,13 +39,15 @@ from gbp.errors import GbpError
 import gbp.log
 import gbp.notifications
 from gbp.scripts.common.buildpackage import (index_name, wc_name,
-                                             dump_tree,
-                                             write_wc, drop_index)
+                                             dump_tree, sync_tree,
+                                             export_stamp, record_export,
+                                             forget_export, write_wc)
 from gbp.scripts.common import ExitCodes
 from gbp.scripts.common.hook import Hook
 
 from gbp.scripts.export_orig import prepare_upstream_tarballs, guess_comp_type
 from gbp.scripts.tag import perform_tagging
+from gbp.pkg.origcache import UnpackedOrigCache
 from gbp.pkg.pkgpolicy import PkgPolicy
 
 
@@ -98,6 +100,19 @@ def export_source(repo: DebianGitRepository,
         raise GbpError
 
 
+def update_export(repo: DebianGitRepository,
+                  tree: str,
+                  options: optparse.Values,
+                  export_dir: str) -> bool:
+    """
+    Update a previous export in place only writing what changed
+
+    @return: C{False} if the source needs to be exported again
+    """
+    gbp.log.info("Updating '%s' to '%s'" % (export_dir, options.export))
+    return sync_tree(repo, export_dir, tree, options.with_submodules)
+
+
 def move_old_export(target: str):
     """move a build tree away if it exists"""
     try:
@@ -121,18 +136,20 @@ def overlay_extract_origs(source: DebianSource,
     gbp.log.info("Extracting '%s' to '%s'" % (os.path.basename(main_tarball), dest_dir))
 
     move_old_export(dest_dir)
-    upstream = DebianUpstreamSource(main_tarball)
-    upstream.unpack(dest_dir)
-
-    # Check if tarball extracts into a single folder:
-    if upstream.unpacked != dest_dir:
-        # If it extracts a single folder, move its contents to dest_dir:
-        gbp.log.debug("Moving %s to %s" % (upstream.unpacked, dest_dir))
-        tmpdir = dest_dir + '.new'
-        assert upstream.unpacked is not None
-        os.rename(upstream.unpacked, tmpdir)
-        os.rmdir(dest_dir)
-        os.rename(tmpdir, dest_dir)
+    cache = overlay_cache(options)
+    if not (cache and unpack_cached(cache, main_tarball, dest_dir)):
+        upstream = DebianUpstreamSource(main_tarball)
+        upstream.unpack(dest_dir)
+
+        # Check if tarball extracts into a single folder:
+        if upstream.unpacked != dest_dir:
+            # If it extracts a single folder, move its contents to dest_dir:
+            gbp.log.debug("Moving %s to %s" % (upstream.unpacked, dest_dir))
+            tmpdir = dest_dir + '.new'
+            assert upstream.unpacked is not None
+            os.rename(upstream.unpacked, tmpdir)
+            os.rmdir(dest_dir)
+            os.rename(tmpdir, dest_dir)
 
     # Remove debian/ from unpacked upstream tarball in case of non 1.0 format
     underlay_debian_dir = os.path.join(dest_dir, 'debian')
@@ -152,7 +169,51 @@ def overlay_extract_origs(source: DebianSource,
                                           component=c)
         gbp.log.info("Extracting '%s' to '%s/%s'" % (os.path.basename(tarball.path),
                                                      dest_dir, c))
-        tarball.unpack(dest_dir, [])
+        component_dir = os.path.join(dest_dir, c)
+        if cache and os.path.exists(component_dir):
+            shutil.rmtree(component_dir)
+        if not (cache and unpack_cached(cache, tarball.path, component_dir, component=c)):
+            tarball.unpack(dest_dir, [])
+
+
+def overlay_cache(options: optparse.Values) -> UnpackedOrigCache | None:
+    """
+    The cache of unpacked orig tarballs to use in overlay mode
+
+    @return: the cache or C{None} if disabled
+    """
+    if not getattr(options, 'overlay_cache', False):
+        return None
+    return UnpackedOrigCache(max_size=options.overlay_cache_size << 20)
+
+
+def unpack_cached(cache: UnpackedOrigCache,
+                  tarball: str,
+                  dest_dir: str,
+                  component: str | None = None) -> bool:
+    """
+    Populate dest_dir with the tree tarball unpacks to (without a
+    leading directory) via the cache, unpacking and adding it if missing.
+
+    @return: C{False} if the cache can't be used
+    """
+    key = cache.key(tarball, component)
+    if cache.fetch(key, dest_dir):
+        gbp.log.info("Using cached unpacked %s" % os.path.basename(tarball))
+        return True
+
+    tmpdir = cache.mkdtemp()
+    if tmpdir is None:
+        return False
+    try:
+        upstream = DebianUpstreamSource(tarball)
+        upstream.unpack(tmpdir)
+        assert upstream.unpacked is not None
+        cache.store(key, upstream.unpacked)
+    finally:
+        if os.path.exists(tmpdir):
+            RemoveTree(tmpdir)()
+    return cache.fetch(key, dest_dir)
 
 
 def source_vfs(repo: DebianGitRepository, options: optparse.Values, tree: str) -> DebianSource:
@@ -413,10 +474,18 @@ def build_parser(name: str, prefix: str | None = None) -> GbpOptionParserDebian
                                       help="Compression type, default is '%(compression)s'")
     orig_group.add_config_file_option(option_name="compression-level", dest="comp_level",
                                       help="Compression level, default is '%(compression-level)s'")
+    orig_group.add_config_file_option(option_name="compression-threads", dest="comp_threads",
+                                      type="int", metavar="N",
+                                      help="Number of threads to compress with, 0 uses all CPUs, "
+                                      "default is '%(compression-threads)s'")
     orig_group.add_config_file_option(option_name="upstream-signatures", dest="upstream_signatures",
                                       help="use upstream signatures, default is auto", type='tristate')
     orig_group.add_config_file_option("component", action="append", metavar='COMPONENT',
                                       dest="components")
+    orig_group.add_boolean_config_file_option(option_name="orig-cache", dest="orig_cache")
+    orig_group.add_config_file_option(option_name="orig-cache-size", dest="orig_cache_size",
+                                      type="int", metavar="MIB")
+    orig_group.add_config_file_option(option_name="jobs", dest="jobs", type="int", metavar="N")
     branch_group.add_config_file_option(option_name="upstream-branch", dest="upstream_branch")
     branch_group.add_config_file_option(option_name="debian-branch", dest="debian_branch")
     branch_group.add_boolean_config_file_option(option_name="ignore-branch", dest="ignore_branch")
@@ -458,6 +527,11 @@ def build_parser(name: str, prefix: str | None = None) -> GbpOptionParserDebian
                                              "default is '%(export)s'", metavar="TREEISH")
     export_group.add_boolean_config_file_option(option_name="purge", dest="purge")
     export_group.add_boolean_config_file_option(option_name="overlay", dest="overlay")
+    export_group.add_boolean_config_file_option(option_name="overlay-cache", dest="overlay_cache")
+    export_group.add_config_file_option(option_name="overlay-cache-size", dest="overlay_cache_size",
+                                        type="int", metavar="MIB")
+    export_group.add_boolean_config_file_option(option_name="export-incremental",
+                                                dest="export_incremental")
     return parser
 
 
@@ -558,19 +632,29 @@ def main(argv):
 
             # Export to another build dir if requested:
             if options.export_dir:
-                export_source(repo, tree, source, options, tmp_dir, tarball_dir)
+                incremental = options.export_incremental and not options.overlay
+                if incremental and update_export(repo, tree, options, export_dir):
+                    stamp = export_stamp()
+                    exported_dir = export_dir
+                else:
+                    export_source(repo, tree, source, options, tmp_dir, tarball_dir)
+                    stamp = export_stamp()
+                    exported_dir = tmp_dir
 
                 # Run postexport hook
                 if options.postexport:
                     Hook('Postexport', options.postexport,
                          extra_env=Hook.md(hook_env,
                                            {'GBP_GIT_DIR': repo.git_dir,
-                                            'GBP_TMP_DIR': tmp_dir})
-                         )(dir=tmp_dir)
+                                            'GBP_TMP_DIR': exported_dir})
+                         )(dir=exported_dir)
 
-                gbp.log.info("Moving '%s' to '%s'" % (tmp_dir, export_dir))
-                move_old_export(export_dir)
-                os.rename(tmp_dir, export_dir)
+                if exported_dir != export_dir:
+                    gbp.log.info("Moving '%s' to '%s'" % (tmp_dir, export_dir))
+                    move_old_export(export_dir)
+                    os.rename(tmp_dir, export_dir)
+                if incremental:
+                    record_export(repo, export_dir, tree, options.with_submodules, stamp)
 
                 # Delayed tarball creation in case a postexport hook is used:
                 if not source.is_native() and options.postexport:
@@ -614,12 +698,11 @@ def main(argv):
         gbp.log.err(err)
         source = None
         retval = 1
-    finally:
-        drop_index(repo)
 
     if not options.tag_only:
         if options.export_dir and options.purge:
             RemoveTree(export_dir)()
+            forget_export(repo, export_dir)
 
         if source:
             summary, msg = gbp.notifications.build_msg(source.changelog,
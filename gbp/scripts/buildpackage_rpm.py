@@ -36,7 +36,7 @@ from gbp.rpm.policy import RpmPkgPolicy
 from gbp.tmpfile import init_tmpdir, del_tmpdir, tempfile
 from gbp.scripts.common import ExitCodes
 from gbp.scripts.common.buildpackage import (index_name, wc_name,
-                                             dump_tree, write_wc, drop_index)
+                                             dump_tree, write_wc)
 from gbp.scripts.pq_rpm import parse_spec
 
 
@@ -215,7 +215,7 @@ def git_archive_build_orig(repo, spec, output_dir, options):
                      (spec.orig_src['filename'], upstream_tree))
         if spec.orig_src['compression']:
             comp = Compressor(spec.orig_src['compression'],
-                              options.comp_level)
+                              options.comp_level, options.comp_threads)
             gbp.log.debug("Building upstream tarball with compression %s" % comp)
         if not git_archive(repo, spec, output_dir, upstream_tree,
                            orig_prefix, comp, options.with_submodules):
@@ -378,6 +378,12 @@ def build_parser(name, prefix=None, git_treeish=None):
                                       dest="comp_level",
                                       help="Compression level, default is "
                                       "'%(compression-level)s'")
+    orig_group.add_config_file_option(option_name="compression-threads",
+                                      dest="comp_threads", type="int",
+                                      metavar="N",
+                                      help="Number of threads to compress "
+                                      "with, 0 uses all CPUs, default is "
+                                      "'%(compression-threads)s'")
     branch_group.add_config_file_option(option_name="upstream-branch",
                                         dest="upstream_branch")
     branch_group.add_config_file_option(option_name="packaging-branch",
@@ -567,7 +573,8 @@ def main(argv):
                     comp = None
                     if spec.orig_src['compression']:
                         comp = Compressor(spec.orig_src['compression'],
-                                          options.comp_level)
+                                          options.comp_level,
+                                          options.comp_threads)
                         gbp.log.debug("Building source archive with "
                                       "compression '%s" % comp)
                     orig_prefix = spec.orig_src['prefix']
@@ -648,7 +655,6 @@ def main(argv):
             gbp.log.err(err)
         retval = 1
     finally:
-        drop_index(repo)
         del_tmpdir()
 
     if not options.tag_only:
@@ -18,18 +18,29 @@
 #
 """Common functionality for Debian and RPM buildpackage scripts"""
 
+import json
 import os
 import os.path
-from gbp.git import GitRepositoryError
+import stat
+import time
+from gbp.git import GitRepository, GitRepositoryError
 from gbp.pkg.git import PkgGitRepository
 from gbp.errors import GbpError
-from gbp import pipes
+from gbp.pipeline import Pipeline
 import gbp.log
 
 # when we want to reference the index in a treeish context we call it:
 index_name = "INDEX"
 # when we want to reference the working copy in treeish context we call it:
 wc_name = "WC"
+# ctimes come from a coarse clock lagging the real time by up to a tick
+ctime_slack_ns = 50 * 1000 * 1000
+
+
+# Pathspecs selecting the top level files of a tree. Unlike passing each
+# file name these keep git-archive's command line short no matter how wide
+# the tree is.
+top_level_pathspecs = [':(glob)*', ':(exclude,glob)*/**']
 
 
 #  Functions to handle export-dir
@@ -37,21 +48,21 @@ def dump_tree(repo, export_dir, treeish, with_submodules, recursive=True):
     "dump a tree to output_dir"
     output_dir = os.path.dirname(export_dir)
     prefix = PkgGitRepository.sanitize_prefix(os.path.basename(export_dir))
-    if recursive:
-        paths = []
-    else:
-        paths = ["'%s'" % nam.decode() for _mod, typ, _sha, nam in
-                 repo.list_tree(treeish) if typ == 'blob']
-
-    pipe = pipes.Template()
-    pipe.prepend('git archive --format=tar --prefix=%s %s -- %s' %
-                 (prefix, treeish, ' '.join(paths)), '.-')
-    pipe.append('tar -C %s -xf -' % output_dir, '-.')
-    top = os.path.abspath(os.path.curdir)
     try:
-        ret = pipe.copy('', '')
-        if ret:
-            raise GbpError("Error in dump_tree archive pipe")
+        paths = []
+        if not recursive:
+            # Submodules would show up as empty directories
+            paths = ['--'] + top_level_pathspecs + [
+                ':(exclude,literal)%s' % name.decode()
+                for mode, objtype, sha1, name in repo.list_tree(treeish)
+                if objtype == 'commit']
+        pipe = Pipeline()
+        pipe.append(['git', 'archive', '--format=tar', '--prefix=%s' % prefix,
+                     treeish] + paths, cwd=repo.path)
+        pipe.append(['tar', '-C', output_dir, '-xf', '-'])
+        if pipe.run(check=False) != [0, 0]:
+            raise GbpError("Error in dump_tree archive pipe: %s" %
+                           ", ".join(stage.describe() for stage in pipe.failed))
 
         if recursive and with_submodules:
             if repo.has_submodules():
@@ -59,17 +70,16 @@ def dump_tree(repo, export_dir, treeish, with_submodules, recursive=True):
             for (subdir, commit) in repo.get_submodules(treeish):
                 gbp.log.info("Processing submodule %s (%s)" % (subdir, commit[0:8]))
                 tarpath = [subdir, subdir[2:]][subdir.startswith("./")]
-                os.chdir(subdir)
-                pipe = pipes.Template()
-                pipe.prepend('git archive --format=tar --prefix=%s%s/ %s' %
-                             (prefix, tarpath, commit), '.-')
-                pipe.append('tar -C %s -xf -' % output_dir, '-.')
-                ret = pipe.copy('', '')
-                os.chdir(top)
-                if ret:
-                    raise GbpError("Error in dump_tree archive pipe in submodule %s" % subdir)
+                pipe = Pipeline()
+                pipe.append(['git', 'archive', '--format=tar',
+                             '--prefix=%s%s/' % (prefix, tarpath), commit],
+                            cwd=os.path.join(repo.path, subdir))
+                pipe.append(['tar', '-C', output_dir, '-xf', '-'])
+                if pipe.run(check=False) != [0, 0]:
+                    raise GbpError("Error in dump_tree archive pipe in submodule %s: %s" %
+                                   (subdir, ", ".join(stage.describe() for stage in pipe.failed)))
     except OSError as err:
-        gbp.log.err("Error dumping tree to %s: %s" % (output_dir, err[0]))
+        gbp.log.err("Error dumping tree to %s: %s" % (output_dir, err))
         return False
     except (GitRepositoryError, GbpError) as err:
         gbp.log.err(err)
@@ -77,26 +87,238 @@ def dump_tree(repo, export_dir, treeish, with_submodules, recursive=True):
     except Exception as e:
         gbp.log.err("Error dumping tree to %s: %s" % (output_dir, e))
         return False
-    finally:
-        os.chdir(top)
     return True
 
 
+def export_state_file(repo):
+    """
+    Get path of the file recording the trees exported to export
+    directories so they can be updated incrementally.
+    """
+    return os.path.join(repo.git_dir, "gbp", "exports.json")
+
+
+def _load_export_states(repo):
+    try:
+        with open(export_state_file(repo)) as f:
+            states = json.load(f)
+        if isinstance(states, dict):
+            return states
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_export_states(repo, states):
+    path = export_state_file(repo)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(states, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as err:
+        gbp.log.warn("Can't record export state in '%s': %s" % (path, err))
+
+
+def export_stamp():
+    """
+    Time stamp for L{record_export} to take once an export finished.
+    It's set back by L{ctime_slack_ns} so files changed right after
+    the export aren't missed. Files written at the very end of the
+    export are thus written again by the next L{sync_tree}.
+
+    @rtype: C{int}
+    """
+    return time.time_ns() - ctime_slack_ns
+
+
+def record_export(repo, export_dir, treeish, with_submodules, stamp):
+    """
+    Record that I{treeish} got exported to I{export_dir} so the next
+    export can be done by L{sync_tree}.
+
+    @param stamp: time (in ns) the export finished at as returned by
+        L{export_stamp}. Files whose ctime is later are considered
+        modified.
+    @type stamp: C{int}
+    """
+    tree = repo.rev_parse('%s^{tree}' % treeish)
+    submodules = {}
+    if with_submodules and repo.has_submodules(treeish):
+        submodules = dict(repo.get_submodules(treeish))
+    states = _load_export_states(repo)
+    states[os.path.abspath(export_dir)] = {'tree': tree,
+                                           'stamp': stamp,
+                                           'with_submodules': with_submodules,
+                                           'submodules': submodules}
+    _save_export_states(repo, states)
+
+
+def forget_export(repo, export_dir):
+    """Drop the recorded state of an export directory"""
+    states = _load_export_states(repo)
+    if states.pop(os.path.abspath(export_dir), None) is not None:
+        _save_export_states(repo, states)
+
+
+def sync_tree(repo, export_dir, treeish, with_submodules):
+    """
+    Update a previous export of a tree in I{export_dir} to I{treeish}.
+
+    Only paths that changed between the exported tree and I{treeish}
+    (see L{GitRepository.diff_tree}) and files modified in I{export_dir}
+    since the export are written, files not in I{treeish} are removed.
+    The result matches a full export by L{dump_tree}.
+
+    @return: C{True} if the export directory got updated, C{False} if
+        there's no usable previous export and L{dump_tree} needs to be
+        used instead
+    @rtype: C{bool}
+    """
+    state = _load_export_states(repo).get(os.path.abspath(export_dir))
+    if not state or not os.path.isdir(export_dir):
+        return False
+    if state.get('with_submodules') != with_submodules:
+        gbp.log.debug("Submodule handling changed, can't update '%s'" % export_dir)
+        return False
+    if not repo.has_treeish(state['tree']):
+        gbp.log.debug("Exported tree %s is gone, can't update '%s'" % (state['tree'], export_dir))
+        return False
+
+    # The directory is in an unknown state while updating it
+    forget_export(repo, export_dir)
+    try:
+        submodules = []
+        if with_submodules and repo.has_submodules(treeish):
+            repo.update_submodules()
+            submodules = repo.get_submodules(treeish)
+        skip = [subdir for subdir, commit in submodules]
+        _sync_dir(repo, export_dir, state['tree'], treeish, state['stamp'], skip)
+        for subdir, commit in submodules:
+            gbp.log.info("Processing submodule %s (%s)" % (subdir, commit[0:8]))
+            subrepo = GitRepository(os.path.join(repo.path, subdir))
+            old = state['submodules'].get(subdir)
+            if old and not subrepo.has_treeish(old):
+                old = None
+            nested = [os.path.relpath(path, subdir) for path, dummy in submodules
+                      if path.startswith(subdir + '/')]
+            _sync_dir(subrepo, os.path.join(export_dir, subdir), old, commit,
+                      state['stamp'], nested)
+    except (GbpError, GitRepositoryError, OSError) as err:
+        gbp.log.warn("Updating '%s' failed, exporting it again: %s" % (export_dir, err))
+        return False
+    return True
+
+
+def _scan_dir(path, skip, prefix=''):
+    """
+    Yield the path, relative path and stat result of everything below
+    I{path} except for the directories in I{skip}. Directories are
+    yielded after their content.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            rel = prefix + entry.name
+            st = entry.stat(follow_symlinks=False)
+            if entry.is_dir(follow_symlinks=False):
+                if rel in skip:
+                    continue
+                yield from _scan_dir(entry.path, skip, rel + '/')
+            yield entry.path, rel, st
+
+
+def _archive_paths(repo, target_dir, treeish, paths, max_args=1000):
+    """Extract I{paths} of I{treeish} to I{target_dir}"""
+    for start in range(0, len(paths), max_args):
+        pipe = Pipeline()
+        pipe.append(['git', '--literal-pathspecs', 'archive', '--format=tar',
+                     treeish, '--'] + paths[start:start + max_args], cwd=repo.path)
+        pipe.append(['tar', '-C', target_dir, '-xf', '-'])
+        pipe.run()
+
+
+def _sync_dir(repo, target_dir, old_treeish, new_treeish, stamp, skip):
+    """
+    Make I{target_dir} match I{new_treeish} assuming it matched
+    I{old_treeish} at time I{stamp}.
+
+    @param skip: submodule directories relative to I{target_dir} that
+        are handled separately
+    """
+    tracked = {}
+    dirs = set([''])
+    for mode, objtype, dummy, path in repo.list_tree(new_treeish, recurse=True):
+        path = os.fsdecode(path)
+        tracked[path] = objtype
+        parent = os.path.dirname(path)
+        while parent not in dirs:
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+    dirs.update(path for path, objtype in tracked.items() if objtype == 'commit')
+    skip = set(skip) | set(path for path, objtype in tracked.items() if objtype == 'commit')
+
+    write, chmod = set(), {}
+    if old_treeish is None:
+        write.update(path for path, objtype in tracked.items() if objtype == 'blob')
+    else:
+        for (old_mode, new_mode, old_sha, new_sha,
+             status, path) in repo.diff_tree(old_treeish, new_treeish):
+            path = os.fsdecode(path)
+            if tracked.get(path) != 'blob':
+                continue
+            if (old_sha == new_sha and
+                    set([old_mode, new_mode]) == set(['100644', '100755'])):
+                chmod[path] = new_mode == '100755'
+            else:
+                write.add(path)
+
+    os.makedirs(target_dir, exist_ok=True)
+    present = set()
+    for path, rel, st in _scan_dir(target_dir, skip):
+        if stat.S_ISDIR(st.st_mode):
+            if rel not in dirs:
+                os.rmdir(path)
+            continue
+        if tracked.get(rel) != 'blob':
+            gbp.log.debug("Removing '%s'" % path)
+            os.unlink(path)
+            continue
+        present.add(rel)
+        if st.st_ctime_ns >= stamp:
+            write.add(rel)
+        elif rel in chmod:
+            mode = stat.S_IMODE(st.st_mode)
+            if chmod[rel]:
+                mode |= (mode & 0o444) >> 2
+            else:
+                mode &= ~0o111
+            os.chmod(path, mode)
+    write.update(path for path, objtype in tracked.items()
+                 if objtype == 'blob' and path not in present)
+    for path in dirs:
+        os.makedirs(os.path.join(target_dir, path), exist_ok=True)
+
+    gbp.log.debug("Updating %d of %d files in '%s'" % (len(write), len(tracked), target_dir))
+    if write:
+        # Files get replaced so hardlinked copies stay untouched
+        for path in write:
+            if path in present:
+                os.unlink(os.path.join(target_dir, path))
+        _archive_paths(repo, target_dir, new_treeish, sorted(write))
+
+
 def wc_index(repo):
-    """Get path of the temporary index file used for exporting working copy"""
-    return os.path.join(repo.git_dir, "gbp_index")
+    """
+    Get path of the index file used for exporting working copy. It's
+    kept between runs so only modified files need to be hashed again.
+    """
+    return os.path.join(repo.git_dir, "gbp", "wc_index")
 
 
 def write_wc(repo, force=True):
     """write out the current working copy as a treeish object"""
     index_file = wc_index(repo)
-    repo.add_files(repo.path, force=force, index_file=index_file)
+    repo.add_files_incremental(repo.path, index_file, force=force)
     tree = repo.write_tree(index_file=index_file)
     return tree
-
-
-def drop_index(repo):
-    """drop our custom index"""
-    index_file = wc_index(repo)
-    if os.path.exists(index_file):
-        os.unlink(index_file)
@@ -132,10 +132,19 @@ def repacked_tarball_name(upstream, name, version):
     return name
 
 
-def repack_upstream(upstream, name, version, tmpdir, filters):
-    """Repack the upstream source tree"""
+def repack_upstream(upstream, name, version, tmpdir, filters, stream=False):
+    """
+    Repack the upstream source tree
+
+    With I{stream} tarballs are filtered while being copied instead of
+    being packed from the unpacked tree. Only use this if the unpacked tree
+    didn't get modified (e.g. by a postunpack hook).
+    """
     name = repacked_tarball_name(upstream, name, version)
-    repacked = upstream.pack(name, filters)
+    if stream and upstream.is_orig():
+        repacked = upstream.repack(name, filters)
+    else:
+        repacked = upstream.pack(name, filters)
     if upstream.is_orig():  # Orig already was a tarball so it was filtered on unpack
         repacked.unpacked = upstream.unpacked
     else:  # otherwise unpack the generated tarball again to get a filtered tree
@@ -133,6 +133,8 @@ def patch_path_filter(file_status: dict[str, list[str]],
         include_paths = []
         for file_list in file_status.values():
             for fname in file_list:
+                # git gives us the names as bytes
+                fname = os.fsdecode(fname)
                 if not re.match(exclude_regex, fname):
                     include_paths.append(fname)
     else:
@@ -143,66 +145,96 @@ def patch_path_filter(file_status: dict[str, list[str]],
 
 def write_patch_file(filename: str,
                      commit_info: dict,
-                     diff: bytes) -> str | None:
-    """Write patch file"""
+                     diff: bytes,
+                     keep_unchanged: bool = False) -> str | None:
+    """
+    Write patch file
+
+    @param keep_unchanged: don't rewrite the file if it has the right
+        content already
+    """
     if not diff:
         gbp.log.debug("I won't generate empty diff %s" % filename)
         return None
+    content = format_patch_header(commit_info) + b'---\n' + diff
     try:
+        if keep_unchanged and _has_content(filename, content):
+            gbp.log.debug("%s is unchanged" % filename)
+            return filename
         with open(filename, 'wb') as patch:
-            msg = Message()
-            charset = Charset('utf-8')
-            charset.body_encoding = None  # type: ignore
-            charset.header_encoding = QP
-
-            # Write headers
-            name = commit_info['author']['name']
-            email = commit_info['author']['email']
-            # Git compat: put name in quotes if special characters found
-            if re.search(r'[,.@()\[\]\\\:;]', name):
-                name = '"%s"' % name
-            from_header = Header(header_name='from')
-            try:
-                from_header.append(name, 'us-ascii')
-            except UnicodeDecodeError:
-                from_header.append(name, charset)
-            from_header.append('<%s>' % email)
-            msg['From'] = from_header  # type: ignore
-            date = commit_info['author'].datetime
-            datestr = date.strftime('%a, %-d %b %Y %H:%M:%S %z')
-            msg['Date'] = Header(datestr, 'us-ascii', header_name='date')  # type: ignore
-            subject_header = Header(header_name='subject')
-            try:
-                subject_header.append(commit_info['subject'], 'us-ascii')
-            except UnicodeDecodeError:
-                subject_header.append(commit_info['subject'], charset)
-            msg['Subject'] = subject_header  # type: ignore
-            # Write message body
-            if commit_info['body']:
-                # Strip extra linefeeds
-                body = commit_info['body'].rstrip() + '\n'
-                try:
-                    msg.set_payload(body.encode('us-ascii'))
-                except (UnicodeEncodeError):
-                    msg.set_payload(body, charset)
-            policy = Compat32(max_line_length=77)
-            patch.write(msg.as_bytes(unixfrom=False, policy=policy))
-
-            # Write diff
-            patch.write(b'---\n')
-            patch.write(diff)
+            patch.write(content)
     except IOError as err:
         raise GbpError('Unable to create patch file: %s' % err)
     return filename
 
 
+def _has_content(filename: str, content: bytes) -> bool:
+    """Check if a file exists and has the given content"""
+    try:
+        if os.path.getsize(filename) != len(content):
+            return False
+        with open(filename, 'rb') as f:
+            return f.read() == content
+    except FileNotFoundError:
+        return False
+
+
+def format_patch_header(commit_info: dict) -> bytes:
+    """Format the mail style header of a patch"""
+    msg = Message()
+    charset = Charset('utf-8')
+    charset.body_encoding = None  # type: ignore
+    charset.header_encoding = QP
+
+    # Write headers
+    name = commit_info['author']['name']
+    email = commit_info['author']['email']
+    # Git compat: put name in quotes if special characters found
+    if re.search(r'[,.@()\[\]\\\:;]', name):
+        name = '"%s"' % name
+    from_header = Header(header_name='from')
+    try:
+        from_header.append(name, 'us-ascii')
+    except UnicodeDecodeError:
+        from_header.append(name, charset)
+    from_header.append('<%s>' % email)
+    msg['From'] = from_header  # type: ignore
+    date = commit_info['author'].datetime
+    datestr = date.strftime('%a, %-d %b %Y %H:%M:%S %z')
+    msg['Date'] = Header(datestr, 'us-ascii', header_name='date')  # type: ignore
+    subject_header = Header(header_name='subject')
+    try:
+        subject_header.append(commit_info['subject'], 'us-ascii')
+    except UnicodeDecodeError:
+        subject_header.append(commit_info['subject'], charset)
+    msg['Subject'] = subject_header  # type: ignore
+    # Write message body
+    if commit_info['body']:
+        # Strip extra linefeeds
+        body = commit_info['body'].rstrip() + '\n'
+        try:
+            msg.set_payload(body.encode('us-ascii'))
+        except (UnicodeEncodeError):
+            msg.set_payload(body, charset)
+    policy = Compat32(max_line_length=77)
+    return msg.as_bytes(unixfrom=False, policy=policy)
+
+
 DEFAULT_PATCH_NUM_PREFIX_FORMAT = "%04d-"
 
 
 def format_patch(outdir, repo, commit_info, series, abbrev, numbered=True,
                  path_exclude_regex=None, topic='', name=None, renumber=False,
-                 patch_num_prefix_format=DEFAULT_PATCH_NUM_PREFIX_FORMAT):
-    """Create patch of a single commit"""
+                 patch_num_prefix_format=DEFAULT_PATCH_NUM_PREFIX_FORMAT,
+                 diff=None, keep_unchanged=False):
+    """
+    Create patch of a single commit
+
+    The commit's I{diff} as returned by L{GitRepository.iter_commit_diffs}
+    can be passed in if known already. It's not used when excluding paths.
+    With I{keep_unchanged} existing patch files with the right content
+    aren't rewritten.
+    """
 
     # Determine filename and path
     outdir = os.path.join(outdir, topic)
@@ -242,15 +274,22 @@ def format_patch(outdir, repo, commit_info, series, abbrev, numbered=True,
         filename = num_prefix + base + presuffix + suffix
         filepath = os.path.join(outdir, filename)
 
-    # Determine files to include
-    paths = patch_path_filter(commit_info['files'], path_exclude_regex)
+    if diff is None or path_exclude_regex:
+        # Determine files to include, commit infos coming along with
+        # their diff don't have them
+        files = commit_info.get('files')
+        if files is None:
+            files = repo.get_commit_info(commit_info['id'])['files']
+        paths = patch_path_filter(files, path_exclude_regex)
+        diff = None
+        if paths:
+            diff = repo.diff('%s^!' % commit_info['id'], paths=paths, stat=80,
+                             summary=True, text=True, abbrev=abbrev, copies=True)
 
     # Finally, create the patch
     patch = None
-    if paths:
-        diff = repo.diff('%s^!' % commit_info['id'], paths=paths, stat=80,
-                         summary=True, text=True, abbrev=abbrev, copies=True)
-        patch = write_patch_file(filepath, commit_info, diff)
+    if diff is not None:
+        patch = write_patch_file(filepath, commit_info, diff, keep_unchanged)
         if patch:
             series.append(patch)
     return patch
@@ -332,8 +371,18 @@ def apply_and_commit_patch(repo: GitRepository,
                            patch: Patch,
                            fallback_author: dict,
                            topic: str | None = None,
-                           name: str | None = None):
-    """apply a single patch 'patch', add topic 'topic' and commit it"""
+                           name: str | None = None,
+                           index_file: str | None = None,
+                           parent: str | None = None) -> str:
+    """
+    apply a single patch 'patch', add topic 'topic' and commit it
+
+    If 'index_file' is given the patch is only applied to that index
+    and committed on top of 'parent'. Neither the working copy nor
+    HEAD are touched in that case.
+
+    @return: the new commit's sha1
+    """
     author = {'name': patch.author,
               'email': patch.email,
               'date': patch.date}
@@ -350,12 +399,15 @@ def apply_and_commit_patch(repo: GitRepository,
         else:
             gbp.log.warn("Patch '%s' has no authorship information" % patch_fn)
 
+    cached = index_file is not None
     try:
-        repo.apply_patch(patch.path, strip=patch.strip)
+        repo.apply_patch(patch.path, strip=patch.strip,
+                         cached=cached, index_file=index_file)
     except GitRepositoryError:
         gbp.log.warn("Patch %s failed to apply, retrying with whitespace fixup" % patch_fn)
-        repo.apply_patch(patch.path, strip=patch.strip, fix_ws=True)
-    tree = repo.write_tree()
+        repo.apply_patch(patch.path, strip=patch.strip, fix_ws=True,
+                         cached=cached, index_file=index_file)
+    tree = repo.write_tree(index_file)
     msg = "%s\n\n%s" % (patch.subject, patch.long_desc)
     if topic:
         msg += "\nGbp-Pq: Topic %s" % topic
@@ -363,8 +415,11 @@ def apply_and_commit_patch(repo: GitRepository,
         msg += "\nGbp-Pq: Name %s" % name
     if author['name']:
         author['name'] = author['name'].encode('utf-8')
+    if cached:
+        return repo.commit_tree(tree, msg, [parent], author=author)
     commit = repo.commit_tree(tree, msg, [repo.head], author=author)
     repo.update_ref('HEAD', commit, msg="gbp-pq import %s" % patch.path)
+    return commit
 
 
 def drop_pq(repo: GitRepository, branch: str):
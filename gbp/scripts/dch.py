@@ -202,9 +202,10 @@ def do_snapshot(changelog, repo, next_snapshot):
     return snapshot, commit, cp['MangledVersion']
 
 
-def parse_commit(repo, commitid, opts, last_commit=False):
+def parse_commit(repo, commitid, opts, last_commit=False, commit_info=None):
     """Parse a commit and return message, author, and author email"""
-    commit_info = repo.get_commit_info(commitid)
+    if commit_info is None:
+        commit_info = repo.get_commit_info(commitid)
     author = commit_info['author'].name
     email = commit_info['author'].email
     format_entry = user_customizations.get('format_changelog_entry')
@@ -503,9 +504,10 @@ def main(argv):
 
         if args:
             gbp.log.info("Only looking for changes on '%s'" % " ".join(args))
-        commits = repo.get_commits(since=since, until=until, paths=args,
-                                   options=options.git_log.split(" "))
-        commits.reverse()
+        commits = list(repo.iter_commit_infos(since=since, until=until,
+                                              paths=args,
+                                              options=options.git_log.split(" "),
+                                              reverse=True))
 
         add_section = False
         # add a new changelog section if:
@@ -545,8 +547,9 @@ def main(argv):
         i = 0
         for c in commits:
             i += 1
-            parsed = parse_commit(repo, c, options,
-                                  last_commit=(i == len(commits)))
+            parsed = parse_commit(repo, c['id'], options,
+                                  last_commit=(i == len(commits)),
+                                  commit_info=c)
             commit_msg, (commit_author, commit_email) = parsed
             if not commit_msg:
                 # Some commits can be ignored
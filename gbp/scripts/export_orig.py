@@ -19,6 +19,8 @@
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import gbp.deb as du
 from gbp.command_wrappers import CommandExecFailed
 from gbp.config import (GbpOptionParserDebian, GbpOptionGroup)
@@ -29,6 +31,7 @@ import gbp.log
 import gbp.notifications
 from gbp.scripts.common import ExitCodes
 from gbp.pkg import Compressor, Archive
+from gbp.pkg.origcache import OrigCache
 from gbp.pkg.pkgpolicy import PkgPolicy
 
 
@@ -107,23 +110,17 @@ def pristine_tar_build_origs(repo, source, output_dir, options):
 
     comp = Compressor(options.comp_type)
     pristine_tar_prepare_orig_tree(repo, source, options)
-    try:
+    components = [None] + options.components
+    for component in components:
         gbp.log.info("Creating %s" %
                      os.path.abspath(os.path.join(output_dir,
-                                                  source.upstream_tarball_name(comp.type))))
-        repo.create_upstream_tarball_via_pristine_tar(source,
-                                                      output_dir,
-                                                      comp,
-                                                      options.upstream_signatures)
-        for component in options.components:
-            gbp.log.info("Creating %s" %
-                         os.path.abspath(os.path.join(output_dir,
-                                                      source.upstream_tarball_name(comp.type, component))))
-            repo.create_upstream_tarball_via_pristine_tar(source,
-                                                          output_dir,
-                                                          comp,
+                                                  source.upstream_tarball_name(comp.type, component))))
+    try:
+        def build(component):
+            repo.create_upstream_tarball_via_pristine_tar(source, output_dir, comp,
                                                           options.upstream_signatures,
                                                           component=component)
+        run_jobs(build, components, options)
         return True
     except GitRepositoryError:
         if hasattr(options, 'pristine_tar_commit') and options.pristine_tar_commit:
@@ -149,11 +146,41 @@ def pristine_tar_verify_origs(repo, source, options, output_dir, orig_files):
         return True
 
     pristine_tar_prepare_orig_tree(repo, source, options)
-    for f in orig_files:
-        repo.pristine_tar.verify(os.path.join(output_dir, f))
+    run_jobs(lambda f: repo.pristine_tar.fork().verify(os.path.join(output_dir, f)),
+             orig_files, options)
     return True
 
 
+def run_jobs(func, items, options):
+    """
+    Call func for each item using up to I{options.jobs} threads
+
+    >>> from types import SimpleNamespace
+    >>> run_jobs(lambda x: x * 2, [1, 2, 3], SimpleNamespace(jobs=2))
+    [2, 4, 6]
+    >>> run_jobs(lambda x: 1 // x, [1, 0, 2, 0], SimpleNamespace(jobs=4))
+    Traceback (most recent call last):
+    ...
+    ZeroDivisionError: integer division or modulo by zero
+
+    @return: the results in the order of I{items}
+    @rtype: C{list}
+    @raises Exception: the exception raised for the first failing item
+        once all jobs finished
+    """
+    jobs = getattr(options, 'jobs', 1)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs or 1, len(items))
+    if jobs <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(func, item) for item in items]
+        wait(futures)
+    return [future.result() for future in futures]
+
+
 def maybe_pristine_tar_commit(repo, source, options, output_dir, orig_files):
     if not (hasattr(options, 'pristine_tar_commit') and options.pristine_tar_commit):
         return
@@ -205,13 +232,13 @@ def git_archive_build_origs(repo, source, output_dir, options):
     @param options: the parsed options
     @type options: C{dict} of options
     """
-    comp = Compressor(options.comp_type, options.comp_level)
+    comp = Compressor(options.comp_type, options.comp_level, options.comp_threads)
     upstream_tree = git_archive_get_upstream_tree(repo, source, options)
     gbp.log.info("Creating %s from '%s'" % (source.upstream_tarball_name(comp.type),
                                             upstream_tree))
     gbp.log.debug("Building upstream tarball with compression %s" % comp)
     tree = repo.tree_drop_dirs(upstream_tree, options.components) if options.components else upstream_tree
-    repo.create_upstream_tarball_via_git_archive(source, output_dir, tree, comp, options.with_submodules)
+    trees = [(tree, None)]
     for component in options.components:
         subtree = repo.tree_get_dir(upstream_tree, component)
         if not subtree:
@@ -220,8 +247,46 @@ def git_archive_build_origs(repo, source, output_dir, options):
         gbp.log.info("Creating additional tarball '%s' from '%s'"
                      % (source.upstream_tarball_name(options.comp_type, component=component),
                         subtree))
-        repo.create_upstream_tarball_via_git_archive(source, output_dir, subtree, comp,
-                                                     options.with_submodules, component=component)
+        trees.append((subtree, component))
+    cache = orig_cache(options)
+    run_jobs(lambda tree: git_archive_build_orig(repo, source, output_dir, tree[0], comp,
+                                                 options, cache, component=tree[1]),
+             trees, options)
+
+
+def orig_cache(options):
+    """
+    The orig tarball cache to use
+
+    @return: the cache or C{None} if disabled
+    @rtype: L{OrigCache}
+    """
+    if not getattr(options, 'orig_cache', False):
+        return None
+    return OrigCache(max_size=options.orig_cache_size << 20)
+
+
+def git_archive_build_orig(repo, source, output_dir, treeish, comp, options, cache,
+                           component=None):
+    """
+    Build a single orig tarball using git-archive reusing a cached one
+    if it was built from the same tree before.
+    """
+    output = os.path.join(output_dir, source.upstream_tarball_name(comp.type, component=component))
+    if cache:
+        submodules = None
+        if options.with_submodules and repo.has_submodules():
+            submodules = repo.get_submodules(treeish)
+        key = cache.key(repo.rev_parse('%s^{tree}' % treeish),
+                        repo.sanitize_prefix("%s-%s" % (source.name, source.upstream_version)),
+                        'tar', comp, submodules)
+        if cache.fetch(key, output):
+            gbp.log.info("Using cached %s" % os.path.basename(output))
+            return
+    repo.create_upstream_tarball_via_git_archive(source, output_dir, treeish, comp,
+                                                 options.with_submodules, component=component)
+    if cache:
+        cache.store(key, output)
 
 
 def guess_comp_type(comp_type, source, repo, tarball_dir):
@@ -245,14 +310,13 @@ def guess_comp_type(comp_type, source, repo, tarball_dir):
                 branch = 'origin/pristine-tar'
 
         if branch is not None:
-            regex = r'pristine-tar .* %s_%s\.orig.tar\.' % (source.name, source.upstream_version)
-            commits = repo.grep_log(regex, branch, merges=False)
-            if commits:
-                commit = commits[-1]
-                gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
+            index = repo.pristine_tar.index(branch)
+            found = index.find(r'%s_%s\.orig.tar\.' % (source.name, source.upstream_version))
+            if found:
+                gbp.log.debug("Found pristine-tar commit at '%s'" % found[1])
             else:
-                commit = branch
-            tarball = repo.get_commit_info(commit)['subject']
+                found = index.latest()
+            tarball = found[0] if found else repo.get_commit_info(branch)['subject']
             (base_name, archive_fmt, comp_type) = Archive.parse_filename(tarball)
             gbp.log.debug("Determined compression type '%s'" % comp_type)
             if not comp_type:
@@ -305,12 +369,22 @@ def build_parser(name):
                                       help="Compression type, default is '%(compression)s'")
     orig_group.add_config_file_option(option_name="compression-level", dest="comp_level",
                                       help="Compression level, default is '%(compression-level)s'")
+    orig_group.add_config_file_option(option_name="compression-threads", dest="comp_threads",
+                                      type="int", metavar="N",
+                                      help="Number of threads to compress with, 0 uses all CPUs, "
+                                      "default is '%(compression-threads)s'")
     orig_group.add_config_file_option(option_name="upstream-signatures", dest="upstream_signatures",
                                       help="use upstream signature, default is auto", type='tristate')
     orig_group.add_config_file_option("component", action="append", metavar='COMPONENT',
                                       dest="components")
     orig_group.add_boolean_config_file_option(option_name="pristine-tar-commit",
                                               dest="pristine_tar_commit")
+    orig_group.add_boolean_config_file_option(option_name="orig-cache", dest="orig_cache")
+    orig_group.add_config_file_option(option_name="orig-cache-size", dest="orig_cache_size",
+                                      type="int", metavar="MIB")
+    orig_group.add_config_file_option(option_name="jobs", dest="jobs", type="int", metavar="N")
+    orig_group.add_option("--cache-stats", dest="cache_stats", action="store_true", default=False,
+                          help="show statistics about the orig tarball cache and exit")
     branch_group.add_config_file_option(option_name="upstream-branch", dest="upstream_branch")
     branch_group.add_boolean_config_file_option(option_name="submodules", dest="with_submodules")
     return parser
@@ -335,6 +409,10 @@ def main(argv):
     if args or not options:
         return ExitCodes.parse_error
 
+    if options.cache_stats:
+        sys.stdout.write(OrigCache(max_size=options.orig_cache_size << 20).format_stats())
+        return 0
+
     try:
         repo = DebianGitRepository(os.path.curdir, toplevel=False)
     except GitRepositoryError:
@@ -37,7 +37,7 @@ from gbp.config import (GbpOptionParserDebian, GbpOptionGroup,
 from gbp.errors import GbpError
 from gbp.scripts.common import ExitCodes, debug_exc
 from gbp.scripts.common import repo_setup
-from gbp import pipes
+from gbp.pipeline import Pipeline, PipelineError
 import gbp.log
 
 
@@ -74,16 +74,12 @@ def apply_patch(diff):
                   '-Vnever', '-g0', '-z.gbp.orig',
                   '--quiet']
 
-    pipe = pipes.Template()
-    pipe.prepend('gunzip -c %s' % diff, '.-')
-    pipe.append('patch %s' % ' '.join(patch_opts), '-.')
-
+    pipe = Pipeline(['gunzip', '-c', diff],
+                    ['patch'] + patch_opts)
     try:
-        ret = pipe.copy('', '')
-        if ret:
-            raise GbpError("Error import %s: %d" % (diff, ret))
-    except OSError as err:
-        raise GbpError("Error importing %s: %s" % (diff, err[0]))
+        pipe.run()
+    except PipelineError as err:
+        raise GbpError("Error importing %s: %s" % (diff, err))
 
 
 def apply_deb_tgz(deb_tgz, filters):
@@ -310,7 +310,8 @@ def unpack_tarballs(repo, name, sources, version, options):
                                                                          sources[0].unpacked))
         # FIXME: we should repack the other tarballs here too (See #860457)
         # for that we better move around sources instead of source[0]
-        (source, tmpdir) = repack_upstream(sources[0], name, version, tmpdir, options.filters)
+        (source, tmpdir) = repack_upstream(sources[0], name, version, tmpdir, options.filters,
+                                           stream=not options.postunpack)
         sources[0] = source
 
     if not sources[0].is_dir():  # Unpack component tarballs
@@ -18,6 +18,8 @@
 """Manage Debian patches on a patch queue branch"""
 
 import errno
+import hashlib
+import json
 import os
 from optparse import Values
 import shutil
@@ -44,20 +46,23 @@ PATCH_DIR = "debian/patches/"
 SERIES_FILE = os.path.join(PATCH_DIR, "series")
 
 
-def generate_patches(repo, start, end, outdir, options):
+def generate_patches(repo, start, end, outdir, options, keep_unchanged=False):
     """
     Generate patch files from git
+
+    @param keep_unchanged: don't rewrite patch files that have the
+        right content already
     """
     gbp.log.info("Generating patches from git (%s..%s)" % (start, end))
     patches = []
-    for treeish in [start, end]:
-        if not repo.has_treeish(treeish):
+    for treeish, valid in zip([start, end], repo.has_treeish_many([start, end])):
+        if not valid:
             raise GbpError('%s not a valid tree-ish' % treeish)
 
-    # Generate patches
-    rev_list = reversed(repo.get_commits(start, end))
-    for commit in rev_list:
-        info = repo.get_commit_info(commit)
+    # Generate patches, the commits' data and diffs are read at once
+    for info, diff in repo.iter_commit_diffs(start, end, stat=80, summary=True,
+                                             text=True, abbrev=options.abbrev,
+                                             copies=True, reverse=True):
         # Parse 'Gbp-Pq: ' style commands
         (cmds, info['body']) = parse_gbp_commands(info,
                                                   'gbp-pq',
@@ -73,7 +78,8 @@ def generate_patches(repo, start, end, outdir, options):
                          numbered=options.patch_numbers,
                          topic=topic, name=name,
                          renumber=options.renumber,
-                         patch_num_prefix_format=options.patch_num_format)
+                         patch_num_prefix_format=options.patch_num_format,
+                         diff=diff, keep_unchanged=keep_unchanged)
         else:
             gbp.log.info('Ignoring commit %s' % info['id'])
 
@@ -173,6 +179,113 @@ def pq_on_upstream_tag(pq_from: str) -> bool:
     return True if pq_from.upper() == 'TAG' else False
 
 
+def export_state_file(repo: DebianGitRepository) -> str:
+    """
+    Get path of the file recording the incremental exports of the
+    patch queues
+    """
+    return os.path.join(repo.git_dir, "gbp", "pq-export.json")
+
+
+def import_state_file(repo: DebianGitRepository) -> str:
+    """
+    Get path of the file caching how many patches of a series apply to
+    a tree
+    """
+    return os.path.join(repo.git_dir, "gbp", "pq-import.json")
+
+
+def _load_states(path: str) -> dict:
+    try:
+        with open(path) as f:
+            states = json.load(f)
+        if isinstance(states, dict):
+            return states
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_states(path: str, states: dict):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(states, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as err:
+        gbp.log.warn("Failed to record state in %s: %s" % (path, err))
+
+
+def _scan_patch_dir(patch_dir: str) -> dict[str, list[int]]:
+    """Size and modification time of all files in I{patch_dir}"""
+    files = {}
+    for root, dirs, names in os.walk(patch_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            files[os.path.relpath(path, patch_dir)] = [st.st_size, st.st_mtime_ns]
+    return files
+
+
+def export_patches_incremental(repo: DebianGitRepository,
+                               branch: str,
+                               base: str,
+                               patch_dir: str,
+                               options: Values) -> list[str]:
+    """
+    Export the patch queue of I{branch} only writing the patches that
+    changed and removing the ones that are gone. The result is the same
+    as with a full export. If neither the patch queue nor its base moved
+    since the last export and the exported files weren't touched nothing
+    needs to be done at all.
+
+    @return: the exported patches
+    @rtype: C{list} of C{str}
+    """
+    pq_branch = pq_branch_name(branch)
+    states = _load_states(export_state_file(repo))
+    old = states.get(branch, {})
+    state = {'base': repo.rev_parse('%s^0' % base),
+             'head': repo.rev_parse('%s^0' % pq_branch),
+             'options': [options.abbrev, options.patch_numbers,
+                         options.renumber, options.patch_num_format]}
+    if (all(old.get(key) == value for (key, value) in state.items()) and
+            old.get('files') == _scan_patch_dir(patch_dir)):
+        gbp.log.info("'%s' didn't change since the last export" % pq_branch)
+        return [os.path.join(patch_dir, patch) for patch in old['series']]
+
+    patches = generate_patches(repo, base, pq_branch, patch_dir, options, keep_unchanged=True)
+    series = [os.path.relpath(patch, patch_dir) for patch in patches]
+    keep = set(series + ['series']) if patches else set()
+    for root, dirs, names in os.walk(patch_dir, topdown=False):
+        for name in names + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            path = os.path.join(root, name)
+            if os.path.relpath(path, patch_dir) not in keep:
+                gbp.log.debug("Removing %s" % path)
+                os.unlink(path)
+        if not os.listdir(root):
+            os.rmdir(root)
+
+    if patches:
+        content = ''.join(patch + '\n' for patch in series)
+        series_file = os.path.join(patch_dir, 'series')
+        try:
+            with open(series_file) as f:
+                unchanged = f.read() == content
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            with open(series_file, 'w') as f:
+                f.write(content)
+
+    state['series'] = series
+    state['files'] = _scan_patch_dir(patch_dir)
+    states[branch] = state
+    _save_states(export_state_file(repo), states)
+    return patches
+
+
 def export_patches(repo: DebianGitRepository,
                    branch: str,
                    options: Values):
@@ -186,26 +299,30 @@ def export_patches(repo: DebianGitRepository,
         repo.set_branch(branch)
 
     pq_branch = pq_branch_name(branch)
-    try:
-        shutil.rmtree(patch_dir)
-    except OSError as e:
-        if e.errno != errno.ENOENT:
-            raise GbpError("Failed to remove patch dir: %s" % e.strerror)
-        else:
-            gbp.log.debug("%s does not exist." % patch_dir)
+    if not options.incremental:
+        try:
+            shutil.rmtree(patch_dir)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise GbpError("Failed to remove patch dir: %s" % e.strerror)
+            else:
+                gbp.log.debug("%s does not exist." % patch_dir)
 
     if pq_on_upstream_tag(options.pq_from):
         base = find_upstream_commit(repo, branch, options.upstream_tag)
     else:
         base = branch
 
-    patches = generate_patches(repo, base, pq_branch, patch_dir, options)
-
-    if patches:
-        with open(series_file, 'w') as seriesfd:
-            for patch in patches:
-                seriesfd.write(os.path.relpath(patch, patch_dir) + '\n')
+    if options.incremental:
+        patches = export_patches_incremental(repo, branch, base, patch_dir, options)
     else:
+        patches = generate_patches(repo, base, pq_branch, patch_dir, options)
+        if patches:
+            with open(series_file, 'w') as seriesfd:
+                for patch in patches:
+                    seriesfd.write(os.path.relpath(patch, patch_dir) + '\n')
+
+    if not patches:
         gbp.log.info("No patches on '%s' - nothing to export." % pq_branch)
 
     if options.commit:
@@ -252,7 +369,9 @@ def import_quilt_patches(repo: DebianGitRepository,
                          tries: int,
                          force: bool,
                          pq_from: str,
-                         upstream_tag: str) -> int:
+                         upstream_tag: str,
+                         in_index: bool = False,
+                         bisect: bool = False) -> int:
     """
     apply a series of quilt patches in the series file 'series' to branch
     the patch-queue branch for 'branch'
@@ -267,6 +386,10 @@ def import_quilt_patches(repo: DebianGitRepository,
                     DEBIAN indicates the current branch, TAG indicates that
                     the corresponding upstream tag should be used.
     @param upstream_tag: upstream tag template to use
+    @param in_index: apply the patches to a private index and only check
+                     out the resulting patch-queue branch at the end
+    @param bisect: find the commit to apply the patches to by binary
+                   search instead of going back one commit after each failure
     """
     tmpdir = None
     series = os.path.join(repo.path, series)
@@ -301,11 +424,26 @@ def import_quilt_patches(repo: DebianGitRepository,
             tmpdir, series = safe_patches(series, repo)
 
     queue = PatchSeries.read_series_file(series)
+    if bisect and len(commits) > 1:
+        commits = [bisect_patch_base(repo, commits, queue)]
 
     i = len(commits)
     for commit in commits:
         if len(commits) > 1:
             gbp.log.info("%d %s left" % (i, 'tries' if i > 1 else 'try'))
+        if in_index:
+            gbp.log.info("Trying to apply patches at '%s'" % commit)
+            head = apply_patches_in_index(repo, commit, queue, maintainer)
+            if head:
+                try:
+                    repo.create_branch(pq_branch, head)
+                except GitRepositoryError:
+                    raise GbpError("Cannot create patch-queue branch '%s'." % pq_branch)
+                repo.set_branch(pq_branch)
+                break
+            i -= 1
+            continue
+
         try:
             gbp.log.info("Trying to apply patches at '%s'" % commit)
             repo.create_branch(pq_branch, commit)
@@ -338,6 +476,113 @@ def import_quilt_patches(repo: DebianGitRepository,
     return len(queue)
 
 
+def apply_patches_in_index(repo: DebianGitRepository,
+                           base: str,
+                           queue: PatchSeries,
+                           maintainer: dict) -> str | None:
+    """
+    Apply and commit the patches in 'queue' on top of 'base' using a
+    private index seeded from base's tree. Neither the working copy nor
+    any branch gets touched.
+
+    @return: the last commit created or C{None} if a patch failed to apply
+    """
+    index_file = os.path.join(repo.git_dir, 'gbp', 'pq_import_index')
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    head = repo.rev_parse('%s^{commit}' % base)
+    try:
+        repo.read_tree(head, index_file)
+        for patch in queue:
+            gbp.log.debug("Applying %s" % patch.path)
+            try:
+                name = os.path.basename(patch.path)
+                head = apply_and_commit_patch(repo, patch, maintainer, patch.topic, name,
+                                              index_file=index_file, parent=head)
+            except Exception as e:
+                gbp.log.err("Failed to apply '%s': %s" % (patch.path, e))
+                return None
+    finally:
+        if os.path.exists(index_file):
+            os.unlink(index_file)
+    return head
+
+
+def _series_digest(queue: PatchSeries) -> str:
+    """Checksum over the content and strip levels of a patch series"""
+    digest = hashlib.sha1()
+    for patch in queue:
+        with open(patch.path, 'rb') as f:
+            digest.update(b'%d\0%s\0' % (patch.strip or 0, hashlib.sha1(f.read()).digest()))
+    return digest.hexdigest()
+
+
+def count_applying_patches(repo: DebianGitRepository,
+                           treeish: str,
+                           queue: PatchSeries,
+                           index_file: str) -> int:
+    """
+    Count how many leading patches of 'queue' apply on top of 'treeish'.
+    The patches are only applied to the throwaway index 'index_file', no
+    commits or branches get created.
+    """
+    repo.read_tree(treeish, index_file)
+    for num, patch in enumerate(queue):
+        # The last patch only needs to be checked
+        check = num == len(queue) - 1
+        for fix_ws in [False, True]:
+            try:
+                repo.apply_patch(patch.path, strip=patch.strip, fix_ws=fix_ws,
+                                 cached=True, check=check, index_file=index_file)
+                break
+            except GitRepositoryError:
+                pass
+        else:
+            return num
+    return len(queue)
+
+
+def bisect_patch_base(repo: DebianGitRepository,
+                      commits: list[str],
+                      queue: PatchSeries) -> str:
+    """
+    Find the newest of 'commits' (ordered newest first) that the whole of
+    'queue' applies to by binary search. This assumes that once the series
+    applies to a commit it also applies to all older ones. The results are
+    cached per tree so repeated imports of the same series are cheap.
+    """
+    path = import_state_file(repo)
+    digest = _series_digest(queue)
+    results = _load_states(path).get(digest, {})
+    index_file = os.path.join(repo.git_dir, 'gbp', 'pq_import_index')
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+
+    def applies(commit):
+        tree = repo.rev_parse('%s^{tree}' % commit)
+        if tree not in results:
+            results[tree] = count_applying_patches(repo, tree, queue, index_file)
+        gbp.log.info("%d of %d patches apply at '%s'" % (results[tree], len(queue), commit))
+        return results[tree] == len(queue)
+
+    try:
+        # Most of the time the series applies to the newest commit
+        if applies(commits[0]):
+            return commits[0]
+        lo, hi = 1, len(commits)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if applies(commits[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+    finally:
+        if os.path.exists(index_file):
+            os.unlink(index_file)
+        _save_states(path, {digest: results})
+    if lo == len(commits):
+        raise GbpError("Couldn't apply patches")
+    return commits[lo]
+
+
 def rebase_pq(repo: DebianGitRepository, branch: str, options: Values):
     maybe_import_pq(repo, branch, options)
     # Make sure we're on the pq branch
@@ -360,7 +605,9 @@ def import_pq(repo: DebianGitRepository, branch: str, options: Values):
     tries = options.time_machine if (options.time_machine > 0) else 1
     num = import_quilt_patches(repo, branch, series, tries,
                                options.force, options.pq_from,
-                               options.upstream_tag)
+                               options.upstream_tag,
+                               options.import_in_index,
+                               options.time_machine_search == 'bisect')
     gbp.log.info("%d patches listed in '%s' imported on '%s'" %
                  (num, series, repo.get_branch()))
 
@@ -425,8 +672,12 @@ def build_parser(name: str) -> GbpOptionParserDebian | None:
                       help="verbose command execution")
     parser.add_option("--topic", dest="topic", help="in case of 'apply' topic (subdir) to put patch into")
     parser.add_config_file_option(option_name="time-machine", dest="time_machine", type="int")
+    parser.add_config_file_option(option_name="time-machine-search", dest="time_machine_search",
+                                  choices=['linear', 'bisect'])
     parser.add_boolean_config_file_option("drop", dest='drop')
     parser.add_boolean_config_file_option(option_name="commit", dest="commit")
+    parser.add_boolean_config_file_option(option_name="incremental", dest="incremental")
+    parser.add_boolean_config_file_option(option_name="import-in-index", dest="import_in_index")
     parser.add_config_file_option(option_name="abbrev", dest="abbrev", type="int")
     parser.add_option("--force", dest="force", action="store_true", default=False,
                       help="in case of import even import if the branch already exists")
@@ -64,8 +64,8 @@ def generate_patches(repo, start, end, outdir, options):
     gbp.log.info("Generating patches from git (%s..%s)" % (start, end))
     patches = []
     commands = {}
-    for treeish in [start, end]:
-        if not repo.has_treeish(treeish):
+    for treeish, valid in zip([start, end], repo.has_treeish_many([start, end])):
+        if not valid:
             raise GbpError('Invalid treeish object %s' % treeish)
 
     start_sha1 = repo.rev_parse("%s^0" % start)
@@ -97,8 +97,9 @@ def generate_patches(repo, start, end, outdir, options):
             start = merge_sha1
 
     # Generate patches
-    for commit in reversed(repo.get_commits(start, end_commit)):
-        info = repo.get_commit_info(commit)
+    for info, diff in repo.iter_commit_diffs(start, end_commit, stat=80, summary=True,
+                                             text=True, abbrev=options.abbrev,
+                                             copies=True, reverse=True):
         (cmds, info['body']) = parse_gbp_commands(info,
                                                   'gbp-rpm',
                                                   ('ignore'),
@@ -106,7 +107,7 @@ def generate_patches(repo, start, end, outdir, options):
         if 'ignore' not in cmds:
             patch_fn = format_patch(outdir, repo, info, patches,
                                     numbered=options.patch_numbers,
-                                    abbrev=options.abbrev)
+                                    abbrev=options.abbrev, diff=diff)
             if patch_fn:
                 commands[os.path.basename(patch_fn)] = cmds
         else:
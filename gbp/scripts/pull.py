@@ -67,14 +67,16 @@ def fast_forward_branch(rem_repo, branch, repo, options):
                          "update manually" % branch)
 
     if update:
-        gbp.log.info("Updating '%s': %s..%s" % (branch,
-                                                repo.rev_parse(branch, short=12),
-                                                repo.rev_parse(remote, short=12)))
+        sha1s = repo.rev_parse_many([branch, remote])
+        for name, sha1 in zip([branch, remote], sha1s):
+            if sha1 is None:
+                raise GitRepositoryError("revision '%s' not found" % name)
+        short = repo.rev_parse_many(sha1s, short=12)
+        gbp.log.info("Updating '%s': %s..%s" % (branch, short[0], short[1]))
         if repo.branch == branch:
             repo.merge(remote)
         else:
-            sha1 = repo.rev_parse(remote)
-            repo.update_ref("refs/heads/%s" % branch, sha1,
+            repo.update_ref("refs/heads/%s" % branch, sha1s[1],
                             msg="gbp: forward %s to %s" % (branch, remote))
     return update
 
@@ -93,8 +93,12 @@ def get_push_src(repo, ref, tag):
     If the ref is further ahead than the tag
     we only want to push up to this tag.
     """
-    commit = repo.rev_parse("%s^{commit}" % tag)
-    if repo.rev_parse(ref) == commit:
+    commit_name = "%s^{commit}" % tag
+    commit, ref_commit = repo.rev_parse_many([commit_name, ref])
+    for name, sha1 in [(commit_name, commit), (ref, ref_commit)]:
+        if sha1 is None:
+            raise GitRepositoryError("revision '%s' not found" % name)
+    if ref_commit == commit:
         return ref
     else:
         return commit
@@ -22,6 +22,8 @@ import os
 import re
 import sys
 
+import gbp.profile
+
 # Command is this module and common/ is shared code
 # so we don't allow these to be imported:
 invalid_modules = ['common', 'supercommand']
@@ -38,7 +40,7 @@ def sanitize(cmd):
 def usage():
     print("""
 Usage:
-    gbp <command> [<args>]
+    gbp [--profile=<file>] <command> [<args>]
 
 The most commonly used commands are:
 
@@ -108,6 +110,10 @@ def list_available_commands():
 def supercommand(argv=None):
     argv = argv or sys.argv
 
+    if len(argv) > 1 and argv[1].startswith('--profile='):
+        gbp.profile.enable(argv[1].split('=', 1)[1])
+        argv = argv[:1] + argv[2:]
+
     if len(argv) < 2:
         usage()
         return 1
@@ -23,8 +23,8 @@ from tests.component import ComponentTestBase
 from tests.component.deb.fixtures import RepoFixtures
 from tests.testutils import skip_without_cmd
 
-from gbp.git import GitRepository
-from gbp.scripts.push import main as push
+from gbp.git import GitRepository, GitRepositoryError
+from gbp.scripts.push import main as push, get_push_src
 
 
 class TestPush(ComponentTestBase):
@@ -148,3 +148,10 @@ class TestPush(ComponentTestBase):
         self.assertEqual(repo.head, self.target.head)
         self._check_in_log('.*Error running git push: To.*/target')
         self._check_log(-1, ".*Failed to push some refs")
+
+    @RepoFixtures.native()
+    def test_push_src_missing_ref(self, repo):
+        """A missing ref is an error"""
+        self.assertEqual(get_push_src(repo, 'master', 'HEAD'), 'master')
+        with self.assertRaisesRegex(GitRepositoryError, "revision 'doesnotexist' not found"):
+            get_push_src(repo, 'doesnotexist', 'HEAD')
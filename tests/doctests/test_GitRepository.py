@@ -365,6 +365,11 @@ def test_repo():
     defaultdict(<class 'list'>, {})
     >>> repo.diff_status("HEAD~1", "HEAD")
     defaultdict(<class 'list'>, {'M': [b'testfile']})
+    >>> # test_diff_tree():
+    >>> repo.diff_tree("HEAD", "HEAD")
+    []
+    >>> [change[4:] for change in repo.diff_tree("HEAD~1", "HEAD")]
+    [('M', b'testfile')]
     >>> # test_mirror_clone():
     >>> # Mirror a repository
     >>> repo = gbp.git.GitRepository(dirs['repo'])
@@ -7,6 +7,7 @@ from . import context
 import os
 import shutil
 import tarfile
+import time
 import unittest
 
 import gbp.log
@@ -113,6 +114,39 @@ class TestSubmodule(unittest.TestCase):
         assert not os.path.exists(os.path.join(dumpdir, TESTDIR_NAME))
         assert not os.path.exists(os.path.join(dumpdir, self.submodules[0].name))
 
+    def test_sync_tree(self):
+        """Update an export with submodules incrementally"""
+        self._add_submodule()
+        dumpdir = self.tmpdir.join("dump")
+        assert buildpackage.dump_tree(self.repo, dumpdir, "master", True)
+        buildpackage.record_export(self.repo, dumpdir, "master", True, time.time_ns())
+
+        # Change the submodule and the superproject
+        subdir = os.path.join(self.repodir, self.submodules[0].name)
+        subrepo = gbp.git.GitRepository(subdir)
+        with open(os.path.join(subdir, 'newfile'), 'w') as f:
+            f.write('new\n')
+        subrepo.add_files('newfile')
+        subrepo.remove_files(os.path.join(TESTDIR_NAME, TESTFILE_NAME))
+        subrepo.commit_all('changed submodule')
+        self.repo.add_files(self.submodules[0].name)
+        self.repo.commit_all('Updated submodule')
+
+        assert buildpackage.sync_tree(self.repo, dumpdir, "master", True)
+        assert os.path.exists(os.path.join(dumpdir, self.submodules[0].name, 'newfile'))
+        assert not os.path.exists(os.path.join(dumpdir, self.submodules[0].name, TESTDIR_NAME))
+
+        fulldir = self.tmpdir.join("full", "dump")
+        os.mkdir(os.path.dirname(fulldir))
+        assert buildpackage.dump_tree(self.repo, fulldir, "master", True)
+        for root, dirs, files in os.walk(fulldir):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), fulldir)
+                with open(os.path.join(fulldir, rel), 'rb') as full, \
+                        open(os.path.join(dumpdir, rel), 'rb') as synced:
+                    assert full.read() == synced.read()
+        assert sorted(os.listdir(dumpdir)) == sorted(os.listdir(fulldir))
+
     def test_create_zip_archives(self):
         """Create an upstream zip archive"""
         self._add_submodule()
@@ -168,6 +202,39 @@ class TestSubmodule(unittest.TestCase):
         assert ("test-0.2/%s" % TESTFILE_NAME) in [f.name for f in files]
         assert len(files) == 6
 
+    def test_streamed_tarfile(self):
+        """Streamed tarballs match the ones created by tar --concatenate"""
+        self._add_submodule()
+        self._add_whitespace_submodule()
+
+        submodule_tar = self.tmpdir.join('submodule.tar')
+        self.repo.archive('tar', 'test/', 'expected.tar', 'HEAD')
+        for subdir, commit in self.repo.get_submodules('HEAD'):
+            self.repo.archive('tar', 'test/%s/' % subdir, submodule_tar, commit, cwd=subdir)
+            gbp.command_wrappers.CatenateTarArchive('expected.tar')(submodule_tar)
+
+        self.repo.archive_jobs = 1
+        self.repo.archive_comp('HEAD', 'streamed.tar', 'test', None, submodules=True)
+        with open('expected.tar', 'rb') as expected, open('streamed.tar', 'rb') as streamed:
+            data = streamed.read()
+            # tar --concatenate might add an additional record of zeros
+            assert data.rstrip(b'\0') == expected.read().rstrip(b'\0')
+            assert len(data) % (20 * 512) == 0
+
+        self.repo.archive_comp('HEAD', 'streamed.tar.xz', 'test', Compressor('xz'),
+                               submodules=True)
+        names = tarfile.open('streamed.tar.xz').getnames()
+        assert names == tarfile.open('expected.tar').getnames()
+        assert "test/sub module/testdir/testfile" in names
+
+    def test_streamed_tarfile_error(self):
+        """A failing compressor fails the whole tarball"""
+        self._add_submodule()
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "Error creating streamed.tar.gz: 'gzip -0 -n -c' failed"):
+            self.repo.archive_comp('HEAD', 'streamed.tar.gz', 'test', Compressor('gzip', 0),
+                                   submodules=True)
+
     def test_get_more_submodules(self):
         """Check for submodules list of  (name, hash)"""
         self._add_submodule()
@@ -13,10 +13,24 @@ from gbp.deb import DebianPkgPolicy
 from gbp.errors import GbpError
 
 
+class MockPristineTarIndex:
+    def find(self, archive_regexp):
+        return None
+
+    def latest(self):
+        return None
+
+
+class MockPristineTar:
+    def index(self, branch=None):
+        return MockPristineTarIndex()
+
+
 class MockGitRepository:
     def __init__(self, with_branch=False, subject=None):
         self.with_branch = with_branch
         self.subject = subject
+        self.pristine_tar = MockPristineTar()
 
     def has_pristine_tar_branch(self):
         return self.with_branch
@@ -27,9 +41,6 @@ class MockGitRepository:
     def pristine_tar_branch(self):
         'pristine-tar'
 
-    def grep_log(self, regex, branch, merges=True):
-        return None
-
     def get_commit_info(self, commit):
         return {'subject': self.subject}
 
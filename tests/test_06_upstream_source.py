@@ -6,10 +6,12 @@ from . import context
 
 import glob
 import os
+import subprocess
 import tarfile
 import unittest
 import zipfile
 
+from gbp.errors import GbpError
 from gbp.pkg import UpstreamSource
 
 
@@ -73,6 +75,70 @@ class TestTar(unittest.TestCase):
                                   ["gbp/__init__.py"])
 
 
+class TestRepack(unittest.TestCase):
+    """Test repacking tarballs without unpacking them"""
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.tarball = self.tmpdir.join("gbp_0.1.orig.tar.bz2")
+        with tarfile.open(self.tarball, mode="w:bz2") as t:
+            t.add(os.path.join(context.projectdir, "gbp"), "gbp-0.1")
+
+    def tearDown(self):
+        context.teardown()
+
+    def _members(self, path):
+        with tarfile.open(path) as t:
+            return {m.name: (m.mode, m.mtime, t.extractfile(m).read() if m.isfile() else None)
+                    for m in t}
+
+    def test_repack(self):
+        """Filtered members are dropped, everything else is kept"""
+        target = self.tmpdir.join("gbp_0.1.orig.gbp.tar.xz")
+        repacked = UpstreamSource(self.tarball).repack(target, ["__init__.py", "scripts"])
+        self.assertEqual(repacked.path, target)
+        self.assertTrue(repacked.is_orig())
+        expected = {name: member for (name, member) in self._members(self.tarball).items()
+                    if not name.endswith("/__init__.py") and "/scripts" not in name}
+        self.assertIn("gbp-0.1/errors.py", expected)
+        self.assertEqual(self._members(target), expected)
+
+    def test_repack_sparse(self):
+        """Sparse members are stored densely"""
+        srcdir = self.tmpdir.join("sparse", "gbp-0.1")
+        os.makedirs(srcdir)
+        with open(os.path.join(srcdir, "sparse"), "wb") as f:
+            f.seek(500000)
+            f.write(b"data")
+            f.truncate(1 << 20)
+        with open(os.path.join(srcdir, "regular"), "w") as f:
+            f.write("regular\n")
+        for fmt in ["gnu", "pax"]:
+            with self.subTest(format=fmt):
+                tarball = self.tmpdir.join("gbp_0.1.orig-%s.tar.gz" % fmt)
+                subprocess.check_call(["tar", "--format=%s" % fmt, "-cSzf", tarball,
+                                       "-C", os.path.dirname(srcdir), "gbp-0.1"])
+                with tarfile.open(tarball) as t:
+                    self.assertTrue(t.getmember("gbp-0.1/sparse").issparse())
+                target = self.tmpdir.join("gbp_0.1.orig-%s.gbp.tar.gz" % fmt)
+                UpstreamSource(tarball).repack(target)
+                with tarfile.open(target) as t:
+                    self.assertFalse(t.getmember("gbp-0.1/sparse").issparse())
+                self.assertEqual(self._members(target), self._members(tarball))
+
+    def test_repack_corrupt(self):
+        """Corrupt tarballs don't leave a repacked one behind"""
+        with open(self.tarball, "r+b") as f:
+            f.truncate(os.path.getsize(self.tarball) // 2)
+        target = self.tmpdir.join("gbp_0.1.orig.gbp.tar.gz")
+        with self.assertRaisesRegex(GbpError, "Couldn't repack"):
+            UpstreamSource(self.tarball).repack(target)
+        self.assertFalse(os.path.exists(target))
+
+    def test_repack_no_tarball(self):
+        with self.assertRaisesRegex(GbpError, "Can only repack tarballs"):
+            UpstreamSource(self.tmpdir.join("gbp")).repack(self.tmpdir.join("gbp_0.1.tar.gz"))
+
+
 class TestZip(unittest.TestCase):
     """Test if unpacking zip archives works"""
     def setUp(self):
@@ -10,7 +10,10 @@ also make up the API documentation.
 from . import context  # noqa: F401
 from . import testutils
 
+import contextlib
+import io
 import os
+import subprocess
 
 import gbp.log
 import gbp.git
@@ -78,4 +81,424 @@ class TestHasBranch(testutils.DebianGitTestRepo):
         self.repo.create_branch("refs/heads/bar")
         self.assertFalse(self.repo.has_branch("bar"))
 
+
+class TestCatFile(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'bar\n')
+
+    def test_show_blob(self):
+        """Blobs are read via the persistent cat-file process"""
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+        catfile = self.repo._catfile
+        self.assertIsNotNone(catfile)
+        proc = catfile._procs[catfile.batch]
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+        self.assertIs(proc, catfile._procs[catfile.batch])
+
+    def test_object_lookups(self):
+        """Object type and tree lookups"""
+        self.assertEqual(self.repo.get_obj_type('HEAD'), 'commit')
+        self.assertEqual(self.repo.get_obj_type('HEAD:foo'), 'blob')
+        self.add_file('dir/bar', 'bar\n')
+        self.assertTrue(self.repo.has_treeish('HEAD'))
+        self.assertTrue(self.repo.has_treeish('HEAD:dir'))
+        self.assertFalse(self.repo.has_treeish('HEAD:foo'))
+        self.assertFalse(self.repo.has_treeish('doesnotexist'))
+        self.assertFalse(self.repo.has_submodules('HEAD'))
+        with self.assertRaises(gbp.git.GitRepositoryError):
+            self.repo.get_obj_type('doesnotexist')
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "does not exist in 'HEAD'"):
+            self.repo.show('HEAD:doesnotexist')
+
+    def test_show_commit(self):
+        """Commits are only type checked via cat-file"""
+        self.assertIn(b'Author:', self.repo.show('HEAD'))
+        self.assertNotIn(gbp.git.CatFile.batch, self.repo._catfile._procs)
+        self.assertIn(gbp.git.CatFile.batch_check, self.repo._catfile._procs)
+
+    def test_new_objects(self):
+        """Objects created after the process started are found"""
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+        self.add_file('foo', 'baz\n')
+        self.assertEqual(self.repo.show('HEAD:foo'), b'baz\n')
+
+    def test_close(self):
+        """Closing terminates the cat-file processes"""
+        self.repo.show('HEAD:foo')
+        proc = self.repo._catfile._procs[gbp.git.CatFile.batch]
+        self.repo.close()
+        self.assertIsNotNone(proc.poll())
+        self.assertIsNone(self.repo._catfile)
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+
+    def test_fork(self):
+        """A forked child uses its own cat-file processes"""
+        self.repo.show('HEAD:foo')
+        parent_proc = self.repo._catfile._procs[gbp.git.CatFile.batch]
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os.close(rfd)
+            ok = (self.repo.show('HEAD:foo') == b'bar\n' and
+                  self.repo._catfile._procs[gbp.git.CatFile.batch] is not parent_proc)
+            os.write(wfd, b'1' if ok else b'0')
+            os._exit(0)
+        os.close(wfd)
+        with os.fdopen(rfd, 'rb') as r:
+            self.assertEqual(r.read(), b'1')
+        os.waitpid(pid, 0)
+        self.assertIsNone(parent_proc.poll())
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+
+    def test_fallback(self):
+        """Lookups work without the persistent process"""
+        self.repo.use_cat_file = False
+        self.assertEqual(self.repo.show('HEAD:foo'), b'bar\n')
+        self.assertEqual(self.repo.get_obj_type('HEAD'), 'commit')
+        self.assertTrue(self.repo.has_treeish('HEAD'))
+        self.assertIsNone(self.repo._catfile)
+
+
+class TestIterCommitInfos(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'foo\n', msg="first\n\nwith a body\n")
+        self.add_file('bar', 'bar\n')
+        self.repo.create_branch('side', 'HEAD~1')
+        self.repo.set_branch('side')
+        self.add_file('a' * 40, 'long name\n', msg="side")
+        self.repo.set_branch('master')
+        self.repo._git_command('merge', ['--no-commit', 'side'])
+        with open(os.path.join(self.repo.path, 'evil'), 'w'):
+            pass
+        self.repo.add_files('evil')
+        self.repo.commit_staged("merge with changes")
+        self.repo.remove_files('foo')
+        self.repo.commit_staged("remove foo")
+        self.repo._commit("empty", ['--allow-empty'])
+
+    def test_matches_get_commit_info(self):
+        """iter_commit_infos yields the same data as get_commit_info"""
+        infos = list(self.repo.iter_commit_infos())
+        commits = self.repo.get_commits()
+        self.assertEqual([info['id'] for info in infos], commits)
+        for info in infos:
+            expected = self.repo.get_commit_info(info['id'])
+            for key in ['subject', 'patchname', 'body', 'files']:
+                self.assertEqual(info[key], expected[key])
+            for key in ['author', 'committer']:
+                self.assertEqual(info[key].get_author_env(),
+                                 expected[key].get_author_env())
+        merge = [i for i in infos if i['subject'] == 'merge with changes'][0]
+        self.assertEqual(dict(merge['files']), {'AA': [b'evil']})
+
+    def test_range_and_order(self):
+        """Ranges, paths and reverse order"""
+        infos = list(self.repo.iter_commit_infos(since='HEAD~2', reverse=True))
+        self.assertEqual([i['subject'] for i in infos], ['remove foo', 'empty'])
+        infos = list(self.repo.iter_commit_infos(paths=['bar']))
+        self.assertEqual([i['subject'] for i in infos], ['added bar'])
+        self.assertEqual(list(infos[0]['files'].keys()), ['A'])
+
+    def test_early_stop(self):
+        """Stopping early terminates git"""
+        it = self.repo.iter_commit_infos()
+        self.assertEqual(next(it)['subject'], 'empty')
+        it.close()
+
+    def test_invalid_range(self):
+        with self.assertRaises(gbp.git.GitRepositoryError):
+            list(self.repo.iter_commit_infos(since='doesnotexist'))
+
+    def test_sha256(self):
+        """Commits are separated independent of the hash length"""
+        path = os.path.join(str(self.tmpdir), 'sha256')
+        subprocess.check_call(['git', 'init', '-q', '--object-format=sha256', path])
+        repo = gbp.git.GitRepository(path)
+        for name in ['foo', 'bar']:
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(name)
+            repo.add_files(name)
+            repo.commit_staged('added %s' % name)
+        infos = list(repo.iter_commit_infos())
+        self.assertEqual([i['id'] for i in infos], repo.get_commits())
+        self.assertEqual(len(infos[0]['id']), 64)
+        self.assertEqual(dict(infos[0]['files']), {'A': [b'bar']})
+        self.assertEqual(dict(infos[1]['files']), {'A': [b'foo']})
+
+
+class TestIterCommitDiffs(TestIterCommitInfos):
+    def test_matches_diff(self):
+        """iter_commit_diffs yields the same diffs as diff"""
+        self.add_file('bin', b'\0binary\0', mode='wb')
+        self.repo._git_command('mv', ['bar', 'baz'])
+        self.repo.commit_staged("rename")
+        opts = dict(stat=80, summary=True, text=True, abbrev=9, copies=True)
+        for kwargs in [{}, opts]:
+            diffs = list(self.repo.iter_commit_diffs('HEAD~6', 'HEAD', reverse=True, **kwargs))
+            self.assertEqual([info['id'] for (info, _) in diffs],
+                             self.repo.get_commits('HEAD~6', 'HEAD')[::-1])
+            for info, diff in diffs:
+                self.assertEqual(diff, self.repo.diff('%s^!' % info['id'], **kwargs))
+                expected = self.repo.get_commit_info(info['id'])
+                for key in ['subject', 'patchname', 'body']:
+                    self.assertEqual(info[key], expected[key])
+        self.assertEqual([diff for (info, diff) in diffs if info['subject'] == 'empty'], [b''])
+
+    def test_invalid_range(self):
+        with self.assertRaises(gbp.git.GitRepositoryError):
+            list(self.repo.iter_commit_diffs('doesnotexist', 'HEAD'))
+
+
+class TestGitIterLines(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.add_file('file%d' % i, '%d\n' % i)
+
+    def test_iter_commits(self):
+        """iter_commits yields what get_commits returns"""
+        commits = self.repo.get_commits()
+        self.assertEqual(len(commits), 3)
+        self.assertEqual(list(self.repo.iter_commits()), commits)
+        self.assertEqual(list(self.repo.iter_commits(num=1)), commits[:1])
+        self.assertEqual(self.repo.get_commits(since='HEAD~1'), commits[:1])
+
+    def test_early_stop(self):
+        """Stopping early kills the git process"""
+        lines = self.repo._git_iter_lines('log', ['--format=%H'])
+        self.assertEqual(next(lines).decode(), self.repo.head)
+        lines.close()
+        self.assertEqual(list(lines), [])
+
+    def test_separator(self):
+        """Lines can be split on NUL too"""
+        files = list(self.repo._git_iter_lines('ls-files', ['-z'], sep=b'\0'))
+        self.assertEqual(files, [b'file0', b'file1', b'file2'])
+        self.assertEqual(self.repo.list_files(), files)
+
+    def test_failure(self):
+        """Errors are raised after all output got consumed"""
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "Error running git log: fatal:"):
+            list(self.repo._git_iter_lines('log', ['doesnotexist']))
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "Error getting commits None..doesnotexist"):
+            self.repo.get_commits(until='doesnotexist')
+
+    def test_stderr(self):
+        """Lots of output on stderr doesn't block, warnings are passed on"""
+        noisy = 'alias.noisy=!f() { head -c 100000 /dev/zero | tr "\\0" x >&2; echo warning: w >&2; echo out; }; f'
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            lines = list(self.repo._git_iter_lines('noisy', config_args=[noisy]))
+        self.assertEqual(lines, [b'out'])
+        self.assertTrue(stderr.getvalue().endswith('xxxwarning: w\n'))
+
+    def test_fast_forward(self):
+        """Fast forward checks stream the revision list"""
+        self.repo.create_branch('old', 'HEAD~2')
+        self.assertEqual(self.repo.is_fast_forward('master', 'master'), (True, True))
+        self.assertEqual(self.repo.is_fast_forward('old', 'master'), (True, False))
+        self.assertEqual(self.repo.is_fast_forward('master', 'old'), (False, True))
+        self.assertTrue(self.repo.branch_contains('master', 'HEAD~2'))
+        self.assertFalse(self.repo.branch_contains('old', 'HEAD'))
+
+
+class TestTreeCache(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'foo\n')
+        self.add_file('debian/control', 'Source: foo\n')
+        self.add_file('sub/dir/bar', 'bar\n')
+        list(self.repo.list_tree('HEAD'))
+
+    def test_no_respawn(self):
+        """Listing the same tree again doesn't spawn git"""
+        spawned = gbp.git.GitRepository.spawned_processes
+        listing = list(self.repo.list_tree('HEAD'))
+        self.assertEqual([entry[3] for entry in listing], [b'debian', b'foo', b'sub'])
+        self.assertEqual(list(self.repo.list_tree('HEAD^{tree}')), listing)
+        recursive = list(self.repo.list_tree('HEAD', recurse=True, sizes=True))
+        self.assertEqual(recursive[-1][3:], (4, b'sub/dir/bar'))
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned + 1)
+        self.assertEqual(list(self.repo.list_tree('HEAD', recurse=True, sizes=True)), recursive)
+        self.assertEqual(self.repo.get_submodules('HEAD'), [])
+        self.assertEqual(self.repo.tree_get_dir('HEAD', 'sub'), listing[2][2])
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned + 2)
+
+    def test_drop_dirs(self):
+        """Dropping dirs from the same tree again doesn't spawn git"""
+        tree = self.repo.tree_drop_dirs('HEAD', ['debian'])
+        spawned = gbp.git.GitRepository.spawned_processes
+        self.assertEqual(self.repo.tree_drop_dirs('HEAD^{tree}', ['debian']), tree)
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned)
+        self.assertEqual([entry[3] for entry in self.repo.list_tree(tree)], [b'foo', b'sub'])
+
+    def test_paths(self):
+        """Listings limited to paths aren't cached"""
+        self.assertEqual([entry[3] for entry in self.repo.list_tree('HEAD', paths=['foo'])],
+                         [b'foo'])
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "Failed to ls-tree 'doesnotexist': 'fatal: "):
+            list(self.repo.list_tree('doesnotexist'))
+        with self.assertRaisesRegex(gbp.git.GitRepositoryError,
+                                    "Failed to list submodules of doesnotexist: fatal: "):
+            self.repo.get_submodules('doesnotexist')
+
+    def test_eviction(self):
+        """The least recently used listings get evicted"""
+        self.repo.tree_cache_entries = 4
+        list(self.repo.list_tree('HEAD', recurse=True))
+        list(self.repo.list_tree('HEAD'))
+        spawned = gbp.git.GitRepository.spawned_processes
+        list(self.repo.list_tree('HEAD'))
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned)
+        list(self.repo.list_tree('HEAD', recurse=True))
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned + 1)
+        self.assertLessEqual(self.repo._tree_cache_size, 4)
+
+    def test_persistent(self):
+        """Listings can be kept on disk"""
+        self.repo.persist_tree_cache = True
+        listing = list(self.repo.list_tree('HEAD', recurse=True))
+        repo = gbp.git.GitRepository(self.repo.path)
+        repo.persist_tree_cache = True
+        list(repo.list_tree('HEAD'))
+        spawned = gbp.git.GitRepository.spawned_processes
+        self.assertEqual(list(repo.list_tree('HEAD', recurse=True)), listing)
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned)
+        self.assertTrue(os.path.exists(os.path.join(self.repo.git_dir, 'gbp', 'trees',
+                                                    '%s-r' % repo.rev_parse('HEAD^{tree}'))))
+
+    def test_persistent_eviction(self):
+        """Least recently used listings are dropped from disk"""
+        self.repo.persist_tree_cache = True
+        cache_dir = os.path.join(self.repo.git_dir, 'gbp', 'trees')
+        tree = self.repo.rev_parse('HEAD^{tree}')
+        self.repo._tree_cache.clear()
+        list(self.repo.list_tree('HEAD'))
+        list(self.repo.list_tree('HEAD', recurse=True))
+        self.assertEqual(sorted(os.listdir(cache_dir)), [tree, '%s-r' % tree])
+        os.utime(os.path.join(cache_dir, tree), ns=(0, 0))
+
+        # Room for the new listing and only one of the old ones
+        sizes = subprocess.check_output(['git', 'ls-tree', '-z', '-l', tree], cwd=self.repo.path)
+        self.repo.tree_cache_max_size = (len(sizes) +
+                                         os.path.getsize(os.path.join(cache_dir, '%s-r' % tree)))
+        list(self.repo.list_tree('HEAD', sizes=True))
+        self.assertEqual(sorted(os.listdir(cache_dir)), ['%s-l' % tree, '%s-r' % tree])
+
+
+class TestRevParseMany(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'foo\n')
+        self.add_file('dir/bar', 'bar\n')
+        self.repo.create_tag('v1', msg='v1', sign=False)
+
+    def _check(self):
+        names = ['HEAD', 'doesnotexist', 'v1', 'v1^{commit}', '', 'HEAD~1']
+        expected = [self.repo.rev_parse('HEAD'), None, self.repo.rev_parse('v1'),
+                    self.repo.rev_parse('HEAD'), None, self.repo.rev_parse('HEAD~1')]
+        self.assertEqual(self.repo.rev_parse_many(names), expected)
+        self.assertEqual(self.repo.rev_parse_many(names, short=7),
+                         [sha[:7] if sha else None for sha in expected])
+        self.assertEqual(self.repo.has_treeish_many(['HEAD', 'HEAD:dir', 'HEAD:foo', 'doesnotexist']),
+                         [True, True, False, False])
+
+    def test_rev_parse_many(self):
+        """Resolve several names in one go"""
+        self._check()
+        spawned = gbp.git.GitRepository.spawned_processes
+        self.repo.rev_parse_many(['HEAD', 'doesnotexist', 'v1'], short=12)
+        self.repo.has_treeish_many(['HEAD', 'doesnotexist'])
+        self.assertEqual(gbp.git.GitRepository.spawned_processes, spawned)
+
+    def test_fallback(self):
+        """Names are resolved one by one without cat-file"""
+        self.repo.use_cat_file = False
+        self._check()
+
+
+class TestRefSnapshot(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo')
+        self.repo.create_branch('upstream')
+        self.repo.create_tag('upstream/1.0', msg='1.0')
+        self.repo.create_tag('debian/1.0-1', msg='1.0-1')
+
+    def _spawned(self, func, *args, **kwargs):
+        before = gbp.git.GitRepository.spawned_processes
+        ret = func(*args, **kwargs)
+        return ret, gbp.git.GitRepository.spawned_processes - before
+
+    def test_reads_use_snapshot(self):
+        """Ref lookups are served from a single for-each-ref call"""
+        self.repo.invalidate_ref_cache()
+        _, spawned = self._spawned(self.repo.has_branch, 'upstream')
+        self.assertEqual(spawned, 1)
+
+        def lookups():
+            self.assertTrue(self.repo.has_branch('upstream'))
+            self.assertFalse(self.repo.has_branch('upstream', remote=True))
+            self.assertFalse(self.repo.has_branch('doesnotexist'))
+            self.assertTrue(self.repo.has_tag('upstream/1.0'))
+            self.assertFalse(self.repo.has_tag('upstream/2.0'))
+            self.assertEqual(self.repo.get_tags(), ['debian/1.0-1', 'upstream/1.0'])
+            self.assertEqual(self.repo.get_tags('upstream/1.0'), ['upstream/1.0'])
+            self.assertEqual(self.repo.get_local_branches(), ['master', 'upstream'])
+            self.assertEqual(self.repo.get_remote_branches(), [])
+        _, spawned = self._spawned(lookups)
+        self.assertEqual(spawned, 0)
+
+    def test_invalidation(self):
+        """Changing refs drops the snapshot"""
+        self.assertFalse(self.repo.has_branch('bar'))
+        self.repo.create_branch('bar')
+        self.assertTrue(self.repo.has_branch('bar'))
+        self.repo.delete_branch('bar')
+        self.assertFalse(self.repo.has_branch('bar'))
+        self.repo.move_tag('upstream/1.0', 'upstream/1.1')
+        self.assertEqual(self.repo.get_tags('upstream/*'), ['upstream/1.1'])
+
+    def test_external_change(self):
+        """Refs changed behind our back are noticed"""
+        self.assertFalse(self.repo.has_tag('external'))
+        subprocess.check_call(['git', 'tag', 'external'], cwd=self.repo.path)
+        self.assertTrue(self.repo.has_tag('external'))
+
+    def test_external_change_same_mtime(self):
+        """Refs rewritten within the mtime granularity are noticed"""
+        self.assertTrue(self.repo.has_branch('upstream'))
+        ref = os.path.join(self.repo.git_dir, 'refs', 'heads', 'upstream')
+        st = os.stat(ref)
+        self.add_file('bar')
+        subprocess.check_call(['git', 'update-ref', 'refs/heads/upstream', 'HEAD'],
+                              cwd=self.repo.path)
+        os.utime(ref, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.repo._refs()['refs/heads/upstream'][0], self.repo.rev_parse('HEAD'))
+
+    def test_tag_patterns(self):
+        """Tag patterns match like git's"""
+        self.assertTrue(self.repo.has_tag('upstream/*'))
+        self.assertEqual(self.repo.get_tags('*1.0*'), ['debian/1.0-1', 'upstream/1.0'])
+        self.assertEqual(self.repo.get_tags('upstream/[[:digit:]]*'), ['upstream/1.0'])
+        self.assertEqual(self.repo.get_tags('upstream/[^1]*'), [])
+        self.assertEqual(self.repo.get_tags('upstream'), [])
+
+    def test_merge_branch(self):
+        """Upstream branches from the snapshot and config"""
+        self.assertIsNone(self.repo.get_merge_branch('upstream'))
+        self.repo.add_remote_repo('origin', self.repo.path, fetch=True)
+        self.repo.set_config('branch.upstream.remote', 'origin')
+        self.repo.set_config('branch.upstream.merge', 'refs/heads/master')
+        self.assertEqual(self.repo.get_merge_branch('upstream'), 'origin/master')
+        self.repo.set_config('branch.master.remote', 'unknown')
+        self.repo.set_config('branch.master.merge', 'refs/heads/foo')
+        self.assertEqual(self.repo.get_merge_branch('master'), 'unknown/foo')
+
+
 # vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -19,10 +19,14 @@ from . import context
 from . import testutils
 
 import os
+import shutil
+import time
 import unittest
+from unittest import mock
 
 from gbp.command_wrappers import GitCommand
-from gbp.scripts.pq import (generate_patches, export_patches,
+from gbp.errors import GbpError
+from gbp.scripts.pq import (count_applying_patches, generate_patches, export_patches,
                             import_quilt_patches, rebase_pq,
                             switch_pq,
                             SERIES_FILE)
@@ -33,9 +37,12 @@ import gbp.patch_series
 class TestPqOptions(object):
     abbrev = 7
     drop = False
+    import_in_index = False
+    incremental = False
     patch_num_format = '%04d-'
     patch_numbers = False
     renumber = False
+    time_machine_search = 'linear'
 
 
 class TestApplyAndCommit(testutils.DebianGitTestRepo):
@@ -221,6 +228,61 @@ class TestWritePatch(testutils.DebianGitTestRepo):
         opts.patch_num_format = '%02d_'
         self._test_generate_patches(changes, expected_patches, opts)
 
+    def test_generate_patches_single_pass(self):
+        """Patches are the same as when diffing each commit on its own"""
+        self.add_file('foo', 'foo\n', 'added foo\n\nGbp-Pq: Topic gbptest')
+        self.add_file('b\u00e4r', '\u00e4\n', 'Unicode \u00fcmlaut subject that is rather long, '
+                      'so it will be folded')
+        self.repo._commit("empty", ['--allow-empty'])
+        self.add_file('bin', b'\0\1\2', 'binary\n\nGbp-Pq: Name binary.diff', mode='wb')
+        self.add_file('ignored', 'ignored\n', 'ignored\n\nGbp-Pq: Ignore')
+
+        opts = TestPqOptions()
+        opts.patch_num_format = '%04d-'
+        d = context.new_tmpdir(__name__)
+        patches = generate_patches(self.repo, 'HEAD~5', 'HEAD', str(d), opts)
+        self.assertEqual([os.path.relpath(p, str(d)) for p in patches],
+                         ['gbptest/added-foo.patch',
+                          'Unicode-mlaut-subject-that-is-rather-long-so-it-will-be-f.patch',
+                          'binary.diff'])
+
+        expected = []
+        for info in self.repo.iter_commit_infos('HEAD~5', 'HEAD~1', reverse=True):
+            (cmds, info['body']) = pq.parse_gbp_commands(info, 'gbp-pq', ('ignore'),
+                                                         ('topic', 'name'), ('topic', 'name'))
+            pq.format_patch(str(d.join('expected')), self.repo, info, expected, opts.abbrev,
+                            numbered=False, topic=cmds.get('topic', ''), name=cmds.get('name'))
+        self.assertEqual(len(expected), 3)
+        for patch, ref in zip(patches, expected):
+            with open(patch, 'rb') as f, open(ref, 'rb') as r:
+                self.assertEqual(f.read(), r.read())
+
+    def test_exclude_with_diff(self):
+        """Paths can be excluded from commits read along with their diff"""
+        self.add_file('foo', 'foo\n')
+        for name in ['bar', 'baz']:
+            with open(os.path.join(self.repo.path, name), 'w') as f:
+                f.write('%s\n' % name)
+        self.repo.add_files(['bar', 'baz'])
+        self.repo.commit_staged('added bar and baz')
+        d = context.new_tmpdir(__name__)
+        patches = []
+        for info, diff in self.repo.iter_commit_diffs('HEAD~1', 'HEAD'):
+            pq.format_patch(str(d), self.repo, info, patches, 7,
+                            path_exclude_regex='^bar$', diff=diff)
+        self.assertEqual(len(patches), 1)
+        with open(patches[0]) as f:
+            content = f.read()
+        self.assertIn('+++ b/baz', content)
+        self.assertNotIn('+++ b/bar', content)
+
+    def test_invalid_treeish(self):
+        """Both ends of the range must be valid tree-ishs"""
+        d = context.new_tmpdir(__name__)
+        for start, end in [('doesnotexist', 'HEAD'), ('HEAD', 'doesnotexist')]:
+            with self.assertRaisesRegex(GbpError, 'doesnotexist not a valid tree-ish'):
+                generate_patches(self.repo, start, end, str(d), TestPqOptions())
+
 
 class TestExport(testutils.DebianGitTestRepo):
     class Options(TestPqOptions):
@@ -297,6 +359,211 @@ class TestExport(testutils.DebianGitTestRepo):
         self.assertIn(b"Drop patch2.diff:", repo.show('HEAD'))
 
 
+class TestIncrementalExport(testutils.DebianGitTestRepo):
+    class Options(TestExport.Options):
+        incremental = True
+        patch_numbers = True
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('bar', 'bar')
+        self.repo.create_branch(pq.pq_branch_name('master'))
+        self.repo.set_branch(pq.pq_branch_name('master'))
+        self.add_file('foo', 'foo\n', 'added foo')
+        self.add_file('baz', 'baz\n', 'added baz\n\nGbp-Pq: Topic topic')
+        self.add_file('qux', 'qux\n', 'added qux')
+        self.patch_dir = os.path.join(self.repo.path, 'debian', 'patches')
+
+    def _export(self, incremental=True):
+        opts = self.Options()
+        opts.incremental = incremental
+        self.repo.set_branch('master')
+        export_patches(self.repo, 'master', opts)
+        self.repo.set_branch(pq.pq_branch_name('master'))
+
+    def _snapshot(self):
+        result = {}
+        for root, dirs, names in os.walk(self.patch_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    result[os.path.relpath(path, self.patch_dir)] = (f.read(), os.stat(path).st_mtime_ns)
+        return result
+
+    def _full_export(self):
+        """Content of a full export, leaves the incremental one in place"""
+        saved = self.patch_dir + '.saved'
+        os.rename(self.patch_dir, saved)
+        self._export(incremental=False)
+        content = {name: data for (name, (data, _)) in self._snapshot().items()}
+        shutil.rmtree(self.patch_dir)
+        os.rename(saved, self.patch_dir)
+        return content
+
+    def test_incremental(self):
+        """Only changed patches are written"""
+        self._export()
+        before = self._snapshot()
+        self.assertEqual(sorted(before), ['0001-added-foo.patch', '0003-added-qux.patch',
+                                          'series', 'topic/0002-added-baz.patch'])
+        self.assertEqual({name: data for (name, (data, _)) in before.items()},
+                         self._full_export())
+
+        # Nothing changed: nothing gets written, not even git gets asked for the patches
+        with mock.patch('gbp.scripts.pq.generate_patches') as generate:
+            self._export()
+        self.assertFalse(generate.called)
+        self.assertEqual(self._snapshot(), before)
+
+        # Drop the commit in the middle and change the last one
+        self.repo.force_head('HEAD~2', hard=True)
+        self.add_file('qux', 'changed qux\n', 'added qux')
+        # Make sure rewritten files would get a different mtime
+        time.sleep(0.05)
+        self._export()
+        after = self._snapshot()
+        self.assertEqual(sorted(after), ['0001-added-foo.patch', '0002-added-qux.patch', 'series'])
+        self.assertEqual(after['0001-added-foo.patch'], before['0001-added-foo.patch'])
+        self.assertEqual({name: data for (name, (data, _)) in after.items()},
+                         self._full_export())
+
+    def test_modified_patch(self):
+        """Modified patch files get rewritten, stray files removed"""
+        self._export()
+        before = self._snapshot()
+        with open(os.path.join(self.patch_dir, '0001-added-foo.patch'), 'w') as f:
+            f.write('modified')
+        with open(os.path.join(self.patch_dir, 'stray.patch'), 'w') as f:
+            f.write('stray')
+        self._export()
+        self.assertEqual({name: data for (name, (data, _)) in self._snapshot().items()},
+                         {name: data for (name, (data, _)) in before.items()})
+
+    def test_no_patches(self):
+        """Without patches the patch dir is removed"""
+        self._export()
+        self.repo.force_head('master', hard=True)
+        self._export()
+        self.assertFalse(os.path.exists(self.patch_dir))
+
+
+class TestImportInIndex(testutils.DebianGitTestRepo):
+    class Options(TestExport.Options):
+        patch_numbers = True
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('debian/control')
+        self.add_file('foo', 'foo\n')
+        self.repo.create_branch(pq.pq_branch_name('master'))
+        self.repo.set_branch(pq.pq_branch_name('master'))
+        self.add_file('foo', 'foo\nbar\n', 'changed foo')
+        self.add_file('baz', 'baz\n', 'added baz\n\nGbp-Pq: Topic topic')
+        self.repo.set_branch('master')
+        export_patches(self.repo, 'master', self.Options())
+        self.repo.add_files(['debian/patches'])
+        self.repo.commit_all('Add patches')
+        self.repo.delete_branch(pq.pq_branch_name('master'))
+
+    def _import(self, in_index, tries=1):
+        import_quilt_patches(self.repo, 'master', SERIES_FILE, tries,
+                             False, 'DEBIAN', '', in_index=in_index)
+
+    def _history(self):
+        history = []
+        for commit in self.repo.get_commits('master', pq.pq_branch_name('master')):
+            info = self.repo.get_commit_info(commit)
+            history.append((info['subject'], info['body'], info['author'].name, info['author'].date,
+                            self.repo.rev_parse('%s^{tree}' % commit)))
+        return history
+
+    def test_import(self):
+        """Importing into an index gives the same branch"""
+        self._import(False)
+        expected = self._history()
+        self.repo.set_branch('master')
+        self.repo.delete_branch(pq.pq_branch_name('master'))
+
+        self._import(True)
+        self.assertEqual(self.repo.get_branch(), pq.pq_branch_name('master'))
+        self.assertEqual(self._history(), expected)
+        self.assertEqual(len(expected), 2)
+        self.assertTrue(self.repo.is_clean()[0])
+        with open(os.path.join(self.repo.path, 'foo')) as f:
+            self.assertEqual(f.read(), 'foo\nbar\n')
+        self.assertFalse(os.path.exists(os.path.join(self.repo.git_dir, 'gbp', 'pq_import_index')))
+
+    def test_time_machine(self):
+        """Failed tries leave no trace"""
+        head = self.repo.head
+        self.add_file('foo', 'conflicting\n', 'Conflicting change')
+        self._import(True, tries=2)
+        self.assertEqual(self.repo.get_branch(), pq.pq_branch_name('master'))
+        self.assertEqual(self.repo.get_merge_base('master', 'HEAD'), head)
+
+    def test_bisect(self):
+        """Bisecting finds the same commit as trying one after another"""
+        self.add_file('foo', 'conflicting\n', 'Conflicting change')
+        for i in range(10):
+            self.add_file('other', '%d\n' % i, 'Change %d' % i)
+        head = self.repo.head
+        self._import(False, tries=20)
+        expected = self._history()
+        self.assertEqual(len(expected), 2)
+        self.repo.set_branch('master')
+        self.repo.delete_branch(pq.pq_branch_name('master'))
+
+        with mock.patch('gbp.scripts.pq.count_applying_patches',
+                        wraps=count_applying_patches) as count:
+            import_quilt_patches(self.repo, 'master', SERIES_FILE, 20,
+                                 False, 'DEBIAN', '', bisect=True)
+        self.assertEqual(self._history(), expected)
+        self.assertLessEqual(count.call_count, 5)
+        self.assertEqual(self.repo.rev_parse('master'), head)
+        self.assertEqual([b for b in self.repo.get_local_branches() if b != 'master'],
+                         [pq.pq_branch_name('master')])
+
+        # Cached results are reused
+        self.repo.set_branch('master')
+        self.repo.delete_branch(pq.pq_branch_name('master'))
+        with mock.patch('gbp.scripts.pq.count_applying_patches') as count:
+            import_quilt_patches(self.repo, 'master', SERIES_FILE, 20,
+                                 False, 'DEBIAN', '', bisect=True)
+        self.assertFalse(count.called)
+        self.assertEqual(self._history(), expected)
+
+    def test_bisect_failure(self):
+        """Bisecting fails if the patches apply nowhere"""
+        self.add_file('foo', 'conflicting\n', 'Conflicting change')
+        with self.assertRaisesRegex(GbpError, "Couldn't apply patches"):
+            import_quilt_patches(self.repo, 'master', SERIES_FILE, 1,
+                                 False, 'DEBIAN', '', bisect=True)
+        self.add_file('other', 'other\n', 'Other change')
+        with self.assertRaisesRegex(GbpError, "Couldn't apply patches"):
+            import_quilt_patches(self.repo, 'master', SERIES_FILE, 2,
+                                 False, 'DEBIAN', '', bisect=True)
+        self.assertFalse(self.repo.has_branch(pq.pq_branch_name('master')))
+        self.assertTrue(self.repo.is_clean()[0])
+
+    def test_count_applying_patches(self):
+        """Patches are counted until the first one that doesn't apply"""
+        queue = gbp.patch_series.PatchSeries.read_series_file(os.path.join(self.repo.path, SERIES_FILE))
+        index_file = os.path.join(self.tmpdir.path, 'index')
+        self.assertEqual(count_applying_patches(self.repo, 'HEAD', queue, index_file), 2)
+        self.add_file('baz', 'conflicting\n', 'Conflicting change')
+        self.assertEqual(count_applying_patches(self.repo, 'HEAD', queue, index_file), 1)
+        self.assertTrue(self.repo.is_clean()[0])
+
+    def test_failure(self):
+        """Failed imports don't touch the working copy"""
+        self.add_file('foo', 'conflicting\n', 'Conflicting change')
+        with self.assertRaisesRegex(GbpError, "Couldn't apply patches"):
+            self._import(True)
+        self.assertEqual(self.repo.get_branch(), 'master')
+        self.assertFalse(self.repo.has_branch(pq.pq_branch_name('master')))
+        self.assertTrue(self.repo.is_clean()[0])
+
+
 class TestParseGbpCommand(unittest.TestCase):
     def test_empty_body(self):
         """Test command filtering with an empty body"""
@@ -4,8 +4,11 @@
 from gbp.scripts.buildpackage import (get_pbuilder_dist,
                                       setup_pbuilder,
                                       GbpError)
+from gbp.scripts.common.buildpackage import write_wc, wc_index
 from . testutils import DebianGitTestRepo
 
+import os
+
 from unittest.mock import patch
 
 
@@ -140,3 +143,33 @@ class TestGbpBuildpackageSetupPbuilder(DebianGitTestRepo):
                            'GBP_PBUILDER_DIST': 'sid'},
                           {'GBP_PBUILDER_ARCH': 'arm64',
                            'GBP_PBUILDER_DIST': 'sid'}))
+
+
+class TestGbpBuildpackageWriteWc(DebianGitTestRepo):
+    def setUp(self):
+        DebianGitTestRepo.setUp(self)
+        self.add_file('foo', 'foo\n')
+        self.add_file('bar', 'bar\n')
+
+    def test_write_wc(self):
+        """The working copy index is kept and updated"""
+        self.assertEqual(write_wc(self.repo), self.repo.rev_parse('HEAD^{tree}'))
+        self.assertTrue(os.path.exists(wc_index(self.repo)))
+
+        os.unlink(os.path.join(self.repo.path, 'bar'))
+        with open(os.path.join(self.repo.path, 'foo'), 'w') as f:
+            f.write('changed\n')
+        with open(os.path.join(self.repo.path, 'new'), 'w') as f:
+            f.write('new\n')
+        tree = write_wc(self.repo)
+        self.assertEqual([entry[3] for entry in self.repo.list_tree(tree)], [b'foo', b'new'])
+        self.assertEqual(self.repo.show('%s:foo' % tree), b'changed\n')
+        # The repository's index is left alone
+        self.assertEqual(self.repo.write_tree(), self.repo.rev_parse('HEAD^{tree}'))
+
+    def test_corrupt_index(self):
+        """A corrupt working copy index is rebuilt"""
+        os.makedirs(os.path.dirname(wc_index(self.repo)))
+        with open(wc_index(self.repo), 'w') as f:
+            f.write('garbage')
+        self.assertEqual(write_wc(self.repo), self.repo.rev_parse('HEAD^{tree}'))
@@ -40,3 +40,49 @@ class TestGitRepositoryCommitDir(DebianGitTestRepo):
         out, dummy, ret = self.repo._git_inout('reflog', [])
         self.assertEqual(ret, 0)
         self.assertIn(b'HEAD@{0}: gbp: foo\n', out)
+
+    def test_replace(self):
+        """The contents of the branch get replaced"""
+        self.repo.commit_dir(self.content, 'first', 'master',
+                             create_missing_branch=True)
+
+        other = os.path.join(str(self.tmpdir), 'other')
+        os.makedirs(os.path.join(other, 'dir'))
+        with open(os.path.join(other, 'dir', 'file2'), 'w') as f:
+            f.write('content2')
+        self.repo.commit_dir(other, 'second', 'master')
+        self.assertEqual([entry[3] for entry in self.repo.list_tree('master', recurse=True)],
+                         [b'dir/file2'])
+
+        with open(os.path.join(self.content, 'file1'), 'w') as f:
+            f.write('changed')
+        self.repo.commit_dir(self.content, 'third', 'master')
+        self.assertEqual(self.repo.show('master:file1'), b'changed')
+        self.assertEqual([entry[3] for entry in self.repo.list_tree('master', recurse=True)],
+                         [b'file1'])
+
+    def test_other_dir(self):
+        """Stat data from another directory isn't trusted"""
+        self.repo.set_config('core.checkStat', 'minimal')
+        # Same size and an mtime that isn't racy
+        os.utime(os.path.join(self.content, 'file1'), (1000000000, 1000000000))
+        self.repo.commit_dir(self.content, 'first', 'master',
+                             create_missing_branch=True)
+        other = os.path.join(str(self.tmpdir), 'other')
+        os.makedirs(other)
+        with open(os.path.join(other, 'file1'), 'w') as f:
+            f.write('content2')
+        os.utime(os.path.join(other, 'file1'), (1000000000, 1000000000))
+        self.repo.commit_dir(other, 'second', 'master')
+        self.assertEqual(self.repo.show('master:file1'), b'content2')
+
+    def test_stale_index(self):
+        """A left over index is ignored and the index is removed afterwards"""
+        index = os.path.join(self.repo.git_dir, 'gbp_index')
+        with open(index, 'w') as f:
+            f.write('garbage')
+        self.repo.commit_dir(self.content, 'new content', 'master',
+                             create_missing_branch=True)
+        self.assertEqual(self.repo.show('master:file1'), b'content1')
+        self.assertFalse(os.path.exists(index))
+        self.assertFalse(os.path.exists(os.path.join(self.repo.git_dir, 'gbp')))
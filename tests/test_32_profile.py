@@ -0,0 +1,86 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.profile}"""
+
+import json
+
+from . import context  # noqa: F401
+from . import testutils
+
+import gbp.profile
+import gbp.scripts.supercommand
+from gbp.command_wrappers import Command
+from gbp.pipeline import Pipeline
+
+
+class TestProfile(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'foo\n')
+        gbp.profile.enable()
+
+    def tearDown(self):
+        gbp.profile.disable()
+        super().tearDown()
+
+    def test_disabled(self):
+        """Nothing is recorded when disabled"""
+        gbp.profile.disable()
+        self.assertFalse(gbp.profile.enabled())
+        self.assertIsNone(gbp.profile.start())
+        self.repo.rev_parse('HEAD')
+        self.assertEqual(gbp.profile.runs(), [])
+
+    def test_record(self):
+        """Git and other commands get recorded"""
+        self.repo.rev_parse('HEAD')
+        self.repo.get_commits()
+        Command('true')()
+        runs = gbp.profile.runs()
+        names = [run['name'] for run in runs]
+        self.assertIn('git rev-parse', names)
+        self.assertIn('git log', names)
+        self.assertEqual(names[-1], 'true')
+        log = runs[names.index('git log')]
+        self.assertEqual(log['retcode'], 0)
+        self.assertEqual(log['bytes_out'], 41)
+        self.assertEqual(log['argv'][:2], ['git', 'log'])
+        self.assertGreaterEqual(log['time'], 0)
+
+    def test_pipeline(self):
+        """Pipeline stages get recorded with their file sizes"""
+        infile = self.tmpdir.join('in')
+        outfile = self.tmpdir.join('out')
+        with open(infile, 'w') as f:
+            f.write('abc\n')
+        pipe = Pipeline(['cat'], ['tr', 'a-z', 'A-Z'])
+        self.assertEqual(pipe.run(stdin=infile, stdout=outfile), [0, 0])
+        cat, tr = gbp.profile.runs()[-2:]
+        self.assertEqual((cat['name'], tr['name']), ('cat', 'tr'))
+        self.assertEqual((cat['bytes_in'], tr['bytes_out']), (4, 4))
+
+    def test_report(self):
+        """Reports are written as text or JSON"""
+        Command('true')()
+        self.repo.rev_parse('HEAD')
+        text = self.tmpdir.join('profile.txt')
+        gbp.profile.write_report(text)
+        with open(text) as f:
+            lines = f.readlines()
+        self.assertTrue(lines[0].startswith('command'))
+        self.assertIn('commands run', lines[-1])
+        report = self.tmpdir.join('profile.json')
+        gbp.profile.write_report(report)
+        with open(report) as f:
+            data = json.load(f)
+        self.assertEqual(len(data['runs']), len(gbp.profile.runs()))
+        times = [cmd['time'] for cmd in data['commands']]
+        self.assertEqual(times, sorted(times, reverse=True))
+
+    def test_supercommand(self):
+        """The supercommand enables profiling"""
+        gbp.profile.disable()
+        report = self.tmpdir.join('profile.json')
+        with testutils.capture_stdout():
+            gbp.scripts.supercommand.supercommand(['argv0', '--profile=%s' % report,
+                                                   'version'])
+        self.assertTrue(gbp.profile.enabled())
@@ -0,0 +1,99 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.capabilities}"""
+
+import os
+
+from . import context  # noqa: F401
+from . import testutils
+
+import gbp.capabilities
+from gbp.capabilities import CapabilityCache
+from gbp.git import GitRepository, GitRepositoryError
+
+
+class TestCapabilityCache(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.bindir = self.tmpdir.join('bin')
+        os.mkdir(self.bindir)
+        self.tool = os.path.join(self.bindir, 'gbp-probe-me')
+        self._write_tool('#!/bin/sh\necho 1\n')
+        self.cachefile = self.tmpdir.join('cache', 'capabilities.json')
+        self.path_backup = os.environ['PATH']
+        os.environ['PATH'] = '%s:%s' % (self.bindir, self.path_backup)
+        self.calls = 0
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path_backup
+        super().tearDown()
+
+    def _write_tool(self, content):
+        with open(self.tool, 'w') as f:
+            f.write(content)
+        os.chmod(self.tool, 0o755)
+
+    def _probe(self):
+        self.calls += 1
+        return ['a', 'b']
+
+    def test_lookup(self):
+        """Probes run once and get persisted"""
+        cache = CapabilityCache(self.cachefile)
+        for _ in range(2):
+            self.assertEqual(cache.lookup('gbp-probe-me', 'opts', self._probe), ['a', 'b'])
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(os.path.exists(self.cachefile))
+
+        cache = CapabilityCache(self.cachefile)
+        self.assertEqual(cache.lookup('gbp-probe-me', 'opts', self._probe), ['a', 'b'])
+        self.assertEqual(self.calls, 1)
+
+        cache.clear()
+        self.assertFalse(os.path.exists(self.cachefile))
+        cache.lookup('gbp-probe-me', 'opts', self._probe)
+        self.assertEqual(self.calls, 2)
+
+    def test_tool_changed(self):
+        """Probes are rerun when the tool changes"""
+        CapabilityCache(self.cachefile).lookup('gbp-probe-me', 'opts', self._probe)
+        self._write_tool('#!/bin/sh\necho 2 # an upgraded version\n')
+        CapabilityCache(self.cachefile).lookup('gbp-probe-me', 'opts', self._probe)
+        self.assertEqual(self.calls, 2)
+
+    def test_missing_tool(self):
+        """Nothing is cached for tools not in $PATH"""
+        cache = CapabilityCache(self.cachefile)
+        for _ in range(2):
+            cache.lookup('gbp-does-not-exist', 'opts', self._probe)
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(os.path.exists(self.cachefile))
+
+    def test_failed_probe(self):
+        """Failing probes aren't cached"""
+        def fail():
+            raise GitRepositoryError("probe failed")
+
+        cache = CapabilityCache(self.cachefile)
+        for _ in range(2):
+            with self.assertRaises(GitRepositoryError):
+                cache.lookup('gbp-probe-me', 'opts', fail)
+
+    def test_unwritable(self):
+        """An unwritable cache directory is ignored"""
+        cache = CapabilityCache(self.tmpdir.join('does', 'not', 'exist', 'capabilities.json'))
+        for _ in range(2):
+            cache.lookup('gbp-probe-me', 'opts', self._probe)
+        self.assertEqual(self.calls, 1)
+
+    def test_git_features(self):
+        """Git's man page is only parsed once"""
+        cache_backup = gbp.capabilities._cache
+        gbp.capabilities._cache = CapabilityCache(self.cachefile)
+        self.addCleanup(setattr, gbp.capabilities, '_cache', cache_backup)
+        self.assertTrue(self.repo._cmd_has_feature('commit', 'reuse-message'))
+        spawned = GitRepository.spawned_processes
+        self.assertTrue(self.repo._cmd_has_feature('commit', 'reuse-message'))
+        self.assertFalse(self.repo._cmd_has_feature('commit', 'foobaroption'))
+        self.assertEqual(GitRepository.spawned_processes, spawned)
+        with self.assertRaises(GitRepositoryError):
+            self.repo._cmd_has_feature('foobarcmd', 'foobaroption')
@@ -0,0 +1,94 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.git.AsyncGitRepository}"""
+
+import asyncio
+import os
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.git import AsyncGitRepository, GitRepository, GitRepositoryError
+
+
+class TestAsyncGitRepository(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.add_file('foo', 'foo\n')
+        self.add_file('dir/bar', 'bar\n')
+        self.repo.create_tag('upstream/1.0', msg='1.0', sign=False)
+        self.add_file('baz', 'baz\n')
+
+    def test_queries(self):
+        """Async queries match the synchronous ones"""
+        async def query():
+            repo = await AsyncGitRepository.open(self.repo.path)
+            return await asyncio.gather(repo.rev_parse('HEAD'),
+                                        repo.rev_parse('HEAD', short=7),
+                                        repo.get_commits(),
+                                        repo.get_commits(num=1, paths=['foo']),
+                                        repo.list_tree('HEAD', recurse=True, sizes=True),
+                                        repo.show('HEAD:foo'),
+                                        repo.show('HEAD'),
+                                        repo.get_tags(),
+                                        repo.get_tags('debian/*'),
+                                        repo.get_tags('upstream/[[:digit:]]*'),
+                                        repo.get_tags('upstream/[^1]*'),
+                                        repo.get_tags('upstream'),
+                                        repo.describe('HEAD'),
+                                        repo.is_clean())
+
+        results = asyncio.run(query())
+        self.assertEqual(results, [self.repo.rev_parse('HEAD'),
+                                   self.repo.rev_parse('HEAD', short=7),
+                                   self.repo.get_commits(),
+                                   self.repo.get_commits(num=1, paths=['foo']),
+                                   list(self.repo.list_tree('HEAD', recurse=True, sizes=True)),
+                                   b'foo\n',
+                                   self.repo.show('HEAD'),
+                                   ['upstream/1.0'],
+                                   [],
+                                   self.repo.get_tags('upstream/[[:digit:]]*'),
+                                   self.repo.get_tags('upstream/[^1]*'),
+                                   self.repo.get_tags('upstream'),
+                                   self.repo.describe('HEAD'),
+                                   (True, '')])
+
+    def test_many_repos(self):
+        """Query many repositories concurrently"""
+        with open(os.path.join(self.repo.path, 'foo'), 'w') as f:
+            f.write('changed\n')
+        clean = GitRepository.create(os.path.join(str(self.tmpdir), 'clean'))
+        paths = [self.repo.path, clean.path] * 20
+
+        self.addCleanup(setattr, AsyncGitRepository, 'max_processes',
+                        AsyncGitRepository.max_processes)
+        AsyncGitRepository.max_processes = 4
+
+        async def query():
+            repos = await asyncio.gather(*[AsyncGitRepository.open(path) for path in paths])
+            return await asyncio.gather(*[repo.is_clean() for repo in repos])
+
+        states = asyncio.run(query())
+        self.assertEqual([state[0] for state in states], [False, True] * 20)
+        self.assertIn('modified:   foo', states[0][1])
+
+    def test_errors(self):
+        """Errors are raised like in the synchronous version"""
+        async def query(coro):
+            repo = await AsyncGitRepository.open(self.repo.path)
+            return await getattr(repo, coro)('doesnotexist')
+
+        for method, msg in [('rev_parse', "revision 'doesnotexist' not found"),
+                            ('show', "can't get doesnotexist:"),
+                            ('describe', "Can't describe doesnotexist"),
+                            ('list_tree', "Failed to ls-tree 'doesnotexist'")]:
+            with self.assertRaisesRegex(GitRepositoryError, msg):
+                asyncio.run(query(method))
+
+        with self.assertRaisesRegex(GitRepositoryError, "Not the toplevel"):
+            asyncio.run(AsyncGitRepository.open(os.path.join(self.repo.path, 'dir')))
+        repo = asyncio.run(AsyncGitRepository.open(os.path.join(self.repo.path, 'dir'),
+                                                   toplevel=False))
+        self.assertEqual(repo.path, self.repo.path)
+        with self.assertRaises(GitRepositoryError):
+            asyncio.run(AsyncGitRepository.open(str(self.tmpdir)))
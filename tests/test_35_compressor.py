@@ -0,0 +1,73 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.pkg.compressor.Compressor}"""
+
+import os
+import subprocess
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.pkg.compressor import Compressor
+from gbp.pkg.git import PkgGitRepository
+
+
+class TestCompressorThreads(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.bindir = self.tmpdir.join('bin')
+        os.mkdir(self.bindir)
+        self.path_backup = os.environ['PATH']
+        self.addCleanup(os.environ.__setitem__, 'PATH', self.path_backup)
+        os.environ['PATH'] = '%s:%s' % (self.bindir, self.path_backup)
+
+    def _fake_tool(self, name):
+        tool = os.path.join(self.bindir, name)
+        with open(tool, 'w') as f:
+            f.write('#!/bin/sh\nexit 0\n')
+        os.chmod(tool, 0o755)
+
+    def test_fallback(self):
+        """Single threaded tools are used if no threaded one is found"""
+        os.environ['PATH'] = self.bindir
+        self.assertEqual(Compressor('gzip', 9, threads=4).cmdline(), 'gzip -9 -n -c')
+        self.assertEqual(Compressor('bzip2', threads=0).cmdline(), 'bzip2   -c')
+
+    def test_threaded(self):
+        """Threaded tools are preferred"""
+        for tool in ['pigz', 'lbzip2']:
+            self._fake_tool(tool)
+        self.assertEqual(Compressor('gzip', 9, threads=4).cmdline(), 'pigz -9 -n -p4 -c')
+        self.assertEqual(Compressor('gzip', 9, threads=1).cmdline(), 'gzip -9 -n -c')
+        self.assertEqual(Compressor('bzip2', threads=3).cmdline(), 'lbzip2  -n3 -c')
+        self._fake_tool('pbzip2')
+        self.assertEqual(Compressor('bzip2', threads=3).cmdline(), 'pbzip2  -p3 -c')
+        self.assertGreaterEqual(Compressor('gzip', threads=0).threads, 1)
+
+    def test_decompress(self):
+        """Threaded decompressors are preferred"""
+        os.environ['PATH'] = self.bindir
+        self.assertEqual(Compressor('bzip2', threads=4).decompress_cmdline(), 'bzip2 -d -c')
+        self.assertFalse(Compressor('bzip2', threads=4).threaded_decompression)
+        for tool in ['pbzip2', 'lbzip2']:
+            self._fake_tool(tool)
+        self.assertEqual(Compressor('bzip2', threads=4).decompress_cmdline(), 'lbzip2 -d -n4 -c')
+        self.assertTrue(Compressor('bzip2', threads=4).threaded_decompression)
+        self.assertEqual(Compressor('bzip2', threads=1).decompress_cmdline(), 'bzip2 -d -c')
+
+    def test_archive(self):
+        """Threaded compression output doesn't depend on the thread count"""
+        with open(os.path.join(self.repo.path, 'data'), 'wb') as f:
+            f.write(os.urandom(1024) * 4096)
+        self.repo.add_files('data')
+        self.repo.commit_all('data')
+        repo = PkgGitRepository(self.repo.path)
+
+        outputs = []
+        for threads in [2, 4]:
+            output = self.tmpdir.join('out%d.tar.xz' % threads)
+            repo.archive_comp('HEAD', output, 'foo', Compressor('xz', 1, threads))
+            with open(output, 'rb') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        listing = subprocess.check_output(['tar', '-tJf', output])
+        self.assertIn(b'foo/data', listing.split())
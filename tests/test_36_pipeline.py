@@ -0,0 +1,92 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.pipeline}"""
+
+import os
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.pipeline import Pipeline, PipelineError
+
+
+class TestPipeline(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.infile = self.tmpdir.join('in')
+        self.outfile = self.tmpdir.join('out')
+        with open(self.infile, 'w') as f:
+            f.write('abc\n')
+
+    def test_run(self):
+        """Stages are connected without a shell"""
+        name = self.tmpdir.join("a file; with 'quotes' $HOME")
+        pipe = Pipeline(['cat'],
+                        ['tr', 'a-z', 'A-Z'],
+                        ['tee', name])
+        self.assertEqual(pipe.run(stdin=self.infile, stdout=self.outfile), [0, 0, 0])
+        for output in [self.outfile, name]:
+            with open(output) as f:
+                self.assertEqual(f.read(), 'ABC\n')
+        for stage in pipe.stages:
+            self.assertGreaterEqual(stage.time, 0)
+        self.assertEqual(pipe.failed, [])
+
+    def test_cwd(self):
+        """Stages can run in different directories"""
+        self.add_file('foo', 'foo\n')
+        pipe = Pipeline()
+        pipe.append(['git', 'archive', '--format=tar', 'HEAD'], cwd=self.repo.path)
+        pipe.append(['tar', '-tf', '-'])
+        pipe.run(stdout=self.outfile)
+        with open(self.outfile, 'rb') as f:
+            self.assertEqual(f.read().split(), self.repo.list_files())
+
+    def test_failure(self):
+        """Failing stages are reported"""
+        pipe = Pipeline(['cat'], ['sh', '-c', 'cat >/dev/null; exit 3'], ['cat'])
+        with self.assertRaisesRegex(PipelineError,
+                                    r"^'sh -c 'cat >/dev/null; exit 3'' failed with exit code 3$") as cm:
+            pipe.run(stdin=self.infile, stdout=self.outfile)
+        self.assertEqual(cm.exception.stages, pipe.stages[1:2])
+        self.assertEqual(pipe.run(stdin=self.infile, stdout=self.outfile, check=False),
+                         [0, 3, 0])
+
+    def test_sigpipe(self):
+        """Writers get SIGPIPE if a reader exits early"""
+        pipe = Pipeline(['yes'], ['head', '-n1'])
+        self.assertEqual(pipe.run(stdout=self.outfile, check=False), [-13, 0])
+
+    def test_missing_command(self):
+        """Missing commands don't leave processes behind"""
+        pipe = Pipeline(['yes'], ['gbp-does-not-exist'])
+        with self.assertRaisesRegex(PipelineError, "Can't run 'gbp-does-not-exist'"):
+            pipe.run(stdout=self.outfile)
+        self.assertIsNotNone(pipe.stages[0].retcode)
+        self.assertTrue(os.path.exists(self.outfile))
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            Pipeline('cat | tr a-z A-Z')
+        with self.assertRaises(ValueError):
+            Pipeline().run()
+
+    def test_stream(self):
+        """The last stage's output can be read"""
+        pipe = Pipeline(['cat'], ['tr', 'a-z', 'A-Z'])
+        with pipe.stream(stdin=self.infile) as output:
+            self.assertEqual(output.read(), b'ABC\n')
+        self.assertEqual([stage.retcode for stage in pipe.stages], [0, 0])
+
+        pipe = Pipeline(['cat'], ['sh', '-c', 'cat; exit 3'])
+        with self.assertRaisesRegex(PipelineError, "failed with exit code 3"):
+            with pipe.stream(stdin=self.infile) as output:
+                output.read()
+
+    def test_stream_error(self):
+        """Errors while reading kill all stages"""
+        pipe = Pipeline(['yes'], ['cat'])
+        with self.assertRaises(RuntimeError):
+            with pipe.stream() as output:
+                output.read(10)
+                raise RuntimeError
+        self.assertEqual([stage.retcode for stage in pipe.stages], [-9, -9])
@@ -0,0 +1,143 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.pkg.origcache}"""
+
+import os
+import stat
+import tarfile
+from types import SimpleNamespace
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.deb.git import DebianGitRepository
+from gbp.deb.policy import DebianPkgPolicy
+from gbp.pkg import Compressor
+from gbp.pkg.origcache import OrigCache
+from gbp.scripts import export_orig
+
+
+class MockedSource:
+    name = 'foo'
+    upstream_version = '1.0'
+
+    def upstream_tarball_name(self, compression, component=None):
+        return DebianPkgPolicy.build_tarball_name(self.name, self.upstream_version,
+                                                  compression=compression,
+                                                  component=component)
+
+
+class TestOrigCache(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.cache = OrigCache(self.tmpdir.join('cache', 'origs'), max_size=3000)
+
+    def _tarball(self, name, size):
+        path = self.tmpdir.join(name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_fetch_store(self):
+        """Tarballs are reused and counted"""
+        key = OrigCache.key('a' * 40, 'foo-1.0/', 'tar', Compressor('gzip'))
+        output = self.tmpdir.join('out.tar.gz')
+        self.assertFalse(self.cache.fetch(key, output))
+        self.cache.store(key, self._tarball('orig.tar.gz', 1000))
+        self.assertTrue(self.cache.fetch(key, output))
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 1000)
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['size']), (1, 1000))
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 0))
+        self.assertIn('1 hits, 1 misses (50% hit rate)', self.cache.format_stats())
+
+    def test_no_shared_inode(self):
+        """Stored and fetched tarballs stay writable and separate"""
+        key = 'a' * 64
+        tarball = self._tarball('orig.tar.gz', 1000)
+        self.cache.store(key, tarball)
+        output = self.tmpdir.join('out.tar.gz')
+        self.assertTrue(self.cache.fetch(key, output))
+        for path in [tarball, output]:
+            self.assertTrue(os.stat(path).st_mode & stat.S_IWUSR)
+            self.assertNotEqual(os.stat(path).st_ino, os.stat(self.cache._entry(key)).st_ino)
+        with open(output, 'wb') as f:
+            f.write(b'changed')
+        self.assertTrue(self.cache.fetch(key, output))
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 1000)
+
+    def test_evict(self):
+        """Least recently used tarballs are dropped first"""
+        keys = ['%d' % num * 64 for num in range(4)]
+        for num, key in enumerate(keys[:3]):
+            self.cache.store(key, self._tarball('%d' % num, 1000))
+            os.utime(self.cache._entry(key), ns=(num, num))
+        # Use the oldest one so the second one goes
+        self.assertTrue(self.cache.fetch(keys[0], self.tmpdir.join('out')))
+        self.cache.store(keys[3], self._tarball('3', 1000))
+        cached = [self.cache.fetch(key, self.tmpdir.join('out')) for key in keys]
+        self.assertEqual(cached, [True, False, True, True])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        # Too large to ever fit
+        self.cache.store('f' * 64, self._tarball('huge', 4000))
+        self.assertFalse(self.cache.fetch('f' * 64, self.tmpdir.join('out')))
+
+    def test_missing_home(self):
+        """A missing cache parent isn't created"""
+        cache = OrigCache(self.tmpdir.join('nonexisting', 'cache', 'gbp', 'origs'))
+        cache.store('a' * 64, self._tarball('orig', 10))
+        self.assertFalse(os.path.exists(self.tmpdir.join('nonexisting')))
+
+    def test_export_orig(self):
+        """Unchanged trees reuse the cached tarball"""
+        self.add_file('foo', 'foo\n')
+        repo = DebianGitRepository(self.repo.path)
+        options = SimpleNamespace(orig_cache=True, orig_cache_size=1, with_submodules=False)
+        source = MockedSource()
+        output_dir = self.tmpdir.join('output')
+        os.mkdir(output_dir)
+        output = os.path.join(output_dir, 'foo_1.0.orig.tar.xz')
+        cache = OrigCache(self.tmpdir.join('cache', 'origs'))
+
+        export_orig.git_archive_build_orig(repo, source, output_dir, 'HEAD',
+                                           Compressor('xz'), options, cache)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(tarfile.open(output).getnames(), ['foo-1.0', 'foo-1.0/foo'])
+        with open(output, 'rb') as f:
+            data = f.read()
+
+        os.unlink(output)
+        export_orig.git_archive_build_orig(repo, source, output_dir, 'HEAD',
+                                           Compressor('xz'), options, cache)
+        self.assertEqual(cache.stats()['hits'], 1)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        # A different compression level needs a new tarball which must
+        # not overwrite the cached one
+        export_orig.git_archive_build_orig(repo, source, output_dir, 'HEAD',
+                                           Compressor('xz', 1), options, cache)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['entries'], 2)
+        for entry in cache._entries():
+            self.assertEqual(tarfile.open(entry[0]).getnames(), ['foo-1.0', 'foo-1.0/foo'])
+
+        self.add_file('bar', 'bar\n')
+        export_orig.git_archive_build_orig(repo, source, output_dir, 'HEAD',
+                                           Compressor('xz'), options, cache)
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_cache_stats(self):
+        """export-orig reports cache statistics"""
+        cache_backup = os.environ.get('GBP_CACHE_DIR')
+        os.environ['GBP_CACHE_DIR'] = self.tmpdir.join('cache')
+        try:
+            with testutils.capture_stdout() as output:
+                self.assertEqual(export_orig.main(['argv0', '--cache-stats']), 0)
+        finally:
+            if cache_backup is None:
+                del os.environ['GBP_CACHE_DIR']
+            else:
+                os.environ['GBP_CACHE_DIR'] = cache_backup
+        self.assertIn("0 tarballs, 0.0 of 1024.0 MiB used", output.output())
@@ -0,0 +1,103 @@
+# vim: set fileencoding=utf-8 :
+"""Test building orig tarballs in parallel"""
+
+import os
+import tarfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.deb.git import DebianGitRepository
+from gbp.command_wrappers import CommandExecFailed
+from gbp.errors import GbpError
+from gbp.scripts import export_orig
+
+from .test_37_orig_cache import MockedSource
+
+
+class TestParallelOrigs(testutils.DebianGitTestRepo):
+    def _build(self, jobs):
+        output_dir = self.tmpdir.join('output-%d' % jobs)
+        os.mkdir(output_dir)
+        options = SimpleNamespace(upstream_tree='HEAD',
+                                  comp_type='gzip',
+                                  comp_level=9,
+                                  comp_threads=1,
+                                  components=['comp1', 'comp2', 'comp3'],
+                                  with_submodules=False,
+                                  orig_cache=False,
+                                  jobs=jobs)
+        export_orig.git_archive_build_origs(DebianGitRepository(self.repo.path),
+                                            MockedSource(), output_dir, options)
+        # Trees are archived with the current time so only compare the
+        # members
+        tarballs = {}
+        for name in sorted(os.listdir(output_dir)):
+            with tarfile.open(os.path.join(output_dir, name)) as tar:
+                tarballs[name] = [(member.name, member.mode,
+                                   tar.extractfile(member).read() if member.isfile() else None)
+                                  for member in tar.getmembers()]
+        return tarballs
+
+    def test_components(self):
+        """Tarballs built in parallel match the serially built ones"""
+        self.add_file('foo', 'foo\n')
+        for comp in ['comp1', 'comp2', 'comp3']:
+            self.add_file('%s/file' % comp, '%s\n' % comp)
+        serial = self._build(1)
+        self.assertEqual(sorted(serial), ['foo_1.0.orig-comp1.tar.gz',
+                                          'foo_1.0.orig-comp2.tar.gz',
+                                          'foo_1.0.orig-comp3.tar.gz',
+                                          'foo_1.0.orig.tar.gz'])
+        self.assertEqual(self._build(4), serial)
+        self.assertEqual(self._build(0), serial)
+
+    def test_first_error_wins(self):
+        """The first item's error is reported no matter which job fails first"""
+        first_done = threading.Event()
+
+        def build(item):
+            if item == 'slow':
+                # Let the later job fail first
+                first_done.wait(5)
+                time.sleep(0.1)
+                raise GbpError("slow failed")
+            first_done.set()
+            raise GbpError("%s failed" % item)
+
+        with self.assertRaisesRegex(GbpError, "slow failed"):
+            export_orig.run_jobs(build, ['slow', 'fast'], SimpleNamespace(jobs=2))
+
+    def test_all_jobs_finish(self):
+        """A failing job doesn't abandon the running ones"""
+        done = []
+
+        def build(item):
+            if item == 0:
+                raise GbpError("failed")
+            time.sleep(0.1)
+            done.append(item)
+
+        with self.assertRaises(GbpError):
+            export_orig.run_jobs(build, list(range(4)), SimpleNamespace(jobs=4))
+        self.assertEqual(sorted(done), [1, 2, 3])
+
+    def test_parallel_verify(self):
+        """A failing verify reports its own tarball"""
+        fake = self.tmpdir.join('pristine-tar')
+        with open(fake, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'case "$2" in *bad*) sleep 0.5; echo "checksum mismatch" >&2; exit 1;; esac\n')
+        os.chmod(fake, 0o755)
+        repo = DebianGitRepository(self.repo.path)
+        repo.pristine_tar.cmd = fake
+        options = SimpleNamespace(pristine_tar=True, components=[], jobs=2)
+        with mock.patch.object(repo.pristine_tar, 'has_feature_verify', return_value=True):
+            with self.assertRaisesRegex(CommandExecFailed,
+                                        'couldn\'t verify "bad.tar.gz": checksum mismatch'):
+                export_orig.pristine_tar_verify_origs(repo, MockedSource(), options, str(self.tmpdir),
+                                                      ['bad.tar.gz', 'good.tar.gz'])
@@ -0,0 +1,97 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.pkg.pristinetar.PristineTarIndex}"""
+
+import json
+import os
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.deb.git import DebianGitRepository
+from gbp.git import GitRepository
+from gbp.pkg.pristinetar import PristineTarIndex
+from gbp.scripts import export_orig
+
+
+class TestPristineTarIndex(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp(DebianGitRepository)
+        self.add_file('foo', 'foo\n')
+        self.datadir = self.tmpdir.join('pristine-tar-data')
+        os.mkdir(self.datadir)
+
+    def _store(self, tarball, signature=False):
+        """Add a commit like pristine-tar does"""
+        for ext in ['delta', 'id'] + (['asc'] if signature else []):
+            with open(os.path.join(self.datadir, '%s.%s' % (tarball, ext)), 'w') as f:
+                f.write('%s %s\n' % (tarball, ext))
+        return self.repo.commit_dir(self.datadir, 'pristine-tar data for %s' % tarball,
+                                    'pristine-tar', create_missing_branch=True)
+
+    def test_get_commit(self):
+        """Tarballs are found on the pristine-tar branch"""
+        self.assertEqual(self.repo.pristine_tar.get_commit('upstream_1.0.orig.tar.gz'),
+                         (None, False))
+        first = self._store('upstream_1.0.orig.tar.gz', signature=True)
+        bz2 = self._store('upstream_1.0.orig-comp.tar.bz2')
+        self.assertEqual(self.repo.pristine_tar.get_commit('upstream_1.0.orig.tar.gz'),
+                         (first, True))
+        self.assertTrue(self.repo.pristine_tar.has_commit('upstream', '1.0', 'gzip'))
+        self.assertTrue(self.repo.pristine_tar.has_commit('upstream', '1.0'))
+        self.assertFalse(self.repo.pristine_tar.has_commit('upstream', '1.0', 'bzip2'))
+        self.assertFalse(self.repo.pristine_tar.has_commit('upstream', '1.1'))
+        self.assertEqual(self.repo.pristine_tar.get_commit(r'upstream_1\.0\.orig-comp\.tar.*'),
+                         (bz2, False))
+
+        # Storing a tarball again without signature
+        second = self._store('upstream_1.0.orig.tar.gz')
+        self.assertEqual(self.repo.pristine_tar.get_commit('upstream_1.0.orig.tar.gz'),
+                         (second, False))
+
+    def test_plus_in_name(self):
+        """'+' is literal like with git-grep"""
+        commit = self._store('g++_1.0+dfsg.orig.tar.xz')
+        source = type('Source', (), {'sourcepkg': 'g++', 'upstream_version': '1.0+dfsg'})
+        self.assertEqual(self.repo.get_pristine_tar_commit(source), (commit, False))
+        self.assertTrue(self.repo.pristine_tar.has_commit('g++', '1.0+dfsg', 'xz'))
+
+    def test_incremental(self):
+        """Only new commits are looked at"""
+        self._store('upstream_1.0.orig.tar.gz')
+        index = PristineTarIndex(self.repo, 'pristine-tar')
+        index.update()
+        with open(index.path) as f:
+            self.assertEqual(json.load(f)['pristine-tar']['head'], self.repo.rev_parse('pristine-tar'))
+
+        spawned = GitRepository.spawned_processes
+        index = PristineTarIndex(self.repo, 'pristine-tar')
+        self.assertEqual(index.find('upstream_1.0')[0], 'upstream_1.0.orig.tar.gz')
+        # Only the branch head got resolved
+        self.assertLessEqual(GitRepository.spawned_processes - spawned, 1)
+
+        commit = self._store('upstream_2.0.orig.tar.xz', signature=True)
+        index.update()
+        self.assertEqual(index.count, 2)
+        self.assertEqual(index.latest(), ('upstream_2.0.orig.tar.xz', commit, True))
+        self.assertEqual(index.find('upstream_1.0')[0], 'upstream_1.0.orig.tar.gz')
+
+    def test_rewritten_branch(self):
+        """A rewritten branch rebuilds the index"""
+        self._store('upstream_1.0.orig.tar.gz')
+        index = PristineTarIndex(self.repo, 'pristine-tar')
+        index.update()
+        self.repo.delete_branch('pristine-tar')
+        os.unlink(os.path.join(self.datadir, 'upstream_1.0.orig.tar.gz.delta'))
+        os.unlink(os.path.join(self.datadir, 'upstream_1.0.orig.tar.gz.id'))
+        self._store('upstream_2.0.orig.tar.gz')
+        self.assertIsNone(index.find('upstream_1.0'))
+        self.assertEqual(index.count, 1)
+
+    def test_guess_comp_type(self):
+        """The compression type is taken from the pristine-tar branch"""
+        source = type('Source', (), {'name': 'upstream', 'upstream_version': '1.0'})
+        self._store('upstream_1.0.orig.tar.bz2')
+        self._store('upstream_2.0.orig.tar.xz')
+        self.assertEqual(export_orig.guess_comp_type('auto', source, self.repo, None), 'bzip2')
+        source.upstream_version = '3.0'
+        self.assertEqual(export_orig.guess_comp_type('auto', source, self.repo, None), 'xz')
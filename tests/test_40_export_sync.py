@@ -0,0 +1,141 @@
+# vim: set fileencoding=utf-8 :
+"""Test incremental updates of export directories"""
+
+import os
+import stat
+import time
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.scripts.common import buildpackage
+
+
+def snapshot(path):
+    """Content, symlink targets and executable bits of a directory"""
+    result = {}
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, path)
+            if os.path.islink(full):
+                result[rel] = ('link', os.readlink(full))
+            elif os.path.isdir(full):
+                result[rel] = ('dir',)
+            else:
+                with open(full, 'rb') as f:
+                    result[rel] = ('file', f.read(), bool(os.stat(full).st_mode & stat.S_IXUSR))
+    return result
+
+
+class TestExportSync(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.export_dir = self.tmpdir.join('export', 'pkg-1.0')
+        os.makedirs(os.path.dirname(self.export_dir))
+        self.add_file('unchanged', 'unchanged\n')
+        self.add_file('changed', 'old\n')
+        self.add_file('dir/removed', 'removed\n')
+        self.add_file('mode', 'mode\n')
+        self.add_file('other/file', 'file\n')
+
+    def _export(self, treeish='HEAD'):
+        self.assertTrue(buildpackage.dump_tree(self.repo, self.export_dir, treeish, False))
+        # Make sure the exported files predate the stamp
+        time.sleep(buildpackage.ctime_slack_ns / 1e9)
+        buildpackage.record_export(self.repo, self.export_dir, treeish, False,
+                                   buildpackage.export_stamp())
+
+    def _full_export(self, treeish='HEAD'):
+        full = self.tmpdir.join('full', 'pkg-1.0')
+        os.makedirs(os.path.dirname(full))
+        self.assertTrue(buildpackage.dump_tree(self.repo, full, treeish, False))
+        return snapshot(full)
+
+    def test_sync(self):
+        """Only changed files get written"""
+        self._export()
+        unchanged_ino = os.stat(os.path.join(self.export_dir, 'unchanged')).st_ino
+        mode_ino = os.stat(os.path.join(self.export_dir, 'mode')).st_ino
+
+        self.add_file('changed', 'new\n')
+        self.repo.remove_files(['dir/removed'])
+        os.chmod(os.path.join(self.repo.path, 'mode'), 0o755)
+        self.repo.add_files(['mode'])
+        os.symlink('unchanged', os.path.join(self.repo.path, 'link'))
+        self.repo.add_files(['link'])
+        # A file replaced by a directory
+        self.repo.remove_files(['other/file'])
+        self.add_file('other/file/nested', 'nested\n')
+        self.repo.commit_all('changes')
+
+        self.assertTrue(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', False))
+        self.assertEqual(snapshot(self.export_dir), self._full_export())
+        self.assertEqual(os.stat(os.path.join(self.export_dir, 'unchanged')).st_ino, unchanged_ino)
+        self.assertEqual(os.stat(os.path.join(self.export_dir, 'mode')).st_ino, mode_ino)
+        self.assertFalse(os.path.exists(os.path.join(self.export_dir, 'dir')))
+
+    def test_changed_right_after_export(self):
+        """Files changed within a clock tick of the export are noticed"""
+        self.assertTrue(buildpackage.dump_tree(self.repo, self.export_dir, 'HEAD', False))
+        buildpackage.record_export(self.repo, self.export_dir, 'HEAD', False,
+                                   buildpackage.export_stamp())
+        with open(os.path.join(self.export_dir, 'unchanged'), 'w') as f:
+            f.write('modified by a hook\n')
+        self.assertTrue(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', False))
+        self.assertEqual(snapshot(self.export_dir), self._full_export())
+
+    def test_local_changes(self):
+        """Files changed in the export dir are reverted, new ones removed"""
+        self._export()
+        with open(os.path.join(self.export_dir, 'unchanged'), 'w') as f:
+            f.write('modified by the build\n')
+        os.makedirs(os.path.join(self.export_dir, 'debian', 'tmp'))
+        with open(os.path.join(self.export_dir, 'debian', 'tmp', 'build-product'), 'w') as f:
+            f.write('build product\n')
+
+        self.assertTrue(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', False))
+        self.assertEqual(snapshot(self.export_dir), self._full_export())
+
+    def test_no_previous_export(self):
+        """Directories without recorded export need a full export"""
+        self.assertFalse(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', False))
+        self._export()
+        buildpackage.forget_export(self.repo, self.export_dir)
+        self.assertFalse(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', False))
+        self._export()
+        self.assertFalse(buildpackage.sync_tree(self.repo, self.export_dir, 'HEAD', True))
+
+
+class TestDumpTreeNonRecursive(testutils.DebianGitTestRepo):
+    def test_top_level_files(self):
+        """Only top level files are exported"""
+        self.add_file('dir/file', 'file\n')
+        blob = [entry for entry in self.repo.list_tree('HEAD', recurse=True)][0][2]
+        subtree = [entry for entry in self.repo.list_tree('HEAD')][0]
+        names = ['.hidden', '[glob]*', 'file'] + ['%03d' % i for i in range(100)]
+        tree = self.repo.make_tree([subtree] + [('100644', 'blob', blob, name)
+                                                for name in names])
+        export_dir = self.tmpdir.join('export')
+        self.assertTrue(buildpackage.dump_tree(self.repo, export_dir, tree, False, False))
+        self.assertEqual(sorted(os.listdir(export_dir)), sorted(names))
+
+    def test_commit(self):
+        """Commits keep their time and substitutions"""
+        self.add_file('.gitattributes', 'version export-subst\n')
+        self.add_file('version', '$Format:%H$\n')
+        self.add_file('dir/file', 'file\n')
+        mtime = int(self.repo.get_commit_info('HEAD')['committer'].date.split()[0])
+        export_dir = self.tmpdir.join('export')
+        self.assertTrue(buildpackage.dump_tree(self.repo, export_dir, 'HEAD', False, False))
+        self.assertEqual(sorted(os.listdir(export_dir)), ['.gitattributes', 'version'])
+        with open(os.path.join(export_dir, 'version')) as f:
+            self.assertEqual(f.read(), '%s\n' % self.repo.head)
+        self.assertEqual(os.stat(os.path.join(export_dir, 'version')).st_mtime, mtime)
+
+    def test_no_files(self):
+        """Trees without top level files give an empty export"""
+        self.add_file('dir/file', 'file\n')
+        export_dir = self.tmpdir.join('export')
+        self.assertTrue(buildpackage.dump_tree(self.repo, export_dir, 'HEAD', False, False))
+        self.assertEqual(os.listdir(export_dir), [])
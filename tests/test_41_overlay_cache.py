@@ -0,0 +1,133 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.pkg.origcache.UnpackedOrigCache}"""
+
+import os
+import stat
+import tarfile
+from types import SimpleNamespace
+
+from . import context  # noqa: F401
+from . import testutils
+
+from gbp.pkg.origcache import UnpackedOrigCache
+from gbp.scripts import buildpackage
+
+
+class TestUnpackedOrigCache(testutils.DebianGitTestRepo):
+    def setUp(self):
+        super().setUp()
+        self.cache = UnpackedOrigCache(self.tmpdir.join('cache', 'unpacked'), max_size=1 << 20)
+        self.srcdir = self.tmpdir.join('src')
+        for path, content in [('foo-1.0/configure', '#!/bin/sh\n'),
+                              ('foo-1.0/src/main.c', 'int main;\n'),
+                              ('foo-1.0/debian/rules', 'upstream debian dir\n')]:
+            path = os.path.join(self.srcdir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        os.chmod(os.path.join(self.srcdir, 'foo-1.0', 'configure'), 0o755)
+        os.symlink('src/main.c', os.path.join(self.srcdir, 'foo-1.0', 'link'))
+        self.tarball = self.tmpdir.join('foo_1.0.orig.tar.gz')
+        with tarfile.open(self.tarball, 'w:gz') as tar:
+            tar.add(os.path.join(self.srcdir, 'foo-1.0'), 'foo-1.0')
+
+    def _unpack(self, name, component=None):
+        dest = self.tmpdir.join(name)
+        self.assertTrue(buildpackage.unpack_cached(self.cache, self.tarball, dest, component))
+        return dest
+
+    def _check(self, dest):
+        with open(os.path.join(dest, 'src', 'main.c')) as f:
+            self.assertEqual(f.read(), 'int main;\n')
+        self.assertTrue(os.access(os.path.join(dest, 'configure'), os.X_OK))
+        self.assertEqual(os.readlink(os.path.join(dest, 'link')), 'src/main.c')
+        self.assertEqual(sorted(os.listdir(dest)), ['configure', 'debian', 'link', 'src'])
+
+    def test_unpack(self):
+        """Trees are unpacked once and then reused"""
+        dest = self._unpack('export1')
+        self._check(dest)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+        dest = self._unpack('export2')
+        self._check(dest)
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['hits']), (1, 2))
+        self.assertIn('1 trees', self.cache.format_stats())
+
+        # Removing files from the export leaves the cache alone
+        os.unlink(os.path.join(dest, 'configure'))
+        self._check(self._unpack('export3'))
+
+        # Components are cached separately
+        self._unpack('component', component='comp')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_not_shared(self):
+        """Exported files are separate from the cache and keep their modes"""
+        self._unpack('export1')
+        dest = self._unpack('export2')
+        main = os.path.join(dest, 'src', 'main.c')
+        self.assertEqual(os.stat(main).st_nlink, 1)
+        self.assertEqual(stat.S_IMODE(os.stat(main).st_mode),
+                         stat.S_IMODE(os.stat(os.path.join(self.srcdir, 'foo-1.0', 'src', 'main.c')).st_mode))
+        with open(main, 'a') as f:
+            f.write('modified\n')
+        self._check(self._unpack('export3'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_modified(self):
+        """Modified entries are dropped"""
+        self._unpack('export1')
+        entry = self.cache._entries()[0][0]
+        main = os.path.join(entry, 'tree', 'src', 'main.c')
+        os.chmod(main, 0o644)
+        with open(main, 'a') as f:
+            f.write('modified\n')
+        os.utime(main, ns=(1, 1))
+        self._check(self._unpack('export2'))
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_evict(self):
+        """Least recently used trees are dropped"""
+        self.cache.max_size = 40
+        self._unpack('export1')
+        self._unpack('component', component='comp')
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        # Trees larger than the cache can't be used
+        self.cache.max_size = 10
+        self.assertFalse(buildpackage.unpack_cached(self.cache, self.tarball,
+                                                    self.tmpdir.join('export2')))
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_overlay(self):
+        """Overlay mode populates the export dir from the cache"""
+        os.makedirs(os.path.join(self.repo.path, 'debian', 'source'))
+        with open(os.path.join(self.repo.path, 'debian', 'source', 'format'), 'w') as f:
+            f.write('3.0 (quilt)\n')
+        source = SimpleNamespace(upstream_tarball_name=lambda comp, component=None:
+                                 'foo_1.0.orig%s.tar.gz' % ('-%s' % component if component else ''))
+        options = SimpleNamespace(comp_type='gzip', components=['comp'],
+                                  overlay_cache=True, overlay_cache_size=1)
+        os.link(self.tarball, self.tmpdir.join('foo_1.0.orig-comp.tar.gz'))
+        cache_backup = os.environ.get('GBP_CACHE_DIR')
+        os.environ['GBP_CACHE_DIR'] = self.tmpdir.join('cache')
+        cwd = os.getcwd()
+        os.chdir(self.repo.path)
+        try:
+            for num in range(2):
+                dest = self.tmpdir.join('export', 'foo-%d' % num)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                buildpackage.overlay_extract_origs(source, str(self.tmpdir), dest, options)
+                self.assertFalse(os.path.exists(os.path.join(dest, 'debian')))
+                self.assertEqual(sorted(os.listdir(dest)), ['comp', 'configure', 'link', 'src'])
+                self._check(os.path.join(dest, 'comp'))
+            stats = buildpackage.overlay_cache(options).stats()
+            self.assertEqual((stats['entries'], stats['hits']), (2, 4))
+        finally:
+            os.chdir(cwd)
+            if cache_backup is None:
+                del os.environ['GBP_CACHE_DIR']
+            else:
+                os.environ['GBP_CACHE_DIR'] = cache_backup
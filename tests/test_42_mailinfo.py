@@ -0,0 +1,116 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.mailinfo} against I{git mailinfo}"""
+
+import glob
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import context  # noqa: F401
+
+from gbp.git.repository import GitRepository
+from gbp.mailinfo import mailinfo
+from gbp.patch_series import Patch
+
+data_dir = os.path.splitext(__file__)[0] + '_data'
+patch_data_dir = os.path.join(os.path.dirname(__file__), 'test_08_patch_data')
+
+# Headers exercising git mailinfo's corner cases
+CORNER_CASES = [
+    b'Subject: folded\n subject\n\tline\nFrom: A B <a@b>\nnot a header line\nmore\n',
+    b'Subject: [PATCH] x\n\nFrom: C <c@d>\nSubject: in body\n\nbody\n--- a/x\n',
+    b'Subject: x\n\nFrom: C <c@d>\n Continued\nDate: today\n\nbody\ndiff --git a/x b/x\n',
+    b'Subject: s\n\n[PATCH] in body subject\n\nbody\n--- a\n',
+    b'Subject: s\n\n>From e6807f3efca28b30decfecb1732a56c7db1137ee Mon Sep 17 00:00:00 2001\nbody\n',
+    b'From: John (zzz) Doe <j@d> (Comment)\n',
+    b'From: "quoted \\"name\\"" <q@x>\n',
+    b'From: John Doe <johndoe>\n',
+    b'From: John Doe\n',
+    b'From: a@b\n',
+    b'From: Averyveryveryveryveryveryveryveryveryveryveryveryveryverylongname X <a@b>\n',
+    b'Subject: =?utf-8?b?w7xiZXI=?=  tail\n',
+    b'Subject: =?utf-8?q?line=0Abreak?=\n',
+    b'Subject: =?koi8-r?b?8NLJ18XU?=\n',
+    b'Content-Type: text/plain; charset=ISO-8859-1\nSubject: s\n\nk\xf6rper\n',
+    b'Content-Transfer-Encoding: base64\nSubject: s\n\nRnJvbTogYUBiCgpib2R5Cg==\n',
+    b'\n\n  Subject: leading ws\n\nbody\n',
+    b'just text without newline',
+    b'Subject: s\nX-Last: header at the end',
+    b'Subject: s\r\nFrom: A <a@b>\r\n\r\nbody\r\n',
+    b'Subject: s\nDate:   Mon,  1 Jan\t2001  \n\nb\nIndex: foo\n',
+    b'Subject: s\n\nbody\n----\nmore\n---  \nafter\n',
+    b'Subject: t\xc3\xa4st raw utf8\nFrom: M\xc3\xbcller <m@x>\n\nb\xc3\xb6dy\n',
+]
+
+
+def git_mailinfo(data):
+    with tempfile.NamedTemporaryFile() as msg:
+        out, err, ret = GitRepository.git_inout(command='mailinfo',
+                                                args=['-k', msg.name, '/dev/null'],
+                                                input=data,
+                                                extra_env=None,
+                                                cwd=None,
+                                                capture_stderr=True)
+        return (out, msg.read()) if ret == 0 else None
+
+
+def patch_header(path):
+    """The part of a patch gbp hands to git mailinfo"""
+    header = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line == b'---\n':
+                break
+            header.append(line)
+    return b''.join(header)
+
+
+class TestMailinfo(unittest.TestCase):
+    def _corpus(self):
+        for path in sorted(glob.glob(os.path.join(data_dir, '*')) +
+                           glob.glob(os.path.join(patch_data_dir, '*'))):
+            header = patch_header(path)
+            # Empty headers never get parsed
+            if header.strip():
+                yield path, header
+        for num, data in enumerate(CORNER_CASES):
+            yield 'corner case %d' % num, data
+
+    def test_corpus(self):
+        """Results match git mailinfo's"""
+        for name, data in self._corpus():
+            with self.subTest(name=name):
+                self.assertEqual(mailinfo(data), git_mailinfo(data))
+
+    def test_unsupported(self):
+        """Input we can't handle is left to git"""
+        self.assertIsNone(mailinfo(b'Content-Type: multipart/mixed; boundary="x"\n\n--x\n\nbody\n--x--\n'))
+        self.assertIsNone(mailinfo(b'Subject: =?utf-8?x?malformed?=\n'))
+        self.assertIsNone(mailinfo(b'Subject: =?no-such-charset?q?x?=\n'))
+        self.assertIsNone(mailinfo(b'Subject: nul\0byte\n'))
+
+
+class TestPatchMailinfo(unittest.TestCase):
+    def test_no_git(self):
+        """Patch headers are parsed without running git"""
+        for path in sorted(glob.glob(os.path.join(data_dir, '*'))):
+            with self.subTest(path=path):
+                with mock.patch.object(GitRepository, 'git_inout') as git_inout:
+                    p = Patch(path)
+                    info = (p.subject, p.author, p.email, p.date, p.long_desc)
+                self.assertFalse(git_inout.called)
+
+                with mock.patch.object(Patch, 'git_mailinfo', True):
+                    p = Patch(path)
+                    self.assertEqual((p.subject, p.author, p.email, p.date, p.long_desc), info)
+
+    def test_fallback(self):
+        """Git handles what we can't"""
+        with tempfile.NamedTemporaryFile(suffix='.patch') as patch:
+            patch.write(b'From: A <a@b>\nSubject: s\nContent-Type: multipart/mixed; boundary="x"\n\n'
+                        b'--x\nContent-Type: text/plain\n\nbody\n--x--\n')
+            patch.flush()
+            p = Patch(patch.name)
+            self.assertEqual(p.author, 'A')
+            self.assertEqual(p.long_desc, 'body\n\n')